@@ -0,0 +1,10 @@
+-- migrate:up transaction:false
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS messages_chat_id_created_at_idx ON messages (chat_id, created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS messages_user_id_created_at_idx ON messages (user_id, created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS chats_user_id_created_at_idx ON chats (user_id, created_at, id);
+
+-- migrate:down transaction:false
+DROP INDEX CONCURRENTLY IF EXISTS messages_chat_id_created_at_idx;
+DROP INDEX CONCURRENTLY IF EXISTS messages_user_id_created_at_idx;
+DROP INDEX CONCURRENTLY IF EXISTS chats_user_id_created_at_idx;
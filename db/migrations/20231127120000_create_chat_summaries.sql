@@ -0,0 +1,12 @@
+-- migrate:up
+
+CREATE TABLE chat_summaries (
+    chat_id uuid PRIMARY KEY,
+    summary TEXT NOT NULL,
+    summarized_until TIMESTAMPTZ NOT NULL,
+    summarized_until_id uuid NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT NOW() NOT NULL
+);
+
+-- migrate:down
+DROP TABLE IF EXISTS chat_summaries;
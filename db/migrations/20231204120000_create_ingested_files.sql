@@ -0,0 +1,19 @@
+-- migrate:up
+
+CREATE TABLE ingested_files (
+    id uuid PRIMARY KEY,
+    user_id VARCHAR(255) NOT NULL,
+    file_name VARCHAR(255) NOT NULL,
+    file_size BIGINT NOT NULL,
+    file_extension VARCHAR(255) NOT NULL,
+    file_type VARCHAR(255) NOT NULL,
+    file_hash VARCHAR(64) NOT NULL,
+    chunks INTEGER NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW() NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT NOW() NOT NULL
+);
+
+CREATE INDEX ingested_files_user_id_created_at_idx ON ingested_files (user_id, created_at, id);
+
+-- migrate:down
+DROP TABLE IF EXISTS ingested_files;
@@ -0,0 +1,17 @@
+-- migrate:up
+
+CREATE TABLE ingest_jobs (
+    id uuid PRIMARY KEY,
+    user_id VARCHAR(255) NOT NULL,
+    status VARCHAR(32) NOT NULL,
+    files JSONB NOT NULL,
+    uploads JSONB NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW() NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT NOW() NOT NULL,
+    finished_at TIMESTAMPTZ
+);
+
+CREATE INDEX ingest_jobs_status_updated_at_idx ON ingest_jobs (updated_at) WHERE status IN ('queued', 'running');
+
+-- migrate:down
+DROP TABLE IF EXISTS ingest_jobs;
@@ -0,0 +1,6 @@
+-- migrate:up
+
+CREATE INDEX ingested_files_user_id_updated_at_idx ON ingested_files (user_id, updated_at);
+
+-- migrate:down
+DROP INDEX IF EXISTS ingested_files_user_id_updated_at_idx;
@@ -0,0 +1,34 @@
+-- :name upsert_ingested_file :affected
+INSERT INTO ingested_files (id, user_id, file_name, file_size, file_extension, file_type, file_hash, chunks)
+VALUES (:id, :user_id, :file_name, :file_size, :file_extension, :file_type, :file_hash, :chunks)
+ON CONFLICT (id) DO UPDATE SET
+    file_name = EXCLUDED.file_name,
+    file_size = EXCLUDED.file_size,
+    file_extension = EXCLUDED.file_extension,
+    file_type = EXCLUDED.file_type,
+    chunks = EXCLUDED.chunks,
+    updated_at = NOW();
+
+-- :name select_ingested_file :one
+SELECT
+    id,
+    user_id,
+    file_name,
+    file_size,
+    file_extension,
+    file_type,
+    file_hash,
+    chunks,
+    created_at,
+    updated_at
+FROM
+    ingested_files
+WHERE
+    id = :id;
+
+-- :name select_corpus_version :scalar
+SELECT (EXTRACT(EPOCH FROM MAX(updated_at)) * 1000000)::bigint
+FROM
+    ingested_files
+WHERE
+    user_id = :user_id;
@@ -0,0 +1,40 @@
+-- :name upsert_ingest_job :affected
+INSERT INTO ingest_jobs (id, user_id, status, files, uploads, created_at, finished_at)
+VALUES (:id, :user_id, :status, :files::jsonb, :uploads::jsonb, :created_at, :finished_at)
+ON CONFLICT (id) DO UPDATE SET
+    status = EXCLUDED.status,
+    files = EXCLUDED.files,
+    finished_at = EXCLUDED.finished_at,
+    updated_at = NOW();
+
+-- :name select_ingest_job :one
+SELECT
+    id,
+    user_id,
+    status,
+    files,
+    created_at,
+    finished_at
+FROM
+    ingest_jobs
+WHERE
+    id = :id;
+
+-- :name claim_stale_ingest_jobs :many
+UPDATE ingest_jobs SET updated_at = NOW()
+WHERE id IN (
+    SELECT id
+    FROM ingest_jobs
+    WHERE status IN ('queued', 'running') AND updated_at < NOW() - make_interval(secs => :stale_sec)
+    ORDER BY updated_at
+    LIMIT :limit
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING
+    id,
+    user_id,
+    status,
+    files,
+    uploads,
+    created_at,
+    finished_at;
@@ -1,6 +1,13 @@
 -- :name insert_message :insert
-INSERT INTO messages (id, chat_id, model, user_id, agent_role, user_message, answer)
-VALUES (:id, :chat_id, :model, :user_id, :agent_role, :user_message, :answer);
+INSERT INTO messages (id, chat_id, model, user_id, agent_role, user_message, answer, created_at)
+VALUES (:id, :chat_id, :model, :user_id, :agent_role, :user_message, :answer, :created_at);
+
+-- :name insert_messages :affected
+INSERT INTO messages (id, chat_id, model, user_id, agent_role, user_message, answer, created_at)
+SELECT id::uuid, chat_id::uuid, model, user_id, agent_role, user_message, answer, created_at
+FROM unnest(:ids::text[], :chat_ids::text[], :models::text[], :user_ids::text[], :agent_roles::text[],
+            :user_messages::text[], :answers::text[], :created_ats::timestamptz[])
+    AS batch (id, chat_id, model, user_id, agent_role, user_message, answer, created_at);
 
 -- :name insert_chat :insert
 
@@ -0,0 +1,47 @@
+-- :name select_chat_summary :one
+SELECT
+    chat_id,
+    summary,
+    summarized_until,
+    summarized_until_id
+FROM
+    chat_summaries
+WHERE
+    chat_id = :chat_id;
+
+-- :name upsert_chat_summary :affected
+INSERT INTO chat_summaries (chat_id, summary, summarized_until, summarized_until_id, updated_at)
+VALUES (:chat_id, :summary, :summarized_until, :summarized_until_id, NOW())
+ON CONFLICT (chat_id) DO UPDATE SET
+    summary = EXCLUDED.summary,
+    summarized_until = EXCLUDED.summarized_until,
+    summarized_until_id = EXCLUDED.summarized_until_id,
+    updated_at = NOW()
+WHERE
+    (chat_summaries.summarized_until, chat_summaries.summarized_until_id)
+    < (EXCLUDED.summarized_until, EXCLUDED.summarized_until_id);
+
+-- :name select_chat_turns_after :many
+SELECT
+    m.id,
+    m.user_message,
+    m.answer,
+    m.created_at
+FROM messages m
+WHERE m.chat_id = :chat_id
+  AND (m.created_at, m.id) > (:after_created_at::timestamptz, :after_id::uuid)
+ORDER BY m.created_at DESC, m.id DESC
+LIMIT :limit;
+
+-- :name select_chat_turns_between :many
+SELECT
+    m.id,
+    m.user_message,
+    m.answer,
+    m.created_at
+FROM messages m
+WHERE m.chat_id = :chat_id
+  AND (m.created_at, m.id) > (:after_created_at::timestamptz, :after_id::uuid)
+  AND (m.created_at, m.id) <= (:until_created_at::timestamptz, :until_id::uuid)
+ORDER BY m.created_at, m.id
+LIMIT :limit;
@@ -1,4 +1,4 @@
--- :name select_all :many
+-- :name select_messages_by_user :many
 SELECT 
     * 
 FROM 
@@ -6,8 +6,22 @@ FROM
 WHERE 
     user_id = :user_id 
 ORDER BY 
-    created_at 
-DESC;
+    created_at DESC,
+    id DESC
+LIMIT :limit;
+
+-- :name select_messages_by_user_before :many
+SELECT
+    *
+FROM
+    messages
+WHERE
+    user_id = :user_id
+    AND (created_at, id) < (:before_created_at::timestamptz, :before_id::uuid)
+ORDER BY
+    created_at DESC,
+    id DESC
+LIMIT :limit;
 
 -- :name select_chats_by_user :many
 SELECT 
@@ -23,11 +37,45 @@ FROM
 WHERE 
     user_id = :user_id 
 ORDER BY 
-    c.created_at 
-DESC;
+    c.created_at DESC,
+    c.id DESC
+LIMIT :limit;
+
+-- :name select_chats_by_user_before :many
+SELECT
+    c.id,
+    c.user_id,
+    c.title,
+    c.model,
+    c.agent_role,
+    c.updated_at,
+    c.created_at
+FROM
+    chats c
+WHERE
+    user_id = :user_id
+    AND (c.created_at, c.id) < (:before_created_at::timestamptz, :before_id::uuid)
+ORDER BY
+    c.created_at DESC,
+    c.id DESC
+LIMIT :limit;
 
 -- :name select_messages_by_chat :many
-SELECT e4r
+SELECT
+  m.id,
+  m.user_id,
+  m.model,
+  m.agent_role,
+  m.user_message,
+  m.answer,
+  m.created_at
+FROM messages m
+WHERE m.chat_id = :chat_id
+ORDER BY m.created_at DESC, m.id DESC
+LIMIT :limit;
+
+-- :name select_messages_by_chat_before :many
+SELECT
   m.id,
   m.user_id,
   m.model,
@@ -36,6 +84,21 @@ SELECT e4r
   m.answer,
   m.created_at
 FROM messages m
-INNER JOIN chats c ON m.chat_id = c.id
-WHERE c.id = :chat_id
-ORDER BY m.created_at;
\ No newline at end of file
+WHERE m.chat_id = :chat_id
+  AND (m.created_at, m.id) < (:before_created_at::timestamptz, :before_id::uuid)
+ORDER BY m.created_at DESC, m.id DESC
+LIMIT :limit;
+
+-- :name select_chat_by_id :one
+SELECT
+    c.id,
+    c.user_id,
+    c.title,
+    c.model,
+    c.agent_role,
+    c.updated_at,
+    c.created_at
+FROM
+    chats c
+WHERE
+    c.id = :chat_id;
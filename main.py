@@ -5,18 +5,24 @@ from src.app.core.logs import logger
 
 from src.app.chat.api import router as chat_router
 from src.app.core.api import router as core_router
+from src.app.core.lifespan import lifespan
+from src.app.core.metrics import MetricsMiddleware
+from src.app.core.pagination import NEXT_CURSOR_HEADER
 
 from src.app import version
 
-app = FastAPI(version=version)
+app = FastAPI(version=version, lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(core_router)
 app.include_router(chat_router)
 
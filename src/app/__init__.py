@@ -1,7 +1,17 @@
-import tomllib 
+import tomllib
+from importlib import metadata
+from pathlib import Path
 
-with open('pyproject.toml', 'rb') as file:
-    data = tomllib.load(file)
-    version = data['project']['version']
-    
-    
\ No newline at end of file
+PYPROJECT_PATH = Path(__file__).resolve().parents[2] / "pyproject.toml"
+
+
+def read_version() -> str:
+    # Resolved from this file rather than the working directory, the installed distribution is the fallback.
+    try:
+        with open(PYPROJECT_PATH, "rb") as file:
+            return tomllib.load(file)["project"]["version"]
+    except FileNotFoundError:
+        return metadata.version("brag")
+
+
+version = read_version()
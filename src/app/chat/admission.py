@@ -0,0 +1,174 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+
+from starlette import status
+
+from src.app.chat.constants import FailureReasonsEnum
+from src.app.chat.exceptions import OpenAIFailedProcessingException
+from src.app.core.logs import logger
+from src.app.core.metrics import LLM_ADMISSION_QUEUED, LLM_ADMISSION_REJECTED, LLM_ADMISSION_RUNNING
+from src.app.core.timing import stage_timer
+from src.app.settings import settings
+
+# Number of recent admissions the wait time percentiles are computed over.
+WAIT_TIME_WINDOW: int = 1024
+
+
+class AdmissionController:
+    """
+    Bounds the OpenAI calls in flight in this worker.
+
+    A call needs a slot of its user, at most `max_concurrent_per_user`, and a global slot, at most
+    `max_concurrent`. Callers that cannot start right away wait in a queue of at most `max_queued` callers
+    for `queue_timeout_sec`. A caller is turned away at once when the queue is full, or when its user already
+    has `max_concurrent_per_user` callers waiting, instead of slowing every request down. Calls without
+    a user only take a global slot.
+    """
+
+    def __init__(self, max_concurrent: int, max_concurrent_per_user: int, max_queued: int, queue_timeout_sec: float):
+        self.max_concurrent = max_concurrent
+        self.max_concurrent_per_user = max_concurrent_per_user
+        self.max_queued = max_queued
+        self.queue_timeout_sec = queue_timeout_sec
+        self._global = asyncio.Semaphore(max_concurrent)
+        self._users: Dict[str, asyncio.Semaphore] = {}
+        # Callers holding or waiting for a slot of the user, its semaphore is dropped when none are left.
+        self._user_callers: Dict[str, int] = {}
+        self._user_waiting: Dict[str, int] = {}
+        self._wait_times: Deque[float] = deque(maxlen=WAIT_TIME_WINDOW)
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[str] = None):
+        await self.acquire(user_id)
+        try:
+            yield
+        finally:
+            self.release(user_id)
+
+    async def acquire(self, user_id: Optional[str] = None):
+        """
+        Wait for a slot, every successful call must be followed by `release` with the same user.
+
+        params:
+        -------
+            user_id: str, optional
+                The user the call is made for, None for calls not made for a request.
+
+        raises:
+        -------
+            OpenAIFailedProcessingException
+                429 when the user has too many calls waiting, 503 when the queue is full or the wait timed out.
+        """
+        user_slots = self._user_slots(user_id)
+        if self._global.locked() or (user_slots is not None and user_slots.locked()):
+            user_waiting = self._user_waiting.get(user_id, 0)
+            if user_slots is not None and user_slots.locked() and user_waiting >= self.max_concurrent_per_user:
+                self._reject(user_id, status.HTTP_429_TOO_MANY_REQUESTS)
+                raise self._overloaded(status.HTTP_429_TOO_MANY_REQUESTS)
+            if self.queued >= self.max_queued:
+                self._reject(user_id, status.HTTP_503_SERVICE_UNAVAILABLE)
+                raise self._overloaded(status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        started_at = time.perf_counter()
+        self.queued += 1
+        LLM_ADMISSION_QUEUED.inc()
+        if user_id is not None:
+            self._user_waiting[user_id] = self._user_waiting.get(user_id, 0) + 1
+        try:
+            async with asyncio.timeout(self.queue_timeout_sec):
+                if user_slots is not None:
+                    await user_slots.acquire()
+                try:
+                    await self._global.acquire()
+                except BaseException:
+                    if user_slots is not None:
+                        user_slots.release()
+                    raise
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            LLM_ADMISSION_REJECTED.labels(status.HTTP_503_SERVICE_UNAVAILABLE).inc()
+            self._forget_user(user_id)
+            logger.warning(f"LLM call of user {user_id} waited {self.queue_timeout_sec}s for a slot, rejected.")
+            raise self._overloaded(status.HTTP_503_SERVICE_UNAVAILABLE)
+        except BaseException:
+            self._forget_user(user_id)
+            raise
+        finally:
+            self.queued -= 1
+            LLM_ADMISSION_QUEUED.dec()
+            if user_id is not None:
+                self._user_waiting[user_id] -= 1
+                if not self._user_waiting[user_id]:
+                    del self._user_waiting[user_id]
+
+        self._wait_times.append(time.perf_counter() - started_at)
+        stage_timer.record("llm.admission_wait", self._wait_times[-1])
+        self.admitted += 1
+        self.running += 1
+        LLM_ADMISSION_RUNNING.inc()
+
+    def release(self, user_id: Optional[str] = None):
+        self.running -= 1
+        LLM_ADMISSION_RUNNING.dec()
+        self._global.release()
+        if user_id is not None:
+            self._users[user_id].release()
+            self._forget_user(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        wait_times = sorted(self._wait_times)
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "users": len(self._users),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_ms_avg": sum(wait_times) * 1000 / len(wait_times) if wait_times else 0.0,
+            "wait_ms_p95": wait_times[min(len(wait_times) - 1, int(len(wait_times) * 0.95))] * 1000 if wait_times else 0.0,
+        }
+
+    def _user_slots(self, user_id: Optional[str]) -> Optional[asyncio.Semaphore]:
+        if user_id is None:
+            return None
+        if user_id not in self._users:
+            self._users[user_id] = asyncio.Semaphore(self.max_concurrent_per_user)
+        self._user_callers[user_id] = self._user_callers.get(user_id, 0) + 1
+        return self._users[user_id]
+
+    def _forget_user(self, user_id: Optional[str]):
+        if user_id is None:
+            return
+        self._user_callers[user_id] -= 1
+        if not self._user_callers[user_id]:
+            del self._user_callers[user_id]
+            del self._users[user_id]
+
+    def _reject(self, user_id: Optional[str], status_code: int):
+        self.rejected += 1
+        LLM_ADMISSION_REJECTED.labels(status_code).inc()
+        self._forget_user(user_id)
+
+    def _overloaded(self, status_code: int) -> OpenAIFailedProcessingException:
+        return OpenAIFailedProcessingException(
+            status_code=status_code, detail=FailureReasonsEnum.OVERLOADED.value,
+            headers={"Retry-After": str(math.ceil(self.queue_timeout_sec))})
+
+
+llm_admission = AdmissionController(
+    max_concurrent=settings.LLM_MAX_CONCURRENCY,
+    max_concurrent_per_user=settings.LLM_MAX_CONCURRENCY_PER_USER,
+    max_queued=settings.LLM_MAX_QUEUED,
+    queue_timeout_sec=settings.LLM_QUEUE_TIMEOUT_SEC,
+)
@@ -1,42 +1,57 @@
+from typing import Optional
 from uuid import UUID
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 
-import openai
-from starlette.responses import StreamingResponse
+from qdrant_client import AsyncQdrantClient
+from starlette.responses import Response, StreamingResponse
 
 from src.app.chat.exceptions import OpenAIException
+from src.app.chat.llm import LLMError
 from src.app.chat.models import BaseMessage, Message, ChatSummary
 from src.app.chat.services import OpenAIService, ChatServices
 from src.app.core.logs import logger
+from src.app.core.metrics import set_request_model
+from src.app.core.pagination import NEXT_CURSOR_HEADER
+from src.app.core.qdrant import get_qdrant_client
 from src.app.db import messages_queries
+from src.app.settings import settings
 
 router = APIRouter(tags=["Chat Endpoints"])
 
 
 @router.get("/v1/messages/{user_id}")
-async def get_messages(user_id: str) -> list[Message]:
-    return [Message(**message) for message in messages_queries.select_messages_by_user(user_id=user_id)]
+async def get_messages(user_id: str, response: Response,
+                       limit: int = Query(default=settings.PAGINATION_DEFAULT_LIMIT, ge=1, le=settings.PAGINATION_MAX_LIMIT),
+                       before: Optional[str] = None) -> list[Message]:
+    messages, next_cursor = await ChatServices.get_messages(user_id=user_id, limit=limit, before=before)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return messages
 
 
 @router.get("/v1/chats/{user_id}")
-async def get_chats(user_id: str):
-    chats = messages_queries.select_chats_by_user(user_id=user_id)
-
-    chats_to_return = [chat for chat in chats]
-    return chats_to_return
+async def get_chats(user_id: str, response: Response,
+                    limit: int = Query(default=settings.PAGINATION_DEFAULT_LIMIT, ge=1, le=settings.PAGINATION_MAX_LIMIT),
+                    before: Optional[str] = None) -> list[ChatSummary]:
+    chats, next_cursor = await ChatServices.get_chats(user_id=user_id, limit=limit, before=before)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return chats
 
 
 @router.get("/v1/chat/{chat_id}/messages")
-async def get_chat_messages(chat_id) -> list[Message]:
-    messages = messages_queries.select_messages_by_chat(chat_id=chat_id)
-    messages_to_return = [
-        {**message, 'id': str(message['id'])} for message in messages]
-    return messages_to_return
+async def get_chat_messages(chat_id, response: Response,
+                            limit: int = Query(default=settings.PAGINATION_DEFAULT_LIMIT, ge=1, le=settings.PAGINATION_MAX_LIMIT),
+                            before: Optional[str] = None) -> list[Message]:
+    messages, next_cursor = await ChatServices.get_chat_messages(chat_id=chat_id, limit=limit, before=before)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return messages
 
 
 @router.get("/v1/chat/{chat_id}")
 async def get_chat(chat_id: UUID) -> ChatSummary:
-    return ChatSummary(**messages_queries.select_chat_by_id(chat_id=chat_id))
+    return ChatSummary(**await messages_queries.select_chat_by_id(chat_id=str(chat_id)))
 
 
 @router.post("/v1/chat-create")
@@ -49,11 +64,12 @@ async def create_chat(chat: ChatSummary):
 
 @router.post("/v1/completion")
 async def completion_create(input_message: BaseMessage, context: str) -> Message:
+    set_request_model(input_message.model)
     try:
         answer = await OpenAIService.chat_completion_without_streaming(input_message=input_message, context=context)
         return answer
-    except openai.OpenAIError as e:
-        logger.error(f"OpenAI API Error: {e}")
+    except LLMError as e:
+        logger.error(f"LLM API Error: {e}")
         raise OpenAIException
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
@@ -62,23 +78,26 @@ async def completion_create(input_message: BaseMessage, context: str) -> Message
 
 @router.post("/v1/completion-stream")
 async def completion_stream(input_message: BaseMessage) -> StreamingResponse:
+    set_request_model(input_message.model)
     try:
         return await OpenAIService.chat_completion_with_streaming(input_message=input_message)
-    except openai.OpenAIError:
+    except LLMError:
         raise OpenAIException
 
 
 @router.post("/v1/qa-create")
-async def qa_create(input_message: BaseMessage) -> Message:
+async def qa_create(input_message: BaseMessage, client: AsyncQdrantClient = Depends(get_qdrant_client)) -> Message:
+    set_request_model(input_message.model)
     try:
-        return await OpenAIService.qa_without_stream(input_message=input_message)
-    except openai.OpenAIError:
+        return await OpenAIService.qa_without_stream(input_message=input_message, client=client)
+    except LLMError:
         raise OpenAIException
 
 
 @router.post("/v1/qa-stream")
-async def qa_stream(input_message: BaseMessage) -> StreamingResponse:
+async def qa_stream(input_message: BaseMessage, client: AsyncQdrantClient = Depends(get_qdrant_client)) -> StreamingResponse:
+    set_request_model(input_message.model)
     try:
-        return await OpenAIService.qa_with_stream(input_message=input_message)
-    except openai.OpenAIError:
+        return await OpenAIService.qa_with_stream(input_message=input_message, client=client)
+    except LLMError:
         raise OpenAIException
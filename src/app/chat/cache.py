@@ -0,0 +1,196 @@
+import sys
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.app.settings import settings
+
+
+def normalize_query(query: str) -> str:
+    # Only NFKC and whitespace runs are folded, which the tokenizers of the supported models fold as well.
+    # Case is kept, cased models such as intfloat/multilingual-e5-large embed "Apple" and "apple" differently.
+    return " ".join(unicodedata.normalize("NFKC", query).split())
+
+
+class EmbeddingCache:
+    """
+    LRU cache of query vectors with a TTL, bounded by the memory held by keys and vectors.
+
+    Vectors are kept as float32 arrays. Entries are keyed by model name and normalized query,
+    so a model change never serves stale vectors.
+    """
+
+    def __init__(self, max_bytes: int, ttl_sec: float):
+        self.max_bytes = max_bytes
+        self.ttl_sec = ttl_sec
+        self._entries: OrderedDict[Tuple[str, str], Tuple[float, array, int]] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, model_name: str, query: str) -> Optional[List[float]]:
+        key = (model_name, normalize_query(query))
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, vector, _ = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return vector.tolist()
+
+    def put(self, model_name: str, query: str, vector: Sequence[float]):
+        key = (model_name, normalize_query(query))
+        stored = array("f", vector)
+        size = sys.getsizeof(key[0]) + sys.getsizeof(key[1]) + sys.getsizeof(stored)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_sec, stored, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key: Tuple[str, str]):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+
+@dataclass
+class _UserAnswers:
+    corpus_version: int
+    vectors: List[np.ndarray] = field(default_factory=list)
+    answers: List[Tuple[str, Optional[str], str, float]] = field(default_factory=list)
+
+
+class SemanticAnswerCache:
+    """
+    Per user cache of answers looked up by query embedding similarity.
+
+    A stored answer is returned when a query of the same user, model and chat has a cosine similarity
+    of at least `similarity_threshold` with a cached query. A chat id of None shares the answer between
+    all chats of the user, for prompts that do not carry the history of their chat. Every entry records
+    the version of the user's corpus it was produced against, a different version drops all entries of
+    that user.
+    """
+
+    def __init__(self, similarity_threshold: float, max_entries_per_user: int, max_users: int, ttl_sec: float):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries_per_user = max_entries_per_user
+        self.max_users = max_users
+        self.ttl_sec = ttl_sec
+        self._users: OrderedDict[str, _UserAnswers] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, user_id: str, model: str, chat_id: Optional[str], query_vector: Sequence[float],
+               corpus_version: int) -> Optional[str]:
+        answers = self._current(user_id, corpus_version)
+        if answers is None or not answers.vectors:
+            self.misses += 1
+            return None
+
+        self._expire(answers)
+        if not answers.vectors:
+            self.misses += 1
+            return None
+
+        similarities = np.vstack(answers.vectors) @ self._unit(query_vector)
+        for index in np.argsort(-similarities):
+            if similarities[index] < self.similarity_threshold:
+                break
+            answer_model, answer_chat_id, answer, _ = answers.answers[index]
+            if answer_model == model and answer_chat_id == chat_id:
+                self._users.move_to_end(user_id)
+                self.hits += 1
+                return answer
+
+        self.misses += 1
+        return None
+
+    def store(self, user_id: str, model: str, chat_id: Optional[str], query_vector: Sequence[float],
+              corpus_version: int, answer: str):
+        answers = self._current(user_id, corpus_version)
+        if answers is None:
+            answers = self._users[user_id] = _UserAnswers(corpus_version=corpus_version)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+
+        answers.vectors.append(self._unit(query_vector))
+        answers.answers.append((model, chat_id, answer, time.monotonic() + self.ttl_sec))
+        if len(answers.vectors) > self.max_entries_per_user:
+            del answers.vectors[0], answers.answers[0]
+
+    def invalidate_user(self, user_id: str):
+        self._users.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._users),
+            "entries": sum(len(answers.answers) for answers in self._users.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _current(self, user_id: str, corpus_version: int) -> Optional[_UserAnswers]:
+        answers = self._users.get(user_id)
+        if answers is not None and answers.corpus_version != corpus_version:
+            self.invalidate_user(user_id)
+            return None
+        return answers
+
+    @staticmethod
+    def _expire(answers: _UserAnswers):
+        now = time.monotonic()
+        alive = [index for index, (*_, expires_at) in enumerate(answers.answers) if expires_at >= now]
+        if len(alive) != len(answers.answers):
+            answers.vectors = [answers.vectors[index] for index in alive]
+            answers.answers = [answers.answers[index] for index in alive]
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+query_embedding_cache = EmbeddingCache(
+    max_bytes=settings.EMBEDDING_CACHE_MAX_BYTES,
+    ttl_sec=settings.EMBEDDING_CACHE_TTL_SEC,
+)
+
+answer_cache = SemanticAnswerCache(
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    max_entries_per_user=settings.ANSWER_CACHE_MAX_ENTRIES_PER_USER,
+    max_users=settings.ANSWER_CACHE_MAX_USERS,
+    ttl_sec=settings.ANSWER_CACHE_TTL_SEC,
+)
@@ -7,6 +7,7 @@ class FailureReasonsEnum(StrEnum):
     OPENAI_ERROR = 'OpenAI call Error'
     STREAM_TIMEOUT = 'Stream Timeout'
     FAILED_PROCESSING = 'Failed Processing'
+    OVERLOADED = 'Too Many Concurrent Requests'
 
 
 class ChatRolesEnum(StrEnum):
@@ -0,0 +1,100 @@
+from dataclasses import dataclass
+from typing import List, Sequence
+
+from qdrant_client import models
+
+from src.app.scripts.chunking import ENCODING_NAME, encode_batch, get_encoding
+from src.app.settings import settings
+
+
+@dataclass(frozen=True)
+class PackedContext:
+    documents: List[str]
+    tokens: int
+    candidates: int
+    candidate_tokens: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.candidate_tokens - self.tokens
+
+
+class ContextPacker:
+    """
+    Select the search hits that go into the prompt.
+
+    Hits are picked greedily by maximal marginal relevance, `mmr_lambda` trades the normalized search score
+    against the overlap with hits already picked. Overlap is the Jaccard similarity of the token sets, hits
+    overlapping a picked one by `duplicate_threshold` or more are dropped as near duplicates. At most
+    `max_chunks` hits and `token_budget` tokens are kept, then ordered by search score.
+    """
+
+    def __init__(self, token_budget: int, max_chunks: int, mmr_lambda: float, duplicate_threshold: float,
+                 encoding_name: str = ENCODING_NAME):
+        self.token_budget = token_budget
+        self.max_chunks = max_chunks
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+        self.encoding_name = encoding_name
+
+    @property
+    def encoding(self):
+        return get_encoding(self.encoding_name)
+
+    def pack(self, points: Sequence[models.ScoredPoint]) -> PackedContext:
+        documents = [point.payload["document"] for point in points]
+        token_counts = []
+        token_sets = []
+        for tokens in encode_batch(self.encoding, documents):
+            token_counts.append(len(tokens))
+            token_sets.append(frozenset(tokens))
+        relevance = self._normalized_scores([point.score for point in points])
+
+        selected: List[int] = []
+        remaining = list(range(len(points)))
+        budget = self.token_budget
+        while remaining and len(selected) < self.max_chunks:
+            best, best_value = None, float("-inf")
+            for index in list(remaining):
+                overlap = max((self._jaccard(token_sets[index], token_sets[other]) for other in selected), default=0.0)
+                if overlap >= self.duplicate_threshold or token_counts[index] > budget:
+                    remaining.remove(index)
+                    continue
+                value = self.mmr_lambda * relevance[index] - (1 - self.mmr_lambda) * overlap
+                if value > best_value:
+                    best, best_value = index, value
+            if best is None:
+                break
+            selected.append(best)
+            remaining.remove(best)
+            budget -= token_counts[best]
+
+        selected.sort(key=lambda index: points[index].score, reverse=True)
+        return PackedContext(
+            documents=[documents[index] for index in selected],
+            tokens=sum(token_counts[index] for index in selected),
+            candidates=len(points),
+            candidate_tokens=sum(token_counts),
+        )
+
+    @staticmethod
+    def _normalized_scores(scores: List[float]) -> List[float]:
+        # Dense cosine and fused RRF scores live on different scales, only their spread matters here.
+        low, high = min(scores, default=0.0), max(scores, default=0.0)
+        if high == low:
+            return [1.0] * len(scores)
+        return [(score - low) / (high - low) for score in scores]
+
+    @staticmethod
+    def _jaccard(first: frozenset, second: frozenset) -> float:
+        if not first or not second:
+            return 0.0
+        return len(first & second) / len(first | second)
+
+
+context_packer = ContextPacker(
+    token_budget=settings.CONTEXT_TOKEN_BUDGET,
+    max_chunks=settings.CONTEXT_MAX_CHUNKS,
+    mmr_lambda=settings.CONTEXT_MMR_LAMBDA,
+    duplicate_threshold=settings.CONTEXT_DUPLICATE_THRESHOLD,
+)
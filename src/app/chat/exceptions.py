@@ -1,3 +1,5 @@
+from typing import Dict, Optional
+
 from fastapi import HTTPException
 from starlette import status
 
@@ -11,8 +13,9 @@ class OpenAIException(HTTPException):
 
 
 class OpenAIFailedProcessingException(HTTPException):
-    def __init__(self):
-        super().__init__(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=FailureReasonsEnum.FAILED_PROCESSING.value)
+    def __init__(self, status_code: int = status.HTTP_503_SERVICE_UNAVAILABLE,
+                 detail: str = FailureReasonsEnum.FAILED_PROCESSING.value, headers: Optional[Dict[str, str]] = None):
+        super().__init__(status_code=status_code, detail=detail, headers=headers)
 
 
 class OpenAIStreamTimeoutException(HTTPException):
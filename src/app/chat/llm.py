@@ -0,0 +1,111 @@
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from src.app.chat.constants import ModelsEnum
+from src.app.core.logs import logger
+from src.app.core.timing import stage_timer
+from src.app.settings import settings
+
+
+class LLMError(Exception):
+    """The backend of a model could not be reached or answered with an error."""
+
+
+@dataclass(frozen=True)
+class LLMBackend:
+    base_url: str
+    api_key: Optional[str] = None
+
+
+class LLMClient:
+    """
+    Chat completions against OpenAI compatible backends through one pooled HTTP client per worker.
+
+    Every model of `ModelsEnum` is routed to the `/chat/completions` endpoint of its backend. The client keeps
+    up to `max_keepalive_connections` connections open, negotiates HTTP/2 with backends supporting it
+    so concurrent streams share a connection, and is created on first use. Completions and stream chunks
+    are the JSON objects of the OpenAI API.
+    """
+
+    def __init__(self, backends: Dict[str, LLMBackend], max_connections: int, max_keepalive_connections: int,
+                 keepalive_expiry_sec: float, connect_timeout_sec: float, read_timeout_sec: float, http2: bool = True):
+        self.backends = backends
+        self._limits = httpx.Limits(max_connections=max_connections,
+                                    max_keepalive_connections=max_keepalive_connections,
+                                    keepalive_expiry=keepalive_expiry_sec)
+        self._timeout = httpx.Timeout(read_timeout_sec, connect=connect_timeout_sec)
+        self._http2 = http2
+        self._http: Optional[httpx.AsyncClient] = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(http2=self._http2, limits=self._limits, timeout=self._timeout)
+        return self._http
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def complete(self, model: str, messages: List[Dict[str, str]], **params) -> Dict[str, Any]:
+        url, headers = self._route(model)
+        try:
+            with stage_timer.measure("llm.complete"):
+                response = await self.http.post(url, headers=headers, json={"model": model, "messages": messages, **params})
+        except httpx.HTTPError as e:
+            raise LLMError(f"{model} backend request failed: {e!r}") from e
+        if response.is_error:
+            raise LLMError(f"{model} backend answered {response.status_code}: {response.text[:200]}")
+        return response.json()
+
+    async def stream(self, model: str, messages: List[Dict[str, str]], **params) -> AsyncIterator[Dict[str, Any]]:
+        """Chunks of a streamed completion, read from the server sent events until `[DONE]`."""
+        url, headers = self._route(model)
+        body = {"model": model, "messages": messages, "stream": True, **params}
+        started_at = time.perf_counter()
+        first_chunk = True
+        try:
+            async with self.http.stream("POST", url, headers=headers, json=body) as response:
+                if response.is_error:
+                    await response.aread()
+                    raise LLMError(f"{model} backend answered {response.status_code}: {response.text[:200]}")
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        stage_timer.record("llm.stream", time.perf_counter() - started_at)
+                        return
+                    if first_chunk:
+                        first_chunk = False
+                        stage_timer.record("llm.first_token", time.perf_counter() - started_at)
+                    yield json.loads(data)
+        except httpx.HTTPError as e:
+            raise LLMError(f"{model} backend stream failed: {e!r}") from e
+
+    def _route(self, model: str):
+        backend = self.backends.get(model)
+        if backend is None:
+            logger.error(f"No LLM backend configured for model {model}.")
+            raise LLMError(f"No backend configured for model {model}.")
+        headers = {"Authorization": f"Bearer {backend.api_key}"} if backend.api_key else {}
+        return f"{backend.base_url.rstrip('/')}/chat/completions", headers
+
+
+llm_client = LLMClient(
+    backends={
+        ModelsEnum.GPT4.value: LLMBackend(base_url=settings.OPENAI_API_BASE, api_key=settings.OPENAI_API_KEY),
+        ModelsEnum.LLAMA2.value: LLMBackend(base_url=settings.LLAMA2_API_BASE, api_key=settings.LLAMA2_API_KEY),
+    },
+    max_connections=settings.LLM_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry_sec=settings.LLM_KEEPALIVE_EXPIRY_SEC,
+    connect_timeout_sec=settings.LLM_CONNECT_TIMEOUT_SEC,
+    read_timeout_sec=settings.GENERATION_TIMEOUT_SEC,
+    http2=settings.LLM_HTTP2,
+)
@@ -0,0 +1,164 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from src.app.chat.admission import llm_admission
+from src.app.chat.constants import ChatRolesEnum
+from src.app.chat.llm import llm_client
+from src.app.chat.persistence import message_writer
+from src.app.core.logs import logger
+from src.app.core.timing import stage_timer
+from src.app.db import messages_queries
+from src.app.scripts.chunking import ENCODING_NAME, encode_batch, get_encoding
+from src.app.settings import settings
+
+# Cursor of a chat without summary, before any message.
+START_CURSOR: Dict = {"created_at": datetime(1970, 1, 1, tzinfo=timezone.utc), "id": "00000000-0000-0000-0000-000000000000"}
+# Role and separator tokens OpenAI adds around every message.
+TOKENS_PER_MESSAGE: int = 4
+SUMMARY_INSTRUCTIONS: str = (
+    "You maintain the running summary of a conversation between a user and an assistant. "
+    "Merge the previous summary and the new exchanges into one concise summary that keeps names, numbers, "
+    "decisions and open questions. Answer with the summary only."
+)
+
+
+class ConversationMemory:
+    """
+    History of a chat fitted into a token budget.
+
+    Every chat has at most one summary row covering its messages up to a `(created_at, id)` cursor. A request
+    reads the summary and the latest `max_recent_turns` messages after the cursor, then keeps the newest turns
+    that fit in `token_budget` next to the summary. Turns that no longer fit are folded into the summary
+    in the background, one chat at a time, so the next request finds them summarized.
+    """
+
+    def __init__(self, token_budget: int, max_recent_turns: int, fold_batch_size: int, summary_max_tokens: int,
+                 encoding_name: str = ENCODING_NAME):
+        self.token_budget = token_budget
+        self.max_recent_turns = max_recent_turns
+        self.fold_batch_size = fold_batch_size
+        self.summary_max_tokens = summary_max_tokens
+        self.encoding_name = encoding_name
+        self._folding: Dict[str, asyncio.Task] = {}
+
+    @property
+    def encoding(self):
+        # Loaded on first use, not when the module is imported.
+        return get_encoding(self.encoding_name)
+
+    async def history(self, chat_id: str, model: str) -> List[Dict[str, str]]:
+        """
+        The summary and recent turns of the chat as OpenAI chat messages, oldest first.
+
+        params:
+        -------
+            chat_id: str
+                The chat of the current message.
+            model: str
+                The model of the chat, also used to update the summary.
+
+        returns:
+        --------
+            messages: list[dict]
+                Empty when the chat has no history or it could not be read.
+        """
+        try:
+            with stage_timer.measure("memory.history"):
+                summary = await messages_queries.select_chat_summary(chat_id=chat_id)
+                cursor = {"created_at": summary["summarized_until"], "id": summary["summarized_until_id"]} if summary else START_CURSOR
+                turns = await self._recent_turns(chat_id, cursor)
+        except Exception as e:
+            logger.error(f"History of chat {chat_id} could not be read: {e}")
+            return []
+
+        budget = self.token_budget
+        messages: List[Dict[str, str]] = []
+        if summary:
+            messages.append({"role": ChatRolesEnum.SYSTEM.value,
+                             "content": f"Summary of the earlier conversation:\n{summary['summary']}"})
+            budget -= self._count_tokens([messages[0]["content"]])[0]
+
+        turn_tokens = self._count_tokens([f"{turn['user_message']}\n{turn['answer']}" for turn in turns])
+        kept = 0
+        for tokens in turn_tokens:
+            if tokens > budget:
+                break
+            budget -= tokens
+            kept += 1
+        for turn in reversed(turns[:kept]):
+            messages.append({"role": ChatRolesEnum.USER.value, "content": turn["user_message"]})
+            messages.append({"role": ChatRolesEnum.ASSISTANT.value, "content": turn["answer"]})
+
+        if kept < len(turns):
+            self._schedule_fold(chat_id, model, until=turns[kept])
+        return messages
+
+    async def shutdown(self):
+        for task in self._folding.values():
+            task.cancel()
+        await asyncio.gather(*self._folding.values(), return_exceptions=True)
+
+    async def _recent_turns(self, chat_id: str, cursor: Dict) -> List[Dict]:
+        """Turns after the cursor, newest first, including the ones still buffered by the message writer."""
+        turns = [row for row in message_writer.pending(chat_id)
+                 if (row["created_at"], row["id"]) > (cursor["created_at"], cursor["id"])]
+        stored = await messages_queries.select_chat_turns_after(
+            chat_id=chat_id, after_created_at=cursor["created_at"], after_id=cursor["id"], limit=self.max_recent_turns)
+        buffered_ids = {row["id"] for row in turns}
+        turns.extend(row for row in stored if row["id"] not in buffered_ids)
+        return turns[:self.max_recent_turns]
+
+    def _count_tokens(self, texts: List[str]) -> List[int]:
+        return [len(tokens) + TOKENS_PER_MESSAGE for tokens in encode_batch(self.encoding, texts)]
+
+    def _schedule_fold(self, chat_id: str, model: str, until: Dict):
+        if chat_id in self._folding:
+            return
+        task = asyncio.create_task(self._fold(chat_id, model, until))
+        self._folding[chat_id] = task
+        task.add_done_callback(lambda _: self._folding.pop(chat_id, None))
+
+    async def _fold(self, chat_id: str, model: str, until: Dict):
+        try:
+            while True:
+                summary = await messages_queries.select_chat_summary(chat_id=chat_id)
+                cursor = {"created_at": summary["summarized_until"], "id": summary["summarized_until_id"]} if summary else START_CURSOR
+                turns = await messages_queries.select_chat_turns_between(
+                    chat_id=chat_id, after_created_at=cursor["created_at"], after_id=cursor["id"],
+                    until_created_at=until["created_at"], until_id=until["id"], limit=self.fold_batch_size)
+                if not turns:
+                    return
+                updated_summary = await self._summarize(summary["summary"] if summary else None, turns, model)
+                await messages_queries.upsert_chat_summary(
+                    chat_id=chat_id, summary=updated_summary,
+                    summarized_until=turns[-1]["created_at"], summarized_until_id=turns[-1]["id"])
+                logger.info(f"Folded {len(turns)} turns of chat {chat_id} into its summary.")
+                if len(turns) < self.fold_batch_size:
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Summary of chat {chat_id} could not be updated: {e}")
+
+    async def _summarize(self, previous_summary: Optional[str], turns: List[Dict], model: str) -> str:
+        transcript = "\n".join(f"User: {turn['user_message']}\nAssistant: {turn['answer']}" for turn in turns)
+        async with llm_admission.slot():
+            completion = await llm_client.complete(
+                model=model,
+                max_tokens=self.summary_max_tokens,
+                messages=[
+                    {"role": ChatRolesEnum.SYSTEM.value, "content": SUMMARY_INSTRUCTIONS},
+                    {"role": ChatRolesEnum.USER.value,
+                     "content": f"PREVIOUS SUMMARY:\n{previous_summary or '(none)'}\nNEW EXCHANGES:\n{transcript}"},
+                ],
+            )
+        return completion["choices"][0]["message"]["content"]
+
+
+conversation_memory = ConversationMemory(
+    token_budget=settings.MEMORY_TOKEN_BUDGET,
+    max_recent_turns=settings.MEMORY_MAX_RECENT_TURNS,
+    fold_batch_size=settings.MEMORY_FOLD_BATCH_SIZE,
+    summary_max_tokens=settings.MEMORY_SUMMARY_MAX_TOKENS,
+)
@@ -0,0 +1,125 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+
+from src.app.chat.constants import ChatRolesEnum
+from src.app.chat.models import BaseMessage
+from src.app.core.logs import logger
+from src.app.core.timing import stage_timer
+from src.app.db import messages_queries
+from src.app.settings import settings
+
+
+MESSAGE_COLUMNS: Tuple[str, ...] = ("id", "chat_id", "model", "user_id", "agent_role", "user_message", "answer",
+                                    "created_at")
+
+
+class MessageWriter:
+    """
+    Write-behind buffer of finished chat messages.
+
+    Messages are buffered in memory and written with a single multi-row `insert_messages` statement once
+    `batch_size` messages are waiting or every `flush_interval_sec`, and a last time on shutdown.
+    `created_at` is taken when the message is buffered so that history keeps the order of the answers.
+    When the database is unreachable the batch stays buffered, beyond `max_buffered` the oldest messages are dropped.
+    """
+
+    def __init__(self, batch_size: int, flush_interval_sec: float, max_buffered: int):
+        self._batch_size = batch_size
+        self._flush_interval_sec = flush_interval_sec
+        self._max_buffered = max_buffered
+        self._buffer: List[Dict] = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Let the flush loop finish on its own, a cancellation racing the wakeup could be swallowed by wait_for.
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._buffer:
+            logger.error(f"{len(self._buffer)} messages could not be written before shutdown.")
+
+    def add(self, input_message: BaseMessage, answer: str):
+        """Buffer the answer to the input message, never waits on the database."""
+        self._buffer.append({
+            "id": str(uuid.uuid4()),
+            "chat_id": str(input_message.chat_id),
+            "model": str(input_message.model),
+            "user_id": str(input_message.userId),
+            "agent_role": str(ChatRolesEnum.ASSISTANT.value),
+            "user_message": str(input_message.user_message),
+            "answer": str(answer),
+            "created_at": datetime.now(timezone.utc),
+        })
+        self._trim()
+        if len(self._buffer) >= self._batch_size:
+            self._wakeup.set()
+
+    def pending(self, chat_id: str) -> List[Dict]:
+        """Buffered messages of the chat not written yet, newest first."""
+        return [row for row in reversed(self._buffer) if row["chat_id"] == chat_id]
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._buffer:
+                batch, self._buffer = self._buffer[:self._batch_size], self._buffer[self._batch_size:]
+                try:
+                    with stage_timer.measure("db.persist"):
+                        await self._write(batch)
+                except Exception as e:
+                    logger.error(f"Error while writing {len(batch)} messages to db, keeping them buffered: {e}")
+                    self._buffer[:0] = batch
+                    self._trim()
+                    return
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._flush_interval_sec)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    @staticmethod
+    async def _write(batch: List[Dict]):
+        try:
+            # One statement for the whole batch, the rows travel as one array per column.
+            await messages_queries.insert_messages(**{
+                f"{column}s": [row[column] for row in batch] for column in MESSAGE_COLUMNS})
+        except asyncpg.PostgresError as e:
+            # The server rejected the batch, write the rows one by one so that a single bad row is the only one lost.
+            logger.error(f"Batched message insert failed, retrying row by row: {e}")
+            for row in batch:
+                try:
+                    await messages_queries.insert_message(**row)
+                except asyncpg.PostgresError as row_error:
+                    logger.error(f"Message {row['id']} of chat {row['chat_id']} was dropped: {row_error}")
+            return
+        logger.info(f"{len(batch)} messages inserted to db successfully")
+
+    def _trim(self):
+        overflow = len(self._buffer) - self._max_buffered
+        if overflow > 0:
+            del self._buffer[:overflow]
+            logger.error(f"Message write buffer is full, dropped the {overflow} oldest messages.")
+
+
+message_writer = MessageWriter(
+    batch_size=settings.MESSAGE_WRITE_BATCH_SIZE,
+    flush_interval_sec=settings.MESSAGE_WRITE_FLUSH_INTERVAL_SEC,
+    max_buffered=settings.MESSAGE_WRITE_MAX_BUFFERED,
+)
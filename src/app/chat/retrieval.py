@@ -1,20 +1,40 @@
-from qdrant_client import QdrantClient
+import asyncio
+from typing import Dict, List, Optional
 
+from qdrant_client import AsyncQdrantClient, models
+
+from src.app.chat.cache import query_embedding_cache
+from src.app.chat.context import context_packer
 from src.app.chat.exceptions import RetrievalNoDocumentsFoundException
 from src.app.chat.models import BaseMessage
+from src.app.core.embeddings import embed_query, get_vector_name
 from src.app.core.logs import logger
+from src.app.core.qdrant import storage_profile, tenant_collection
+from src.app.core.timing import stage_timer
+from src.app.db import files_queries
+from src.app.core.sparse import SPARSE_VECTOR_NAME, get_sparse_encoder
 from src.app.settings import settings
 
+# The context is built from the chunk text alone, the rest of the payload is not sent back.
+RETRIEVAL_PAYLOAD_FIELDS: List[str] = ["document"]
+
 
-def process_retrieval(message: BaseMessage) -> BaseMessage:
+async def process_retrieval(message: BaseMessage, client: AsyncQdrantClient) -> BaseMessage:
     logger.info(
         f"Qdrant settings: Host - {settings.QDRANT_HOST}, Port - {settings.QDRANT_PORT}")
 
-    search_result = search(query=message.user_message, userId=message.userId)
+    with stage_timer.measure("retrieval.search"):
+        search_result = await search_points(client=client, query=message.user_message, userId=message.userId)
+    if not search_result:
+        raise RetrievalNoDocumentsFoundException
+    with stage_timer.measure("retrieval.pack"):
+        context = await asyncio.to_thread(context_packer.pack, search_result)
+    logger.info(f"Context packed {len(context.documents)}/{context.candidates} chunks in {context.tokens} tokens, "
+                f"{context.saved_tokens} tokens saved.")
     resulting_query: str = (
         f"Answer the query, \n"
         f"QUERY:\n{message.user_message}\n"
-        f"CONTEXT:\n{search_result}"
+        f"CONTEXT:\n" + "\n".join(context.documents)
     )
 
     return BaseMessage(augmented_message=resulting_query,
@@ -26,11 +46,87 @@ def process_retrieval(message: BaseMessage) -> BaseMessage:
                        answer=message.answer)
 
 
-def search(query: str, userId: str) -> str:
-    client = QdrantClient(host=settings.QDRANT_HOST, port=settings.QDRANT_PORT)
-    search_result = client.query(
-        collection_name=userId, query_text=query)
+async def get_query_vector(query: str) -> List[float]:
+    query_vector = query_embedding_cache.get(settings.EMBEDDING_MODEL, query)
+    if query_vector is None:
+        with stage_timer.measure("retrieval.embed_query"):
+            query_vector = await asyncio.to_thread(embed_query, query)
+        query_embedding_cache.put(settings.EMBEDDING_MODEL, query, query_vector)
+    return query_vector
+
+
+async def get_corpus_version(client: AsyncQdrantClient, userId: str) -> Optional[int]:
+    """
+    Version of the user's corpus, it changes whenever an ingest of the user finishes, on every worker.
+
+    It is the last update of the user's file records, in microseconds, which every ingest writes once
+    its points are stored. Without a database pool it is the number of points of the user instead.
+    """
+    try:
+        if files_queries.connected:
+            return await files_queries.select_corpus_version(user_id=userId) or 0
+        tenant = tenant_collection(userId)
+        return (await client.count(collection_name=tenant.name, count_filter=tenant.filter(), exact=True)).count
+    except Exception as e:
+        logger.error(f"Could not read the corpus version of {userId}: {e}")
+        return None
+
+
+async def search_points(client: AsyncQdrantClient, query: str, userId: str, limit: int = settings.RETRIEVAL_LIMIT,
+                        hybrid: Optional[bool] = None) -> List[models.ScoredPoint]:
+    """
+    Search the user's chunks for the query, in the user's collection or filtered to the user in the shared one.
+
+    In hybrid mode the dense and the sparse (BM25) searches run concurrently and their rankings are
+    fused with weighted reciprocal rank fusion. Collections without sparse vectors, or a failing sparse
+    search, fall back to the dense ranking. On quantized collections the dense search oversamples the
+    quantized vectors and rescores the candidates with the originals.
+    """
+    hybrid = settings.RETRIEVAL_HYBRID_ENABLED if hybrid is None else hybrid
+    query_vector = await get_query_vector(query)
+    tenant = tenant_collection(userId)
+    dense_search = client.search(
+        collection_name=tenant.name,
+        query_vector=models.NamedVector(name=get_vector_name(), vector=query_vector),
+        query_filter=tenant.filter(),
+        search_params=storage_profile().search_params(),
+        limit=max(limit, settings.RETRIEVAL_HYBRID_CANDIDATES) if hybrid else limit,
+        with_payload=RETRIEVAL_PAYLOAD_FIELDS,
+    )
+    sparse_query = get_sparse_encoder().encode_query(query) if hybrid else None
+    if sparse_query is None or not sparse_query.indices:
+        return (await dense_search)[:limit]
+
+    dense_result, sparse_result = await asyncio.gather(dense_search, client.search(
+        collection_name=tenant.name,
+        query_vector=models.NamedSparseVector(name=SPARSE_VECTOR_NAME, vector=sparse_query),
+        query_filter=tenant.filter(),
+        limit=max(limit, settings.RETRIEVAL_HYBRID_CANDIDATES),
+        with_payload=RETRIEVAL_PAYLOAD_FIELDS,
+    ), return_exceptions=True)
+    if isinstance(dense_result, BaseException):
+        raise dense_result
+    if isinstance(sparse_result, BaseException):
+        logger.warning(f"Sparse search failed for {userId}, using the dense ranking only: {sparse_result}")
+        return dense_result[:limit]
+    return reciprocal_rank_fusion(
+        [dense_result, sparse_result],
+        weights=[settings.RETRIEVAL_DENSE_WEIGHT, settings.RETRIEVAL_SPARSE_WEIGHT],
+        k=settings.RETRIEVAL_RRF_K,
+        limit=limit,
+    )
+
+
+def reciprocal_rank_fusion(rankings: List[List[models.ScoredPoint]], weights: List[float], k: int,
+                           limit: int) -> List[models.ScoredPoint]:
+    """Fuse rankings by `sum(weight / (k + rank))` over the rankings a point appears in, ranks start at 1."""
+    fused_scores: Dict[str, float] = {}
+    points: Dict[str, models.ScoredPoint] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, point in enumerate(ranking, start=1):
+            point_id = str(point.id)
+            fused_scores[point_id] = fused_scores.get(point_id, 0.0) + weight / (k + rank)
+            points.setdefault(point_id, point)
+    best = sorted(fused_scores, key=fused_scores.get, reverse=True)[:limit]
+    return [points[point_id].model_copy(update={"score": fused_scores[point_id]}) for point_id in best]
 
-    if not search_result:
-        raise RetrievalNoDocumentsFoundException
-    return "\n".join(result.document for result in search_result)
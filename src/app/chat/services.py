@@ -1,114 +1,210 @@
 import uuid
-import openai
-from openai import ChatCompletion
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from qdrant_client import AsyncQdrantClient
 from starlette.responses import StreamingResponse
 from src.app.chat.constants import ChatRolesEnum
 from src.app.chat.models import BaseMessage, Message
 from src.app.core.logs import logger
 from src.app.settings import settings
-from src.app.chat.streaming import stream_generator, format_to_event_stream
+from src.app.chat.admission import llm_admission
+from src.app.chat.cache import answer_cache, normalize_query
+from src.app.chat.llm import llm_client
+from src.app.chat.memory import conversation_memory
+from src.app.chat.persistence import message_writer
+from src.app.chat.singleflight import Singleflight
+from src.app.chat.streaming import stream_generator, format_to_event_stream, prepend_event, replay_answer
 from src.app.chat.constants import ChatRolesEnum, NO_DOCUMENTS_FOUND
 from src.app.chat.exceptions import RetrievalNoDocumentsFoundException
-from src.app.chat.retrieval import process_retrieval
+from src.app.chat.retrieval import process_retrieval, get_corpus_version, get_query_vector
+from src.app.core.pagination import fetch_page
+from src.app.core.timing import stage_timer
 from src.app.db import messages_queries
 from src.app.chat.models import BaseMessage, Message, ChatSummary
 from uuid import UUID
+from datetime import datetime, timezone
+
+qa_singleflight = Singleflight()
 
 
 class OpenAIService:
     @classmethod
     async def chat_completion_without_streaming(cls, input_message: BaseMessage) -> Message:
-        completion: openai.ChatCompletion = await openai.ChatCompletion.acreate(
-            model=input_message.model,
-            api_key=settings.OPENAI_API_KEY,
-            messages=[{"role": ChatRolesEnum.USER.value,
-                       "content": input_message.augmented_message}]
-        )
+        messages = await cls.build_messages(input_message, input_message.augmented_message)
+        async with llm_admission.slot(input_message.userId):
+            completion = await llm_client.complete(model=input_message.model, messages=messages)
 
         completion = cls.extract_response_from_completion(
             chat_completion=completion)
 
-        try:
-            message_id = uuid.uuid4()
-            messages_queries.insert_message(
-                id=str(message_id),
-                chat_id=str(input_message.chat_id),
-                model=str(input_message.model),
-                user_id=str(input_message.userId),
-                agent_role=str(ChatRolesEnum.ASSISTANT.value),
-                user_message=str(input_message.user_message),
-                answer=str(completion)
-            )
-            logger.info("Message inserted to db successfully")
-
-        except Exception as e:
-            logger.error("Error while inserting message to db: " + str(e))
+        message_writer.add(input_message, completion)
         return Message(
             model=input_message.model,
-            message=completion,
+            answer=completion,
             role=ChatRolesEnum.ASSISTANT.value
         )
 
+    @classmethod
+    async def chat_completion_with_streaming(cls, input_message: BaseMessage,
+                                             on_complete: Optional[Callable[[str], None]] = None) -> StreamingResponse:
+        events = cls.stream_completion(input_message, on_complete=on_complete)
+        # The first event is awaited here so that admission and backend errors still turn into error responses.
+        first_event = await anext(events, None)
+        return StreamingResponse(prepend_event(first_event, events), media_type="text/event-stream")
+
+    @classmethod
+    async def stream_completion(cls, input_message: BaseMessage,
+                                on_complete: Optional[Callable[[str], None]] = None) -> AsyncIterator[bytes]:
+        """Events of a streamed completion, the admission slot is held until the stream ends."""
+        messages = await cls.build_messages(
+            input_message, input_message.augmented_message or input_message.user_message)
+
+        def persist_and_notify(answer: str):
+            message_writer.add(input_message, answer)
+            if on_complete is not None:
+                on_complete(answer)
+
+        async with llm_admission.slot(input_message.userId):
+            subscription = llm_client.stream(model=input_message.model, messages=messages)
+            async for event in stream_generator(subscription, on_complete=persist_and_notify):
+                yield event
+
     @staticmethod
-    async def chat_completion_with_streaming(input_message: BaseMessage) -> StreamingResponse:
-        subscription: openai.ChatCompletion = await openai.ChatCompletion.acreate(
-            model=input_message.model,
-            api_key=settings.OPENAI_API_KEY,
-            messages=[{"role": ChatRolesEnum.USER.value,
-                       "content": input_message.user_message}],
-            stream=True,
-        )
-        return StreamingResponse(stream_generator(subscription), media_type="text/event-stream")
+    async def build_messages(input_message: BaseMessage, content: str) -> List[Dict[str, str]]:
+        """The chat history fitted by the conversation memory followed by the current message."""
+        with stage_timer.measure("prompt.assemble"):
+            history = []
+            if settings.MEMORY_ENABLED and input_message.chat_id:
+                history = await conversation_memory.history(chat_id=input_message.chat_id, model=input_message.model)
+            return [*history, {"role": ChatRolesEnum.USER.value, "content": content}]
+
+    @staticmethod
+    def extract_response_from_completion(chat_completion: Dict) -> str:
+        return chat_completion["choices"][0]["message"]["content"]
 
     @staticmethod
-    def extract_response_from_completion(chat_completion: ChatCompletion) -> str:
-        return chat_completion.choices[0]["message"]["content"]
+    async def answer_cache_context(input_message: BaseMessage,
+                                   client: AsyncQdrantClient) -> Optional[Tuple[Optional[str], List[float], int]]:
+        """
+        Chat, query vector and corpus version used to read and fill the answer cache, None when it is disabled.
+
+        The chat is only part of the key with the conversation memory on, answers are shared between
+        the chats of a user otherwise.
+        """
+        if not settings.ANSWER_CACHE_ENABLED or not input_message.userId:
+            return None
+        corpus_version = await get_corpus_version(client=client, userId=input_message.userId)
+        if corpus_version is None:
+            return None
+        chat_id = input_message.chat_id if settings.MEMORY_ENABLED else None
+        return chat_id, await get_query_vector(input_message.user_message), corpus_version
+
+    @staticmethod
+    def singleflight_key(input_message: BaseMessage) -> Tuple:
+        # The chat is part of the key, the history sent with the question differs between chats.
+        return (input_message.userId, input_message.chat_id, normalize_query(input_message.user_message),
+                str(input_message.model))
+
+    @classmethod
+    async def qa_without_stream(cls, input_message: BaseMessage, client: AsyncQdrantClient) -> Message:
+        cache_context = await cls.answer_cache_context(input_message=input_message, client=client)
+        if cache_context is not None:
+            cached_answer = answer_cache.lookup(input_message.userId, input_message.model, *cache_context)
+            if cached_answer is not None:
+                logger.info("Answer served from the semantic cache.")
+                message_writer.add(input_message, cached_answer)
+                return Message(model=input_message.model, answer=cached_answer, role=ChatRolesEnum.ASSISTANT.value)
+
+        if not settings.QA_SINGLEFLIGHT_ENABLED:
+            return await cls.qa_answer(input_message, client, cache_context)
+        return await qa_singleflight.run(cls.singleflight_key(input_message),
+                                         lambda: cls.qa_answer(input_message, client, cache_context))
 
     @classmethod
-    async def qa_without_stream(cls, input_message: BaseMessage) -> Message:
+    async def qa_answer(cls, input_message: BaseMessage, client: AsyncQdrantClient,
+                        cache_context: Optional[Tuple[Optional[str], List[float], int]]) -> Message:
         try:
-            augmented_message = process_retrieval(
-                message=input_message)
+            augmented_message = await process_retrieval(
+                message=input_message, client=client)
             logger.info("Context retrieved successfully.")
-            return await cls.chat_completion_without_streaming(input_message=augmented_message)
+            answer = await cls.chat_completion_without_streaming(input_message=augmented_message)
+            if cache_context is not None:
+                answer_cache.store(input_message.userId, input_message.model, *cache_context, answer=answer.answer)
+            return answer
         except RetrievalNoDocumentsFoundException:
-            return Message(model=input_message.model, message=NO_DOCUMENTS_FOUND, role=ChatRolesEnum.ASSISTANT.value)
+            return Message(model=input_message.model, answer=NO_DOCUMENTS_FOUND, role=ChatRolesEnum.ASSISTANT.value)
 
     @classmethod
-    async def qa_with_stream(cls, input_message: BaseMessage) -> StreamingResponse:
+    async def qa_with_stream(cls, input_message: BaseMessage, client: AsyncQdrantClient) -> StreamingResponse:
+        cache_context = await cls.answer_cache_context(input_message=input_message, client=client)
+        if cache_context is not None:
+            cached_answer = answer_cache.lookup(input_message.userId, input_message.model, *cache_context)
+            if cached_answer is not None:
+                logger.info("Answer served from the semantic cache.")
+                message_writer.add(input_message, cached_answer)
+                return StreamingResponse(replay_answer(cached_answer, model=input_message.model),
+                                         media_type="text/event-stream")
+
+        if not settings.QA_SINGLEFLIGHT_ENABLED:
+            events = cls.qa_events(input_message, client, cache_context)
+        else:
+            events = qa_singleflight.stream(cls.singleflight_key(input_message),
+                                            lambda: cls.qa_events(input_message, client, cache_context))
+        # The first event is awaited here so that retrieval, admission and backend errors still turn into error responses.
+        first_event = await anext(events, None)
+        return StreamingResponse(prepend_event(first_event, events), media_type="text/event-stream")
+
+    @classmethod
+    async def qa_events(cls, input_message: BaseMessage, client: AsyncQdrantClient,
+                        cache_context: Optional[Tuple[Optional[str], List[float], int]]):
+        on_complete = None
+        if cache_context is not None:
+            def on_complete(answer: str):
+                answer_cache.store(input_message.userId, input_message.model, *cache_context, answer=answer)
+
         try:
-            augmented_message: BaseMessage = process_retrieval(
-                message=input_message)
-            logger.info("Context retrieved successfully.")
-            return await cls.chat_completion_with_streaming(input_message=augmented_message)
+            augmented_message: BaseMessage = await process_retrieval(
+                message=input_message, client=client)
         except RetrievalNoDocumentsFoundException:
-            return StreamingResponse(
-                (format_to_event_stream(y) for y in "Not found"),
-                media_type="text/event-stream",
-            )
+            for y in "Not found":
+                yield format_to_event_stream(y)
+            return
+        logger.info("Context retrieved successfully.")
+        async for event in cls.stream_completion(input_message=augmented_message, on_complete=on_complete):
+            yield event
 
 
 class ChatServices:
     @classmethod
-    def get_messages(cls, user_id: str) -> list[Message]:
-        return [Message(**message) for message in messages_queries.select_messages_by_user(user_id=user_id)]
+    async def get_messages(cls, user_id: str, limit: int, before: Optional[str] = None) -> Tuple[list[Message], Optional[str]]:
+        messages, next_cursor = await fetch_page(
+            messages_queries.select_messages_by_user, messages_queries.select_messages_by_user_before,
+            limit=limit, before=before, user_id=user_id)
+        return [Message(**message) for message in messages], next_cursor
 
     @classmethod
-    def get_chats(cls, user_id: str) -> list[ChatSummary]:
-        return [ChatSummary(**chat) for chat in messages_queries.select_chats_by_user(user_id=user_id)]
+    async def get_chats(cls, user_id: str, limit: int, before: Optional[str] = None) -> Tuple[list[ChatSummary], Optional[str]]:
+        chats, next_cursor = await fetch_page(
+            messages_queries.select_chats_by_user, messages_queries.select_chats_by_user_before,
+            limit=limit, before=before, user_id=user_id)
+        return [ChatSummary(**chat) for chat in chats], next_cursor
 
     @classmethod
-    def get_chat_messages(cls, chat_id) -> list[Message]:
-        return [Message(**message) for message in messages_queries.select_messages_by_chat(chat_id=chat_id)]
+    async def get_chat_messages(cls, chat_id, limit: int, before: Optional[str] = None) -> Tuple[list[Message], Optional[str]]:
+        """The latest messages of the chat before the cursor, in chronological order."""
+        messages, next_cursor = await fetch_page(
+            messages_queries.select_messages_by_chat, messages_queries.select_messages_by_chat_before,
+            limit=limit, before=before, chat_id=str(chat_id))
+        return [Message(**message) for message in reversed(messages)], next_cursor
 
     @classmethod
-    def get_chat(cls, chat_id) -> ChatSummary:
-        return ChatSummary(**messages_queries.select_chat_by_id(chat_id=chat_id))
+    async def get_chat(cls, chat_id) -> ChatSummary:
+        return ChatSummary(**await messages_queries.select_chat_by_id(chat_id=str(chat_id)))
 
     @classmethod
     async def create_chat(cls, chat: ChatSummary):
         try:
-            messages_queries.insert_chat(
+            await messages_queries.insert_chat(
                 id=str(chat.id),
                 user_id=str(chat.user_id),
                 title=chat.title,
@@ -123,5 +219,15 @@ class ChatServices:
             logger.error(f"Error creating chat: {e}")
 
     @classmethod
-    def create_message(cls, message) -> Message:
-        return Message(**messages_queries.insert_message(message=message))
+    async def create_message(cls, message: Message) -> Message:
+        await messages_queries.insert_message(
+            id=message.id or str(uuid.uuid4()),
+            chat_id=str(message.chat_id),
+            model=str(message.model),
+            user_id=str(message.userId),
+            agent_role=str(message.agent_role),
+            user_message=str(message.user_message),
+            answer=str(message.answer),
+            created_at=datetime.now(timezone.utc),
+        )
+        return message
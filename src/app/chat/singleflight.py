@@ -0,0 +1,92 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class _Broadcast:
+    """Events of one in-flight stream, replayed to every subscriber from the first event."""
+
+    def __init__(self):
+        self.events: List[Any] = []
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self._changed = asyncio.Event()
+
+    async def pump(self, source: AsyncIterator):
+        try:
+            async for event in source:
+                self.events.append(event)
+                self._notify()
+        except BaseException as e:
+            self.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        # Waiters hold the previous event, a fresh one is armed for the next change.
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self) -> AsyncIterator:
+        index = 0
+        while True:
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class Singleflight:
+    """
+    Per process coalescing of identical concurrent calls.
+
+    The first caller of a key starts the work in its own task, callers arriving while it is in flight share
+    its result, or replay and follow its event stream. The work outlives a caller that disconnects, the
+    others still get the result. Keys are forgotten as soon as the work finishes, nothing is cached.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._streams: Dict[Hashable, _Broadcast] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, work: Callable[[], Awaitable]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.create_task(work())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(self._calls, key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stream(self, key: Hashable, work: Callable[[], AsyncIterator]) -> AsyncIterator:
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            self.leaders += 1
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            task = asyncio.create_task(broadcast.pump(work()))
+            task.add_done_callback(lambda done: self._forget(self._streams, key, broadcast))
+        else:
+            self.coalesced += 1
+        return broadcast.subscribe()
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._calls) + len(self._streams), "leaders": self.leaders, "coalesced": self.coalesced}
+
+    @staticmethod
+    def _forget(in_flight: Dict, key: Hashable, value):
+        if in_flight.get(key) is value:
+            del in_flight[key]
+        if isinstance(value, asyncio.Task) and not value.cancelled():
+            # Retrieved here so that a failure every caller already gave up on is not reported as unhandled.
+            value.exception()
@@ -1,38 +1,168 @@
 import asyncio
-import json
+import time
+import uuid
+from json.encoder import encode_basestring_ascii
+from typing import AsyncIterator, Callable, List, Optional, Tuple
 
-import async_timeout
-
-from src.app.chat.constants import ChatRolesEnum
 from src.app.chat.exceptions import OpenAIStreamTimeoutException, OpenAIFailedProcessingException
-from src.app.chat.models import Chunk, Message
 from src.app.core.logs import logger
+from src.app.core.timing import stage_timer
 from src.app.settings import settings
 
+EVENT_PREFIX: str = "event: message\ndata: "
+EVENT_SUFFIX: bytes = b"}\n\n"
+FINISH_REASON_FIELD: bytes = b', "finish_reason": '
+NULL: bytes = b"null"
+_FLUSH = object()
+_END = object()
+
+
+class EventStreamEncoder:
+    """
+    Serializes the events of one completion stream without building a `Chunk` per token.
+
+    The bytes are the same as `json.dumps(Chunk(...).model_dump())` in an SSE `message` event. The
+    `id`, `created` and `model` fields only change between completions, they are rendered once
+    into a byte prefix and every event only escapes its content.
+    """
 
-async def stream_generator(subscription):
-    async with async_timeout.timeout(settings.GENERATION_TIMEOUT_SEC):
+    def __init__(self):
+        self._header: Optional[tuple] = None
+        self._prefix: bytes = b""
+
+    def parse(self, chunk) -> Tuple[str, Optional[str]]:
+        """Read the delta content and finish reason of an OpenAI stream chunk, following the ids of the chunk."""
         try:
-            complete_response: str = ""
-            async for chunk in subscription:
-                complete_response = f"{complete_response}{Chunk.get_chunk_delta_content(chunk=chunk)}"
-                yield format_to_event_stream(post_processing(chunk))
-            message: Message = Message(
-                model=chunk.model, message=complete_response, role=ChatRolesEnum.ASSISTANT.value)
-            logger.info(f"Complete Streamed Message: {message}")
-        except asyncio.TimeoutError:
-            raise OpenAIStreamTimeoutException
+            self.set_header(chunk["id"], chunk["created"], chunk["model"])
+            choice = chunk["choices"][0]
+            return choice["delta"].get("content") or "", choice.get("finish_reason")
+        except Exception:
+            raise OpenAIFailedProcessingException
 
+    def set_header(self, chunk_id: str, created: int, model: str):
+        header = (chunk_id, created, model)
+        if header != self._header:
+            self._header = header
+            self._prefix = (
+                f'{EVENT_PREFIX}{{"id": {encode_basestring_ascii(str(chunk_id))}, "created": {int(created)}, '
+                f'"model": {encode_basestring_ascii(str(model))}, "content": '
+            ).encode()
+
+    def encode(self, content: str, finish_reason: Optional[str] = None) -> bytes:
+        return b"".join((
+            self._prefix,
+            encode_basestring_ascii(content).encode(),
+            FINISH_REASON_FIELD,
+            encode_basestring_ascii(finish_reason).encode() if finish_reason is not None else NULL,
+            EVENT_SUFFIX,
+        ))
+
+
+async def stream_generator(subscription, on_complete: Optional[Callable[[str], None]] = None,
+                           coalesce_ms: int = settings.STREAM_COALESCE_MS,
+                           coalesce_tokens: int = settings.STREAM_COALESCE_TOKENS):
+    """
+    Relay an OpenAI completion stream as server sent events.
+
+    By default every delta is sent as its own event. With `coalesce_ms` or `coalesce_tokens` set, deltas are
+    held back and sent together once the oldest held delta is `coalesce_ms` old or `coalesce_tokens`
+    deltas are held, whichever comes first.
+    """
+    encoder = EventStreamEncoder()
+    answer: List[str] = []
+    started_at = time.perf_counter()
+    try:
+        async with asyncio.timeout(settings.GENERATION_TIMEOUT_SEC):
+            if coalesce_ms > 0 or coalesce_tokens > 1:
+                events = _coalesced_events(subscription, encoder, answer, coalesce_ms / 1000, coalesce_tokens)
+            else:
+                events = _events(subscription, encoder, answer)
+            async for event in events:
+                yield event
+    except TimeoutError:
+        raise OpenAIStreamTimeoutException
+
+    stage_timer.record("stream.relay", time.perf_counter() - started_at)
+    complete_response = "".join(answer)
+    logger.info(f"Complete Streamed Message: {len(complete_response)} characters.")
+    if on_complete is not None:
+        on_complete(complete_response)
 
-def format_to_event_stream(data: str) -> str:
-    return f"event: message\ndata: {data}\n\n"
 
+async def _events(subscription, encoder: EventStreamEncoder, answer: List[str]) -> AsyncIterator[bytes]:
+    async for chunk in subscription:
+        content, finish_reason = encoder.parse(chunk)
+        answer.append(content)
+        yield encoder.encode(content, finish_reason)
 
-def post_processing(chunk) -> str:
+
+async def _coalesced_events(subscription, encoder: EventStreamEncoder, answer: List[str],
+                            interval_sec: float, max_tokens: int) -> AsyncIterator[bytes]:
+    # A pump task reads the subscription into a queue and a loop timer drops a flush marker into the same queue,
+    # so that held deltas go out on time even when the model stalls, without a task or timeout per delta.
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    pump = asyncio.create_task(_pump(subscription, queue))
+    pending: List[str] = []
+    flush_timer: Optional[asyncio.TimerHandle] = None
     try:
-        logger.info(f"Chunk: {chunk}")
-        formatted_chunk = Chunk.from_chunk(chunk=chunk)
-        logger.info(f"Formatted Chunk: {formatted_chunk}")
-        return json.dumps(formatted_chunk.model_dump())
-    except Exception:
-        raise OpenAIFailedProcessingException
+        while True:
+            item = await queue.get()
+            if item is _FLUSH:
+                flush_timer = None
+                if pending:
+                    yield encoder.encode("".join(pending))
+                    pending.clear()
+                continue
+            if item is _END:
+                break
+            if isinstance(item, BaseException):
+                raise item
+
+            content, finish_reason = encoder.parse(item)
+            answer.append(content)
+            pending.append(content)
+            if finish_reason is not None or (max_tokens and len(pending) >= max_tokens):
+                yield encoder.encode("".join(pending), finish_reason)
+                pending.clear()
+                if flush_timer is not None:
+                    flush_timer.cancel()
+                    flush_timer = None
+            elif flush_timer is None and interval_sec > 0:
+                flush_timer = loop.call_later(interval_sec, queue.put_nowait, _FLUSH)
+        if pending:
+            yield encoder.encode("".join(pending))
+    finally:
+        if flush_timer is not None:
+            flush_timer.cancel()
+        pump.cancel()
+
+
+async def _pump(subscription, queue: asyncio.Queue):
+    try:
+        async for chunk in subscription:
+            queue.put_nowait(chunk)
+        queue.put_nowait(_END)
+    except Exception as e:
+        queue.put_nowait(e)
+
+
+async def replay_answer(answer: str, model: str):
+    """Replay a stored answer with the same events as a live stream, content first then the finish event."""
+    encoder = EventStreamEncoder()
+    encoder.set_header(f"cached-{uuid.uuid4()}", int(time.time()), model)
+    yield encoder.encode(answer)
+    yield encoder.encode("", "stop")
+
+
+async def prepend_event(event, events: AsyncIterator):
+    """Put back an event already read from the stream, None stands for an empty stream."""
+    if event is None:
+        return
+    yield event
+    async for event in events:
+        yield event
+
+
+def format_to_event_stream(data: str) -> str:
+    return f"event: message\ndata: {data}\n\n"
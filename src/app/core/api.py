@@ -1,19 +1,26 @@
+import asyncio
 import os
+import shutil
+import uuid
 from fastapi import APIRouter, UploadFile, File, Form
-from fastapi import HTTPException
 
+from src.app.chat.admission import llm_admission
+from src.app.core.constants import SUPPORTED_FILE_EXTENSIONS
+from src.app.core.exceptions import UnsupportedFileTypeException, IngestJobNotFoundException
+from src.app.core.jobs import ingest_jobs
 from src.app.core.logs import logger
+from src.app.core.metrics import metrics_response
+from src.app.core.models import IngestJob
+from src.app.core.process import startup_report
+from src.app.core.timing import stage_timer
+from src.app.db import messages_queries
+from src.app.settings import settings
 
 from starlette import status
 from starlette.requests import Request
-from qdrant_client import QdrantClient
-
-from src.app.scripts.ingest import extract_text_from_file
-from src.app.settings import settings
-from src.app.scripts.ingest import text_chunking_and_qdrant_upload
+from starlette.responses import Response
 from typing import List
 
-client = QdrantClient(host=settings.QDRANT_HOST, port=settings.QDRANT_PORT)
 router = APIRouter(tags=['Core Endpoints'])
 
 
@@ -24,35 +31,78 @@ async def healthCheck(request: Request) -> dict:
     }
 
 
-@router.post("/v1/upload-document")
+@router.get('/healthCheck/database')
+async def database_health_check(response: Response) -> dict:
+    health = await messages_queries.health()
+    if not health["healthy"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return health
+
+
+@router.get('/healthCheck/llm')
+async def llm_health_check() -> dict:
+    return llm_admission.stats()
+
+
+@router.get('/healthCheck/stages')
+async def stages_health_check() -> dict:
+    return stage_timer.stats()
+
+
+@router.get('/healthCheck/worker')
+async def worker_health_check() -> dict:
+    return startup_report.stats()
+
+
+@router.get('/metrics')
+async def metrics() -> Response:
+    return metrics_response()
+
+
+def save_upload(file: UploadFile, file_location: str):
+    # The upload is already spooled to a temporary file, it is copied block by block, never read whole.
+    file.file.seek(0)
+    os.makedirs(os.path.dirname(file_location), exist_ok=True)
+    with open(file_location, "wb") as f:
+        shutil.copyfileobj(file.file, f, settings.INGEST_READ_BLOCK_BYTES)
+
+
+@router.post("/v1/upload-document", status_code=status.HTTP_202_ACCEPTED)
 async def upload_document(files: List[UploadFile] = File(...), userId: str = Form(...)):
-    file_names = []    
-    for file in files:        
-        contents = await file.read()
-        print(file)
-        file_location = f"data/{file.filename}"
-        with open(file_location, "wb") as f:
-            f.write(contents)
+    for file in files:
+        if not file.filename.lower().endswith(SUPPORTED_FILE_EXTENSIONS):
+            logger.error(
+                f"File upload failed for {file.filename}, unsupported file type.")
+            raise UnsupportedFileTypeException
+
+    job_id = str(uuid.uuid4())
+    file_names = []
+    uploaded_files = []
+    for file in files:
+        # The client's name is only kept as metadata, every upload gets its own path under the job's directory.
+        file_name = os.path.basename(file.filename)
+        file_location = f"data/{job_id}/{uuid.uuid4()}{os.path.splitext(file_name)[1].lower()}"
+        await asyncio.to_thread(save_upload, file, file_location)
 
         file_metadata = {
-            "file_name": file.filename,
+            "file_name": file_name,
             "file_size": os.path.getsize(file_location),
-            "file_extension": file.filename.split(".")[-1],
-            "file_type": file.filename.split(".")[-1].replace(".", ""),
+            "file_extension": file_name.split(".")[-1],
+            "file_type": file_name.split(".")[-1].replace(".", ""),
         }
-        file_names.append(file.filename)
-        text = extract_text_from_file(file_location)
-
-        if text is None:
-            logger.error(
-                f"File upload failed for {file.filename}, unsupported file type or content could not be extracted.")
+        file_names.append(file_name)
+        uploaded_files.append((file_location, file_metadata))
 
-            raise HTTPException(
-                status_code=422, detail="Unsupported file type or content could not be extracted.")
+    job = await ingest_jobs.submit(user_id=userId, files=uploaded_files, job_id=job_id)
+    return {'job_id': job.id, 'files_names': file_names}
 
-        text_chunking_and_qdrant_upload(text, file_metadata, userId)
 
-    return {'files_names': file_names}
+@router.get("/v1/ingest-jobs/{job_id}")
+async def get_ingest_job(job_id: str) -> IngestJob:
+    job = await ingest_jobs.get(job_id)
+    if job is None:
+        raise IngestJobNotFoundException
+    return job
 
 
 @router.get("/v1/documents")
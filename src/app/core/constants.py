@@ -7,3 +7,38 @@ class Environments(StrEnum):
     LOCAL = "local"
     DEV = "dev"
     PROD = "prod"
+
+class QdrantLayoutEnum(StrEnum):
+    # One collection per user, named by the user id.
+    PER_USER = "per_user"
+    # The QDRANT_COLLECTION_NAME collection, points carry their user id in the payload.
+    SHARED = "shared"
+
+
+class StorageProfileEnum(StrEnum):
+    # float32 vectors in RAM, default HNSW parameters.
+    DEFAULT = "default"
+    # float32 vectors memory mapped from disk.
+    ON_DISK = "on_disk"
+    # int8 quantized vectors in RAM, float32 originals on disk for rescoring.
+    SCALAR = "scalar"
+    # 1 bit quantized vectors in RAM, float32 originals on disk for rescoring.
+    BINARY = "binary"
+
+
+SUPPORTED_FILE_EXTENSIONS: tuple[str, ...] = (".pdf", ".txt", ".docx")
+
+
+class IngestJobStatusEnum(StrEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class IngestFileStatusEnum(StrEnum):
+    QUEUED = "queued"
+    EXTRACTING = "extracting"
+    UPLOADING = "uploading"
+    COMPLETED = "completed"
+    FAILED = "failed"
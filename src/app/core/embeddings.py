@@ -0,0 +1,71 @@
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional
+
+from fastembed.embedding import DefaultEmbedding
+from qdrant_client import models
+from qdrant_client.qdrant_fastembed import SUPPORTED_EMBEDDING_MODELS
+
+from src.app.settings import settings
+
+
+# Set when the model is loaded before gunicorn forks its workers.
+_preloading = False
+
+
+@lru_cache(maxsize=None)
+def get_embedding_model(model_name: str = settings.EMBEDDING_MODEL) -> DefaultEmbedding:
+    threads = settings.EMBEDDING_THREADS
+    if threads is None and _preloading:
+        # An onnxruntime session is not fork safe once its intra-op thread pool runs, with a single thread
+        # inference runs on the calling thread and the session keeps working in the forked workers.
+        threads = 1
+    return DefaultEmbedding(model_name=model_name, threads=threads)
+
+
+def preload_embedding_model(model_name: str = settings.EMBEDDING_MODEL) -> DefaultEmbedding:
+    """
+    Load the model in the gunicorn master, the forked workers share its memory copy-on-write
+    and find it in the `get_embedding_model` cache instead of loading their own.
+    """
+    global _preloading
+    _preloading = True
+    return get_embedding_model(model_name)
+
+
+def get_vector_name(model_name: str = settings.EMBEDDING_MODEL) -> str:
+    # Same naming as the qdrant_client fastembed integration, collections created by `QdrantClient.add` stay readable.
+    return f"fast-{model_name.split('/')[-1].lower()}"
+
+
+def get_vector_params(model_name: str = settings.EMBEDDING_MODEL) -> models.VectorParams:
+    size, distance = SUPPORTED_EMBEDDING_MODELS[model_name]
+    return models.VectorParams(size=size, distance=distance)
+
+
+def embed_query(query: str, model_name: str = settings.EMBEDDING_MODEL) -> List[float]:
+    return next(iter(get_embedding_model(model_name).query_embed(query))).tolist()
+
+
+class EmbeddingStage:
+    """
+    Passage embedding step of ingestion.
+
+    Documents are embedded lazily in batches of `batch_size`. With `parallel` set, fastembed spreads
+    the batches over that many worker processes, 0 meaning one per core, otherwise onnxruntime
+    threads of the current process are used.
+    """
+
+    def __init__(self, model_name: str = settings.EMBEDDING_MODEL, batch_size: int = settings.EMBEDDING_BATCH_SIZE,
+                 parallel: Optional[int] = settings.EMBEDDING_PARALLEL):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.parallel = parallel
+
+    @property
+    def vector_name(self) -> str:
+        return get_vector_name(self.model_name)
+
+    def embed(self, documents: Iterable[str]) -> Iterator[List[float]]:
+        vectors = get_embedding_model(self.model_name).passage_embed(
+            documents, batch_size=self.batch_size, parallel=self.parallel)
+        return (vector.tolist() for vector in vectors)
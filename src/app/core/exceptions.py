@@ -0,0 +1,20 @@
+from fastapi import HTTPException
+from starlette import status
+
+from src.app.core.constants import SUPPORTED_FILE_EXTENSIONS
+
+
+class UnsupportedFileTypeException(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                         detail=f"Unsupported file type, expected one of: {', '.join(SUPPORTED_FILE_EXTENSIONS)}.")
+
+
+class IngestJobNotFoundException(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=status.HTTP_404_NOT_FOUND, detail="Ingest job not found.")
+
+
+class InvalidCursorException(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor.")
@@ -0,0 +1,284 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.managers import SyncManager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import asyncpg
+from qdrant_client import AsyncQdrantClient
+
+from src.app.chat.cache import answer_cache
+from src.app.core.constants import IngestJobStatusEnum, IngestFileStatusEnum
+from src.app.core.logs import logger
+from src.app.core.timing import stage_timer
+from src.app.core.models import IngestJob, IngestFileProgress
+from src.app.db import jobs_queries
+from src.app.scripts.chunking import TextChunk
+from src.app.scripts.ingest import UploadResult, extract_chunks_from_file, chunks_qdrant_upload, hash_file
+from src.app.settings import settings
+
+
+class IngestJobManager:
+    """
+    Runs document ingestion in the background so that uploads return immediately.
+
+    Extraction and chunking run lazily in a process pool, PDF page ranges in parallel tasks and other files
+    in a task streaming batches of chunks through a bounded manager queue, so that they do not compete with
+    the event loop for the GIL. Embedding batches run in a thread while the previous batch is upserted through
+    the application Qdrant client. No stage holds a whole file.
+    At most `max_concurrent_files` files are processed at once per worker.
+
+    Jobs are stored in the `ingest_jobs` table so that any worker can report them. The worker running a job
+    writes its progress every `INGEST_JOB_SAVE_INTERVAL_SEC` and touches it every `INGEST_JOB_HEARTBEAT_SEC`,
+    a queued or running job left untouched for `INGEST_JOB_STALE_SEC`, e.g. by a restart, is claimed by
+    another worker and its unfinished files are ingested again. Without a database pool jobs only live in
+    the memory of the worker that accepted them.
+    """
+
+    def __init__(self, max_concurrent_files: int, process_workers: int, max_retained_jobs: int):
+        self._process_workers = process_workers
+        self._max_retained_jobs = max_retained_jobs
+        self._semaphore = asyncio.Semaphore(max_concurrent_files)
+        self._jobs: OrderedDict[str, IngestJob] = OrderedDict()
+        self._uploads: Dict[str, List[Tuple[str, Dict]]] = {}
+        self._unsaved: Set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._sync_task: Optional[asyncio.Task] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager: Optional[SyncManager] = None
+        self._client: Optional[AsyncQdrantClient] = None
+
+    def start(self, client: AsyncQdrantClient):
+        self._client = client
+        # spawn keeps the workers free of the event loop and threads of the parent process.
+        context = multiprocessing.get_context("spawn")
+        self._executor = ProcessPoolExecutor(max_workers=self._process_workers, mp_context=context)
+        self._manager = context.Manager()
+        self._sync_task = asyncio.create_task(self._sync())
+
+    async def shutdown(self):
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+            self._sync_task = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        # Interrupted jobs are saved as they are, another worker resumes them once they are stale.
+        await self._save_unsaved()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+        self._client = None
+
+    async def get(self, job_id: str) -> Optional[IngestJob]:
+        """The job as known to this worker, or as last saved by the worker running it."""
+        job = self._jobs.get(job_id)
+        if job is not None or not jobs_queries.connected:
+            return job
+        try:
+            row = await jobs_queries.select_ingest_job(id=job_id)
+        except asyncpg.DataError:
+            # Not a uuid, no job can have this id.
+            return None
+        return self._job_from_row(row) if row is not None else None
+
+    async def submit(self, user_id: str, files: List[Tuple[str, Dict]], job_id: Optional[str] = None) -> IngestJob:
+        """
+        Register a job for the given files and schedule it on the running event loop.
+
+        params:
+        -------
+            user_id: str
+                The user id of the user who uploaded the files.
+            files: list[tuple[str, dict]]
+                The location on disk and the metadata of every uploaded file, the files are
+                deleted once ingested.
+            job_id: str, optional
+                The id of the job, e.g. when its files were saved under it, a new one by default.
+
+        returns:
+        --------
+            job: IngestJob
+                The queued job, saved before it is returned so that every worker can report it.
+        """
+        job = IngestJob(
+            id=job_id or str(uuid.uuid4()),
+            user_id=user_id,
+            files=[IngestFileProgress(file_name=file_metadata["file_name"]) for _, file_metadata in files],
+        )
+        self._uploads[job.id] = files
+        await self._save(job)
+        self._schedule(job)
+        return job
+
+    def _schedule(self, job: IngestJob):
+        self._remember(job)
+        task = asyncio.create_task(self._run_job(job, self._uploads[job.id]))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _remember(self, job: IngestJob):
+        self._jobs[job.id] = job
+        while len(self._jobs) > self._max_retained_jobs:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.status in (IngestJobStatusEnum.QUEUED, IngestJobStatusEnum.RUNNING):
+                break
+            del self._jobs[oldest_id]
+
+    def _changed(self, job: IngestJob):
+        self._unsaved.add(job.id)
+
+    async def _save(self, job: IngestJob):
+        if not jobs_queries.connected:
+            return
+        try:
+            await jobs_queries.upsert_ingest_job(
+                id=job.id,
+                user_id=job.user_id,
+                status=str(job.status),
+                files=json.dumps([progress.model_dump(mode="json") for progress in job.files]),
+                uploads=json.dumps(self._uploads.get(job.id, [])),
+                created_at=job.created_at,
+                finished_at=job.finished_at,
+            )
+        except Exception as e:
+            logger.error(f"Ingest job {job.id} could not be saved: {e}")
+
+    async def _save_unsaved(self):
+        unsaved, self._unsaved = self._unsaved, set()
+        for job_id in unsaved:
+            if job_id in self._jobs:
+                await self._save(self._jobs[job_id])
+
+    async def _sync(self):
+        """Save changed jobs, touch the running ones and resume stale jobs of other workers."""
+        last_heartbeat = time.monotonic()
+        while True:
+            await asyncio.sleep(settings.INGEST_JOB_SAVE_INTERVAL_SEC)
+            if time.monotonic() - last_heartbeat >= settings.INGEST_JOB_HEARTBEAT_SEC:
+                last_heartbeat = time.monotonic()
+                self._unsaved.update(job.id for job in self._jobs.values()
+                                     if job.status in (IngestJobStatusEnum.QUEUED, IngestJobStatusEnum.RUNNING))
+                await self._resume_stale()
+            await self._save_unsaved()
+
+    async def _resume_stale(self):
+        if not jobs_queries.connected:
+            return
+        try:
+            rows = await jobs_queries.claim_stale_ingest_jobs(
+                stale_sec=settings.INGEST_JOB_STALE_SEC, limit=settings.INGEST_MAX_CONCURRENT_FILES)
+        except Exception as e:
+            logger.error(f"Stale ingest jobs could not be claimed: {e}")
+            return
+        for row in rows:
+            job = self._job_from_row(row)
+            self._uploads[job.id] = [tuple(upload) for upload in json.loads(row["uploads"])]
+            logger.info(f"Resuming ingest job {job.id} left by another worker.")
+            self._schedule(job)
+
+    @staticmethod
+    def _job_from_row(row: Dict) -> IngestJob:
+        return IngestJob(**{**row, "files": json.loads(row["files"])})
+
+    async def _run_job(self, job: IngestJob, files: List[Tuple[str, Dict]]):
+        job.status = IngestJobStatusEnum.RUNNING
+        self._changed(job)
+        await asyncio.gather(*(
+            self._ingest_file(job, progress, file_location, file_metadata)
+            for progress, (file_location, file_metadata) in zip(job.files, files)
+            # A resumed job only ingests the files its previous worker did not finish.
+            if progress.status not in (IngestFileStatusEnum.COMPLETED, IngestFileStatusEnum.FAILED)
+        ))
+        for directory in {os.path.dirname(file_location) for file_location, _ in files}:
+            try:
+                # The directory of the upload request, left alone if anything else is still in it.
+                os.rmdir(directory)
+            except OSError:
+                pass
+        if all(progress.status == IngestFileStatusEnum.FAILED for progress in job.files):
+            job.status = IngestJobStatusEnum.FAILED
+        else:
+            job.status = IngestJobStatusEnum.COMPLETED
+        job.finished_at = datetime.utcnow()
+        self._uploads.pop(job.id, None)
+        self._changed(job)
+        logger.info(f"Ingest job {job.id} finished with status {job.status}.")
+
+    @staticmethod
+    def _counted_chunks(progress: IngestFileProgress,
+                        pieces: Iterator[Tuple[Optional[int], List[TextChunk]]]) -> Iterator[TextChunk]:
+        page_no = object()
+        for piece_page_no, chunks in pieces:
+            # Text files and documents come in many pieces of a single unnumbered page.
+            if piece_page_no != page_no:
+                progress.pages += 1
+                page_no = piece_page_no
+            yield from chunks
+
+    async def _ingest_file(self, job: IngestJob, progress: IngestFileProgress, file_location: str, file_metadata: Dict):
+        async with self._semaphore:
+            started_at = time.perf_counter()
+            progress.pages = progress.chunks = progress.chunks_embedded = progress.chunks_reused = 0
+            try:
+                progress.status = IngestFileStatusEnum.EXTRACTING
+                self._changed(job)
+                file_metadata = {**file_metadata, "file_hash": await asyncio.to_thread(hash_file, file_location)}
+                pieces = extract_chunks_from_file(file_location, executor=self._executor, manager=self._manager)
+                if pieces is None:
+                    raise ValueError("Unsupported file type.")
+
+                def uploaded(result: UploadResult):
+                    # Extraction goes on while the first batches are uploaded.
+                    progress.status = IngestFileStatusEnum.UPLOADING
+                    progress.chunks_embedded, progress.chunks_reused = result
+                    progress.chunks = result.embedded + result.reused
+                    self._changed(job)
+
+                result = await chunks_qdrant_upload(
+                    self._client, self._counted_chunks(progress, pieces), file_metadata, job.user_id, on_batch=uploaded)
+                if not result.embedded + result.reused:
+                    raise ValueError("Content could not be extracted.")
+                # Reused vectors add points as well, every ingest outdates the cached answers.
+                answer_cache.invalidate_user(job.user_id)
+                progress.status = IngestFileStatusEnum.COMPLETED
+                stage_timer.record("ingest.file", time.perf_counter() - started_at)
+            except asyncio.CancelledError:
+                if jobs_queries.connected:
+                    # Interrupted by a shutdown, the file is kept for the worker that resumes the job.
+                    progress.status = IngestFileStatusEnum.QUEUED
+                    self._changed(job)
+                    raise
+                progress.status = IngestFileStatusEnum.FAILED
+                progress.error = "Ingestion was cancelled."
+                self._remove_upload(file_location)
+                raise
+            except Exception as e:
+                logger.error(f"Ingestion failed for {progress.file_name}: {e}")
+                progress.status = IngestFileStatusEnum.FAILED
+                progress.error = str(e)
+            self._changed(job)
+            self._remove_upload(file_location)
+
+    @staticmethod
+    def _remove_upload(file_location: str):
+        try:
+            os.remove(file_location)
+        except OSError as e:
+            logger.error(f"Uploaded file {file_location} could not be removed: {e}")
+
+ingest_jobs = IngestJobManager(
+    max_concurrent_files=settings.INGEST_MAX_CONCURRENT_FILES,
+    process_workers=settings.INGEST_PROCESS_WORKERS,
+    max_retained_jobs=settings.INGEST_MAX_RETAINED_JOBS,
+)
@@ -0,0 +1,58 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+
+from src.app.chat.llm import llm_client
+from src.app.chat.memory import conversation_memory
+from src.app.chat.persistence import message_writer
+from src.app.core.embeddings import get_embedding_model
+from src.app.core.jobs import ingest_jobs
+from src.app.core.logs import logger
+from src.app.core.process import startup_report
+from src.app.core.qdrant import create_qdrant_client
+from src.app.db import files_queries, jobs_queries, messages_queries
+from src.app.scripts.chunking import get_encoding
+from src.app.settings import settings
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup_report.lifespan_started()
+    client = create_qdrant_client()
+    app.state.qdrant_client = client
+    if settings.EMBEDDING_LOAD_ON_STARTUP:
+        # Already loaded when gunicorn preloads the application, the cached model is reused then.
+        try:
+            await asyncio.to_thread(get_embedding_model)
+            await asyncio.to_thread(get_encoding)
+        except Exception as e:
+            logger.error(f"Embedding model could not be preloaded: {e}")
+
+    try:
+        await messages_queries.connect()
+        # File records are written once per ingested file and read for the corpus version of cached answers.
+        await files_queries.connect(min_size=1, max_size=settings.DATABASE_FILES_POOL_MAX_SIZE)
+        # Ingest job progress is saved in batches by a single task per worker.
+        await jobs_queries.connect(min_size=1, max_size=settings.DATABASE_JOBS_POOL_MAX_SIZE)
+        logger.info("Database pool connected.")
+    except Exception as e:
+        logger.error(f"Database pool could not be connected: {e}")
+
+    message_writer.start()
+    ingest_jobs.start(client)
+    logger.info("Ingest job workers started.")
+    startup_report.lifespan_finished()
+    logger.info(f"Worker {startup_report.pid} ready, startup report: {startup_report.stats()}")
+    try:
+        yield
+    finally:
+        await ingest_jobs.shutdown()
+        logger.info("Ingest job workers stopped.")
+        await conversation_memory.shutdown()
+        await message_writer.stop()
+        await llm_client.close()
+        await messages_queries.close()
+        await files_queries.close()
+        await jobs_queries.close()
+        await client.close()
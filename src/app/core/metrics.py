@@ -0,0 +1,97 @@
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Label of requests without a matched route or model, and of work done outside of a request.
+NO_LABEL: str = "none"
+LATENCY_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HTTP_REQUESTS = Counter(
+    "brag_http_requests_total", "HTTP requests by route, model and status.", ["endpoint", "model", "status"])
+HTTP_REQUEST_DURATION = Histogram(
+    "brag_http_request_duration_seconds", "Time until the response, including its streamed body, was sent.",
+    ["endpoint", "method"], buckets=LATENCY_BUCKETS)
+STAGE_DURATION = Histogram(
+    "brag_stage_duration_seconds", "Duration of a stage of a request or of a background task.",
+    ["stage", "endpoint", "model"], buckets=LATENCY_BUCKETS)
+LLM_ADMISSION_RUNNING = Gauge(
+    "brag_llm_admission_running", "LLM calls holding an admission slot.", multiprocess_mode="livesum")
+LLM_ADMISSION_QUEUED = Gauge(
+    "brag_llm_admission_queued", "LLM calls waiting for an admission slot.", multiprocess_mode="livesum")
+LLM_ADMISSION_REJECTED = Counter(
+    "brag_llm_admission_rejected_total", "LLM calls turned away by the admission control.", ["status"])
+
+# The ASGI scope of the current request, its route is only known once the router matched it, and its labels.
+_request: ContextVar[Optional[Tuple[Scope, Dict[str, str]]]] = ContextVar("metrics_request", default=None)
+
+
+def set_request_model(model: str):
+    """Label the metrics of the current request with the model it uses."""
+    request = _request.get()
+    if request is not None:
+        request[1]["model"] = str(model)
+
+
+def observe_stage(stage: str, seconds: float):
+    request = _request.get()
+    if request is None:
+        STAGE_DURATION.labels(stage, NO_LABEL, NO_LABEL).observe(seconds)
+    else:
+        scope, labels = request
+        STAGE_DURATION.labels(stage, _endpoint(scope), labels["model"]).observe(seconds)
+
+
+def _endpoint(scope: Scope) -> str:
+    # The route template, not the path, keeps ids out of the labels.
+    route = scope.get("route")
+    return getattr(route, "path", NO_LABEL)
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        labels = {"model": NO_LABEL}
+        token = _request.set((scope, labels))
+        status_code = 500
+        started_at = time.perf_counter()
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            endpoint = _endpoint(scope)
+            HTTP_REQUEST_DURATION.labels(endpoint, scope["method"]).observe(time.perf_counter() - started_at)
+            HTTP_REQUESTS.labels(endpoint, labels["model"], str(status_code)).inc()
+            _request.reset(token)
+
+
+def metrics_response() -> Response:
+    """
+    The metrics in the Prometheus text format.
+
+    Under gunicorn every worker writes its metrics to PROMETHEUS_MULTIPROC_DIR, they are aggregated over
+    all workers on every scrape, whichever worker serves it.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
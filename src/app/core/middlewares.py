@@ -4,7 +4,7 @@ import sentry_sdk
 from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
 from starlette.middleware.cors import CORSMiddleware
 
-from settings import settings
+from src.app.settings import settings
 
 
 def add_cors_middleware(app: FastAPI) -> FastAPI:
@@ -1,5 +1,26 @@
 from datetime import datetime
+from typing import Optional
 from pydantic import BaseModel, Field
 
+from src.app.core.constants import IngestJobStatusEnum, IngestFileStatusEnum
+
 class TimestampAbstractModel(BaseModel):
-    created_at : datetime = Field(default_factory=datetime.utcnow)
\ No newline at end of file
+    created_at : datetime = Field(default_factory=datetime.utcnow)
+
+
+class IngestFileProgress(BaseModel):
+    file_name: str
+    status: IngestFileStatusEnum = Field(default=IngestFileStatusEnum.QUEUED)
+    pages: int = Field(default=0)
+    chunks: int = Field(default=0)
+    chunks_embedded: int = Field(default=0)
+    chunks_reused: int = Field(default=0)
+    error: Optional[str] = None
+
+
+class IngestJob(TimestampAbstractModel):
+    id: str
+    user_id: str
+    status: IngestJobStatusEnum = Field(default=IngestJobStatusEnum.QUEUED)
+    files: list[IngestFileProgress] = Field(default_factory=list)
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,52 @@
+import base64
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from src.app.core.exceptions import InvalidCursorException
+
+NEXT_CURSOR_HEADER: str = "X-Next-Cursor"
+
+
+def encode_cursor(row: Mapping[str, Any]) -> str:
+    """Opaque cursor pointing right after the given row in `(created_at, id)` descending order."""
+    return base64.urlsafe_b64encode(f"{row['created_at'].isoformat()}|{row['id']}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return {"before_created_at": datetime.fromisoformat(created_at), "before_id": row_id}
+    except ValueError:
+        raise InvalidCursorException
+
+
+async def fetch_page(query, before_query, limit: int, before: Optional[str] = None,
+                     **params) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Fetch one page of rows with keyset pagination.
+
+    Both queries order by `created_at DESC, id DESC`, `before_query` additionally only returns rows strictly
+    older than the cursor. Rows are never skipped with OFFSET, so every page costs the same index range scan.
+
+    params:
+    -------
+        query: Query
+            The query of the first page.
+        before_query: Query
+            The query of the pages after a cursor.
+        limit: int
+            The page size.
+        before: str, optional
+            The cursor returned with the previous page.
+
+    returns:
+    --------
+        rows, next_cursor: tuple[list[dict], str | None]
+            The page, newest first, and the cursor of the next page, None on the last page.
+    """
+    if before is None:
+        rows = await query(limit=limit, **params)
+    else:
+        rows = await before_query(limit=limit, **decode_cursor(before), **params)
+    next_cursor = encode_cursor(rows[-1]) if len(rows) == limit else None
+    return rows, next_cursor
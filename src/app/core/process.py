@@ -0,0 +1,66 @@
+import os
+import time
+from typing import Dict, Optional
+
+# Fields of /proc/self/smaps_rollup, in kB. Pss splits shared pages between the processes mapping them,
+# so the Pss of the workers adds up to their real footprint while their Rss counts shared pages in each.
+MEMORY_FIELDS: Dict[str, str] = {"Rss": "rss_mb", "Pss": "pss_mb", "Shared_Clean": "shared_clean_mb",
+                                 "Shared_Dirty": "shared_dirty_mb", "Private_Clean": "private_clean_mb",
+                                 "Private_Dirty": "private_dirty_mb"}
+
+
+def process_memory(pid: Optional[int] = None) -> Dict[str, float]:
+    """Memory of a process in MB from /proc, only the peak RSS of the current process on other platforms."""
+    path = f"/proc/{pid or 'self'}/smaps_rollup"
+    try:
+        with open(path) as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line and not line[0].isdigit())
+    except OSError:
+        if pid is not None:
+            return {}
+        import resource
+        return {"max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    return {name: int(fields[field].split()[0]) / 1024 for field, name in MEMORY_FIELDS.items() if field in fields}
+
+
+def process_age_sec(pid: Optional[int] = None) -> Optional[float]:
+    """Seconds since the process was started, or forked, None where /proc is missing."""
+    try:
+        with open(f"/proc/{pid or 'self'}/stat") as f:
+            # The command name may contain spaces, the fields after it are split from its closing parenthesis.
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+    return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+
+
+class StartupReport:
+    """Time spent by this worker until it served its first request, and its memory once started."""
+
+    def __init__(self):
+        self.pid: Optional[int] = None
+        self.ready_after_sec: Optional[float] = None
+        self.lifespan_sec: Optional[float] = None
+        self._lifespan_started_at: Optional[float] = None
+
+    def lifespan_started(self):
+        self.pid = os.getpid()
+        self._lifespan_started_at = time.perf_counter()
+
+    def lifespan_finished(self):
+        self.lifespan_sec = time.perf_counter() - self._lifespan_started_at
+        self.ready_after_sec = process_age_sec()
+
+    def stats(self) -> Dict:
+        return {
+            "pid": os.getpid(),
+            "ready_after_sec": self.ready_after_sec,
+            "lifespan_sec": self.lifespan_sec,
+            "uptime_sec": process_age_sec(),
+            **process_memory(),
+        }
+
+
+startup_report = StartupReport()
@@ -0,0 +1,176 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import httpx
+from qdrant_client import AsyncQdrantClient, models
+from starlette.requests import Request
+
+from src.app.core.constants import QdrantLayoutEnum, StorageProfileEnum
+from src.app.core.embeddings import get_vector_name, get_vector_params
+from src.app.core.sparse import SPARSE_VECTOR_NAME
+from src.app.settings import settings
+
+# Looked up by ingestion deduplication.
+PAYLOAD_INDEXED_FIELDS: tuple[str, ...] = ("chunk_hash",)
+# Payload field holding the user of a point in the shared collection.
+TENANT_FIELD: str = "user_id"
+
+
+@dataclass(frozen=True)
+class TenantCollection:
+    """The collection holding the points of a user, and how to select them there."""
+    name: str
+    user_id: str
+    shared: bool
+
+    def filter(self, *conditions: models.Condition) -> Optional[models.Filter]:
+        must = list(conditions)
+        if self.shared:
+            must.insert(0, models.FieldCondition(key=TENANT_FIELD, match=models.MatchValue(value=self.user_id)))
+        return models.Filter(must=must) if must else None
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    """
+    How the dense vectors of a collection are stored and indexed.
+
+    params:
+    -------
+    quantization: Compressed copy of the vectors kept in RAM and searched first, None to search the originals.
+    on_disk: Memory map the float32 originals instead of loading them, they are only read to rescore.
+    oversampling: Candidates searched on the quantized vectors per requested point, rescored with the originals.
+    m: Edges per node of the HNSW graph, None for the Qdrant default of 16.
+    ef_construct: Candidates considered while building the graph, None for the Qdrant default of 100.
+    """
+    quantization: Optional[models.QuantizationConfig] = None
+    on_disk: bool = False
+    oversampling: Optional[float] = None
+    m: Optional[int] = None
+    ef_construct: Optional[int] = None
+
+    def vector_params(self, params: models.VectorParams) -> models.VectorParams:
+        return params.model_copy(update={"on_disk": self.on_disk or None,
+                                         "quantization_config": self.quantization})
+
+    def hnsw_config(self, multitenant: bool = False) -> Optional[models.HnswConfigDiff]:
+        m = settings.QDRANT_HNSW_M or self.m
+        ef_construct = settings.QDRANT_HNSW_EF_CONSTRUCT or self.ef_construct
+        if multitenant:
+            return models.HnswConfigDiff(m=0, payload_m=settings.QDRANT_TENANT_PAYLOAD_M, ef_construct=ef_construct)
+        if m is None and ef_construct is None:
+            return None
+        return models.HnswConfigDiff(m=m, ef_construct=ef_construct)
+
+    def search_params(self) -> Optional[models.SearchParams]:
+        quantization = None
+        if self.quantization is not None:
+            quantization = models.QuantizationSearchParams(rescore=True, oversampling=self.oversampling)
+        if quantization is None and settings.QDRANT_HNSW_EF is None:
+            return None
+        return models.SearchParams(hnsw_ef=settings.QDRANT_HNSW_EF, quantization=quantization)
+
+
+STORAGE_PROFILES: Dict[StorageProfileEnum, StorageProfile] = {
+    StorageProfileEnum.DEFAULT: StorageProfile(),
+    StorageProfileEnum.ON_DISK: StorageProfile(on_disk=True),
+    # A larger ef_construct makes up for part of the recall lost to quantization, at indexing time only.
+    StorageProfileEnum.SCALAR: StorageProfile(
+        quantization=models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8, quantile=0.99, always_ram=True)),
+        on_disk=True, oversampling=2.0, m=16, ef_construct=200),
+    # Made for models of 1024 dimensions and more, smaller models need the larger oversampling.
+    StorageProfileEnum.BINARY: StorageProfile(
+        quantization=models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True)),
+        on_disk=True, oversampling=4.0, m=16, ef_construct=200),
+}
+
+
+def storage_profile(profile: StorageProfileEnum = settings.QDRANT_STORAGE_PROFILE) -> StorageProfile:
+    return STORAGE_PROFILES[profile]
+
+
+def tenant_collection(user_id: str, layout: QdrantLayoutEnum = settings.QDRANT_LAYOUT) -> TenantCollection:
+    if layout == QdrantLayoutEnum.SHARED:
+        return TenantCollection(name=settings.QDRANT_COLLECTION_NAME, user_id=user_id, shared=True)
+    return TenantCollection(name=user_id, user_id=user_id, shared=False)
+
+
+def create_qdrant_client() -> AsyncQdrantClient:
+    """
+    Build the application wide Qdrant client.
+
+    `QDRANT_LOCATION` selects a local mode such as ":memory:", otherwise the client talks to
+    `QDRANT_HOST` over a keep-alive HTTP connection pool, or over gRPC with `QDRANT_PREFER_GRPC`.
+    """
+    if settings.QDRANT_LOCATION:
+        return AsyncQdrantClient(location=settings.QDRANT_LOCATION)
+
+    return AsyncQdrantClient(
+        host=settings.QDRANT_HOST,
+        port=settings.QDRANT_PORT,
+        grpc_port=settings.QDRANT_GRPC_PORT,
+        prefer_grpc=settings.QDRANT_PREFER_GRPC,
+        timeout=settings.QDRANT_TIMEOUT_SEC,
+        # qdrant_client disables keep-alive for localhost unless limits are given.
+        limits=httpx.Limits(
+            max_connections=settings.QDRANT_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.QDRANT_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.QDRANT_KEEPALIVE_EXPIRY_SEC,
+        ),
+    )
+
+
+def get_qdrant_client(request: Request) -> AsyncQdrantClient:
+    return request.app.state.qdrant_client
+
+
+async def ensure_collection(client: AsyncQdrantClient, collection_name: str, multitenant: bool = False,
+                            profile: Optional[StorageProfile] = None) -> models.CollectionInfo:
+    """
+    Create the collection with the vector params of the embedding model if it does not exist yet, stored
+    as `profile` describes, the QDRANT_STORAGE_PROFILE by default. The sparse lexical vector is only
+    configured with RETRIEVAL_HYBRID_ENABLED, dense only deployments neither store nor index it.
+
+    A multitenant collection indexes the user id of its points and builds its HNSW graph per user
+    instead of over all points, every search of it is filtered to one user.
+    """
+    profile = profile or storage_profile()
+    try:
+        return await client.get_collection(collection_name=collection_name)
+    except Exception:
+        pass
+
+    try:
+        await client.create_collection(
+            collection_name=collection_name,
+            vectors_config={get_vector_name(): profile.vector_params(get_vector_params())},
+            sparse_vectors_config=(
+                {SPARSE_VECTOR_NAME: models.SparseVectorParams()} if settings.RETRIEVAL_HYBRID_ENABLED else None),
+            hnsw_config=profile.hnsw_config(multitenant),
+        )
+    except Exception:
+        # Another upload created it in the meantime.
+        return await client.get_collection(collection_name=collection_name)
+
+    for field_name in (TENANT_FIELD, *PAYLOAD_INDEXED_FIELDS) if multitenant else PAYLOAD_INDEXED_FIELDS:
+        await client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=models.PayloadSchemaType.KEYWORD,
+        )
+    return await client.get_collection(collection_name=collection_name)
+
+
+async def ensure_tenant_collection(client: AsyncQdrantClient, tenant: TenantCollection) -> models.CollectionInfo:
+    return await ensure_collection(client, tenant.name, multitenant=tenant.shared)
+
+
+def has_sparse_vectors(collection: models.CollectionInfo) -> bool:
+    """Collections created before hybrid retrieval have no sparse vector and are searched dense only."""
+    return SPARSE_VECTOR_NAME in (collection.config.params.sparse_vectors or {})
+
+
+def indexes_sparse_vectors(collection: models.CollectionInfo) -> bool:
+    """Whether new points of the collection get a sparse vector, only computed while hybrid retrieval is enabled."""
+    return settings.RETRIEVAL_HYBRID_ENABLED and has_sparse_vectors(collection)
@@ -0,0 +1,74 @@
+import re
+import zlib
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List
+
+from qdrant_client import models
+
+from src.app.settings import settings
+
+SPARSE_VECTOR_NAME: str = "bm25"
+# Identifiers such as "SKU-4471" or "v1.2" are kept whole and also indexed by their parts.
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+TOKEN_PART_SEPARATOR = re.compile(r"[-./]")
+STOPWORDS = frozenset((
+    "a an and are as at be been but by can do does for from had has have how i if in into is it its "
+    "me my no not of on or our so than that the their them then there these they this to was we were "
+    "what when where which who why will with you your"
+).split())
+
+
+def term_index(term: str) -> int:
+    # crc32 is stable across processes, unlike hash(), and fits the uint32 indices of Qdrant sparse vectors.
+    return zlib.crc32(term.encode())
+
+
+class SparseEncoder:
+    """
+    Lexical sparse vectors scored by Qdrant's sparse dot product.
+
+    Documents carry the BM25 term frequency weight of every term, `k1` saturates repeated terms and `b`
+    normalizes by document length against `avg_doc_length`. Queries carry a weight of 1 per distinct term,
+    so a point scores the sum of the BM25 weights of the query terms it contains. Qdrant keeps no corpus
+    statistics for sparse vectors, the IDF factor is left out and stopwords are dropped instead.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, avg_doc_length: float = 250.0):
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = avg_doc_length
+
+    @staticmethod
+    def terms(text: str) -> List[str]:
+        terms = []
+        for match in TOKEN_PATTERN.finditer(text.casefold()):
+            term = match.group()
+            if term in STOPWORDS:
+                continue
+            terms.append(term)
+            if TOKEN_PART_SEPARATOR.search(term):
+                terms.extend(part for part in TOKEN_PART_SEPARATOR.split(term) if part and part not in STOPWORDS)
+        return terms
+
+    def encode_document(self, text: str) -> models.SparseVector:
+        counts = Counter(self.terms(text))
+        length_norm = self.k1 * (1 - self.b + self.b * sum(counts.values()) / self.avg_doc_length)
+        weights: Dict[int, float] = {}
+        for term, frequency in counts.items():
+            index = term_index(term)
+            weights[index] = weights.get(index, 0.0) + frequency * (self.k1 + 1) / (frequency + length_norm)
+        return models.SparseVector(indices=list(weights), values=list(weights.values()))
+
+    def encode_documents(self, texts: List[str]) -> List[models.SparseVector]:
+        return [self.encode_document(text) for text in texts]
+
+    def encode_query(self, text: str) -> models.SparseVector:
+        indices = list(dict.fromkeys(term_index(term) for term in self.terms(text)))
+        return models.SparseVector(indices=indices, values=[1.0] * len(indices))
+
+
+@lru_cache(maxsize=None)
+def get_sparse_encoder() -> SparseEncoder:
+    return SparseEncoder(k1=settings.SPARSE_BM25_K1, b=settings.SPARSE_BM25_B,
+                         avg_doc_length=settings.SPARSE_AVG_DOC_LENGTH)
@@ -0,0 +1,56 @@
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator
+
+from src.app.core.metrics import observe_stage
+from src.app.settings import settings
+
+
+class StageTimer:
+    """
+    Durations of the stages of a request in this worker, such as the query embedding or the first LLM token.
+
+    Every stage keeps its call count and total time since the start, and its last `window` durations
+    for the percentiles. Durations are also observed by the Prometheus stage histogram.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+        self._calls: Dict[str, int] = defaultdict(int)
+        self._seconds: Dict[str, float] = defaultdict(float)
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started_at)
+
+    def record(self, stage: str, seconds: float):
+        self._samples[stage].append(seconds)
+        self._calls[stage] += 1
+        self._seconds[stage] += seconds
+        observe_stage(stage, seconds)
+
+    def reset(self):
+        self._samples.clear()
+        self._calls.clear()
+        self._seconds.clear()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        stats = {}
+        for stage, samples in self._samples.items():
+            ordered = sorted(samples)
+            stats[stage] = {
+                "calls": self._calls[stage],
+                "ms_avg": self._seconds[stage] * 1000 / self._calls[stage],
+                **{f"ms_p{percentile}": ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))] * 1000
+                   for percentile in (50, 95, 99)},
+            }
+        return stats
+
+
+stage_timer = StageTimer(window=settings.STAGE_TIMING_WINDOW)
@@ -1,5 +1,203 @@
-import pugsql
+import re
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+import asyncpg
+
+from src.app.core.logs import logger
+from src.app.core.metrics import observe_stage
 from src.app.settings import settings
 
-messages_queries = pugsql.module("db/queries/messages")
-messages_connection = messages_queries.connect(settings.DATABASE_URL)
+QUERY_HEADER = re.compile(r'^--\s*:name\s+(\w+)\s+:(\w+)[^\n]*$', re.MULTILINE)
+QUERY_PARAMETER = re.compile(r'(?<![:\w]):([A-Za-z_]\w*)')
+QUERY_KINDS = ("many", "one", "scalar", "insert", "affected")
+
+
+class Query:
+    """
+    A named query of a `.sql` file, called with keyword parameters like the pugsql queries it replaces.
+
+    `:name` parameters are rewritten to positional `$n` placeholders. The statement is prepared
+    once per pooled connection by the asyncpg statement cache and reused on every later call.
+    """
+
+    def __init__(self, module: "QueryModule", name: str, kind: str, sql: str):
+        if kind not in QUERY_KINDS:
+            raise ValueError(f"Query {name} has unsupported kind :{kind}, expected one of {QUERY_KINDS}.")
+        self.module = module
+        self.name = name
+        self.kind = kind
+        self.parameters: List[str] = []
+        self.sql = QUERY_PARAMETER.sub(self._placeholder, sql.strip().rstrip(";"))
+
+    def _placeholder(self, match: re.Match) -> str:
+        if match.group(1) not in self.parameters:
+            self.parameters.append(match.group(1))
+        return f"${self.parameters.index(match.group(1)) + 1}"
+
+    def arguments(self, params: Dict[str, Any]) -> List[Any]:
+        missing = [name for name in self.parameters if name not in params]
+        if missing:
+            raise TypeError(f"Query {self.name} is missing parameters: {', '.join(missing)}.")
+        return [params[name] for name in self.parameters]
+
+    async def __call__(self, **params) -> Any:
+        arguments = self.arguments(params)
+        async with self.module.acquire(self.name) as connection:
+            if self.kind == "many":
+                return [dict(row) for row in await connection.fetch(self.sql, *arguments)]
+            if self.kind == "one":
+                row = await connection.fetchrow(self.sql, *arguments)
+                return dict(row) if row is not None else None
+            if self.kind == "scalar":
+                return await connection.fetchval(self.sql, *arguments)
+            status = await connection.execute(self.sql, *arguments)
+            return int(status.split()[-1]) if self.kind == "affected" else None
+
+    async def executemany(self, rows: Iterable[Dict[str, Any]]):
+        """Run the query once per row, pipelined in a single transaction, every row is written or none is."""
+        arguments = [self.arguments(row) for row in rows]
+        async with self.module.acquire(self.name) as connection:
+            await connection.executemany(self.sql, arguments)
+
+
+class QueryModule:
+    """
+    The queries of a directory of pugsql style `.sql` files, executed on an asyncpg pool.
+
+    Every gunicorn worker opens its own pool of `min_size` to `max_size` connections in the application
+    lifespan, the database sees at most `workers * max_size` connections from the API.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pool: Optional[asyncpg.Pool] = None
+        self._calls: Dict[str, int] = defaultdict(int)
+        self._errors: Dict[str, int] = defaultdict(int)
+        self._seconds: Dict[str, float] = defaultdict(float)
+        self._acquire_seconds = 0.0
+        self._acquires = 0
+        self._queries: Dict[str, Query] = {}
+        for sql_file in sorted(Path(path).glob("*.sql")):
+            self._load(sql_file.read_text())
+
+    def _load(self, text: str):
+        headers = list(QUERY_HEADER.finditer(text))
+        for header, next_header in zip(headers, headers[1:] + [None]):
+            sql = text[header.end():next_header.start() if next_header else len(text)]
+            name, kind = header.group(1), header.group(2)
+            if name in self._queries:
+                raise ValueError(f"Query {name} is defined twice in {self.path}.")
+            self._queries[name] = Query(self, name, kind, sql)
+
+    def __getattr__(self, name: str) -> Query:
+        try:
+            return self.__dict__["_queries"][name]
+        except KeyError:
+            raise AttributeError(f"No query named {name} in {self.path}.") from None
+
+    async def connect(self, dsn: str = settings.DATABASE_URL, min_size: int = settings.DATABASE_POOL_MIN_SIZE,
+                      max_size: int = settings.DATABASE_POOL_MAX_SIZE):
+        """
+        Open the connection pool and prepare every query once so that broken SQL is reported at startup.
+
+        params:
+        -------
+            dsn: str
+                The Postgres connection string.
+            min_size: int
+                Connections opened up front and kept open.
+            max_size: int
+                Upper bound of connections of this worker.
+        """
+        self._pool = await asyncpg.create_pool(
+            dsn=dsn,
+            min_size=min_size,
+            max_size=max_size,
+            command_timeout=settings.DATABASE_COMMAND_TIMEOUT_SEC,
+            statement_cache_size=settings.DATABASE_STATEMENT_CACHE_SIZE,
+            max_inactive_connection_lifetime=settings.DATABASE_MAX_INACTIVE_CONNECTION_LIFETIME_SEC,
+            init=self._init_connection,
+        )
+        async with self._pool.acquire() as connection:
+            for query in self._queries.values():
+                try:
+                    await connection.prepare(query.sql)
+                except asyncpg.PostgresError as e:
+                    logger.error(f"Query {query.name} could not be prepared, check the migrations: {e}")
+
+    @property
+    def connected(self) -> bool:
+        return self._pool is not None
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    @staticmethod
+    async def _init_connection(connection: asyncpg.Connection):
+        # Return uuids as strings like psycopg2 did, the API models declare them as str.
+        await connection.set_type_codec("uuid", encoder=str, decoder=str, schema="pg_catalog", format="text")
+
+    @asynccontextmanager
+    async def acquire(self, query_name: str) -> AsyncIterator[asyncpg.Connection]:
+        if self._pool is None:
+            raise RuntimeError("The database pool is not connected.")
+        started_at = time.perf_counter()
+        async with self._pool.acquire() as connection:
+            acquired_at = time.perf_counter()
+            self._acquires += 1
+            self._acquire_seconds += acquired_at - started_at
+            try:
+                yield connection
+            except Exception:
+                self._errors[query_name] += 1
+                raise
+            finally:
+                self._calls[query_name] += 1
+                self._seconds[query_name] += time.perf_counter() - acquired_at
+                observe_stage(f"db.{query_name}", time.perf_counter() - started_at)
+
+    async def health(self) -> Dict[str, Any]:
+        """Round trip a `SELECT 1` through the pool and report it along with the pool statistics."""
+        healthy = False
+        if self._pool is not None:
+            try:
+                started_at = time.perf_counter()
+                async with self._pool.acquire(timeout=settings.DATABASE_HEALTH_TIMEOUT_SEC) as connection:
+                    await connection.fetchval("SELECT 1", timeout=settings.DATABASE_HEALTH_TIMEOUT_SEC)
+                healthy = True
+                latency_ms = (time.perf_counter() - started_at) * 1000
+            except Exception as e:
+                logger.error(f"Database health check failed: {e}")
+        return {"healthy": healthy, "latency_ms": latency_ms if healthy else None, **self.stats()}
+
+    def stats(self) -> Dict[str, Any]:
+        pool = self._pool
+        return {
+            "pool": {
+                "size": pool.get_size() if pool else 0,
+                "idle": pool.get_idle_size() if pool else 0,
+                "min_size": pool.get_min_size() if pool else 0,
+                "max_size": pool.get_max_size() if pool else 0,
+                "acquires": self._acquires,
+                "acquire_wait_ms_avg": self._acquire_seconds * 1000 / self._acquires if self._acquires else 0.0,
+            },
+            "queries": {
+                name: {
+                    "calls": self._calls[name],
+                    "errors": self._errors[name],
+                    "ms_avg": self._seconds[name] * 1000 / self._calls[name] if self._calls[name] else 0.0,
+                }
+                for name in self._queries
+            },
+        }
+
+
+messages_queries = QueryModule("db/queries/messages")
+files_queries = QueryModule("db/queries/files")
+jobs_queries = QueryModule("db/queries/jobs")
@@ -0,0 +1,91 @@
+"""
+Chunking microbenchmark: chunks/sec of the `Chunker` engine against the previous `create_chunks`.
+
+    python -m src.app.scripts.benchmarks.chunking --sentences 200000
+    python -m src.app.scripts.benchmarks.chunking --corpus path/to/large.txt --overlap 50
+"""
+import argparse
+import random
+import re
+import time
+from typing import Callable, List
+
+import tiktoken
+
+from src.app.scripts.chunking import Chunker
+
+WORDS = (
+    "retrieval augmented generation vector index embedding query document chunk token model "
+    "latency throughput payload collection tenant cache batch stream worker process qdrant "
+    "postgres invoice part SKU-4471 ISO-9001 the a of and to in is for on with as by at from"
+).split()
+
+
+def legacy_create_chunks(text: str, max_tokens: int = 500) -> list[str]:
+    """The chunker as it was before the `Chunker` engine, kept as the baseline."""
+    encoding = tiktoken.get_encoding("cl100k_base")
+    sentences = re.split('(?<=[.!?]) +', text)
+    chunks = []
+    current_chunk = ""
+    current_count = 0
+
+    for sentence in sentences:
+        tokens = encoding.encode(sentence)
+        token_count = len(tokens)
+
+        if current_count + token_count <= max_tokens:
+            current_chunk += " " + sentence
+            current_count += token_count
+        else:
+            chunks.append(current_chunk)
+            current_chunk = sentence
+            current_count = token_count
+
+    chunks.append(current_chunk)
+    return chunks
+
+
+def synthetic_corpus(sentences: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    return " ".join(
+        " ".join(rng.choices(WORDS, k=rng.randint(4, 40))).capitalize() + rng.choice(".!?")
+        for _ in range(sentences)
+    )
+
+
+def measure(name: str, run: Callable[[], List], repeat: int) -> dict:
+    best = float("inf")
+    chunks = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = len(run())
+        best = min(best, time.perf_counter() - start)
+    result = {"name": name, "chunks": chunks, "seconds": best, "chunks_per_sec": chunks / best}
+    print(f"{name:<10} {chunks:>8} chunks  {best:8.3f}s  {result['chunks_per_sec']:>10.1f} chunks/sec")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Text file to chunk instead of a synthetic corpus.")
+    parser.add_argument("--sentences", type=int, default=200_000, help="Size of the synthetic corpus.")
+    parser.add_argument("--max-tokens", type=int, default=500)
+    parser.add_argument("--overlap", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = synthetic_corpus(args.sentences)
+    print(f"corpus: {len(text):,} characters")
+
+    chunker = Chunker(max_tokens=args.max_tokens, overlap_tokens=args.overlap)
+    legacy = measure("legacy", lambda: legacy_create_chunks(text, args.max_tokens), args.repeat)
+    engine = measure("chunker", lambda: list(chunker.chunk(text)), args.repeat)
+    print(f"speedup: {legacy['seconds'] / engine['seconds']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
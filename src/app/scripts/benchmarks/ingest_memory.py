@@ -0,0 +1,275 @@
+"""
+Memory ceiling of streaming ingestion: peak memory must not grow with the size of the ingested file.
+
+For every format and size a file is generated, then ingested in a fresh process the way the API does
+it: the upload is saved to disk with `save_upload`, then extracted and chunked by `extract_chunks_from_file`
+on a spawn process pool and a manager, like the ingest job workers. The process reports its peak resident
+memory before and during the ingestion, and the largest peak of its pool workers and manager. The check
+fails, with exit code 1, when the peak of the largest file exceeds the peak of the smallest one by more
+than --max-growth-mb in either, or any peak exceeds --max-peak-mb.
+
+The chunks stage stops once the file is chunked. The upload stage also embeds and upserts into the
+configured Qdrant, it needs a Qdrant server: the local mode keeps every point in the process and grows
+with the file by design.
+
+    python -m src.app.scripts.benchmarks.ingest_memory --sizes-mb 16,128
+    python -m src.app.scripts.benchmarks.ingest_memory --formats txt --sizes-mb 8,64 --stage upload --output memory.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from src.app.scripts.benchmarks.retrieval import TOPICS
+
+FORMATS = ("txt", "docx", "pdf")
+STAGES = ("chunks", "upload")
+DOCX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="word/document.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+}
+# The ingestion process and the largest of its pool workers and manager.
+PEAK_KEYS = ("peak_rss_mb", "workers_peak_rss_mb")
+PDF_LINES_PER_PAGE = 50
+PDF_LINE_CHARS = 90
+
+
+def paragraphs(size_bytes: int, seed: int):
+    rng = random.Random(seed)
+    written = 0
+    index = 0
+    while written < size_bytes:
+        topic = rng.choice(TOPICS)
+        paragraph = (f"Section {index} covers the {topic} of unit {rng.randint(1, 99999)}. "
+                     f"The {topic} is inspected every {rng.randint(1, 48)} months and replaced after "
+                     f"{rng.randint(10, 900)} thousand kilometres. Wear depends on load, climate and maintenance.")
+        written += len(paragraph) + 1
+        index += 1
+        yield paragraph
+
+
+def pdf_pages(size_bytes: int, seed: int):
+    lines = []
+    for paragraph in paragraphs(size_bytes, seed):
+        lines.extend(textwrap.wrap(paragraph, PDF_LINE_CHARS))
+        if len(lines) >= PDF_LINES_PER_PAGE:
+            yield lines[:PDF_LINES_PER_PAGE]
+            lines = lines[PDF_LINES_PER_PAGE:]
+    if lines:
+        yield lines
+
+
+def write_pdf(path: str, size_bytes: int, seed: int):
+    """A PDF of text pages in Helvetica, written page by page, only the offsets of its objects are kept."""
+    offsets: Dict[int, int] = {}
+    with open(path, "wb") as f:
+        def write_object(number: int, body: bytes):
+            offsets[number] = f.tell()
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+
+        f.write(b"%PDF-1.4\n")
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        write_object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        page_numbers = []
+        number = 4
+        for lines in pdf_pages(size_bytes, seed):
+            content = b"BT /F1 10 Tf 12 TL 40 800 Td " + b" ".join(
+                b"(%s) '" % line.encode("latin-1") for line in lines) + b" ET"
+            write_object(number, b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+            write_object(number + 1, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                                     b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % number)
+            page_numbers.append(number + 1)
+            number += 2
+        write_object(2, b"<< /Type /Pages /Count %d /Kids [%s] >>" % (
+            len(page_numbers), b" ".join(b"%d 0 R" % page for page in page_numbers)))
+
+        xref_offset = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % number)
+        for object_number in range(1, number):
+            f.write(b"%010d 00000 n \n" % offsets[object_number])
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (number, xref_offset))
+
+
+def generate_file(directory: str, file_format: str, size_mb: int, seed: int) -> str:
+    """Write a file of about `size_mb` megabytes of text, streamed, the generator holds no more than a page."""
+    path = os.path.join(directory, f"ingest-{size_mb}mb.{file_format}")
+    size_bytes = size_mb * 1024 * 1024
+    if file_format == "txt":
+        with open(path, "w", encoding="utf-8") as f:
+            for paragraph in paragraphs(size_bytes, seed):
+                f.write(paragraph + "\n")
+        return path
+    if file_format == "pdf":
+        write_pdf(path, size_bytes, seed)
+        return path
+
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in DOCX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open("word/document.xml", "w", force_zip64=True) as document:
+            document.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document '
+                           b'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>')
+            for paragraph in paragraphs(size_bytes, seed):
+                document.write(f"<w:p><w:r><w:t>{paragraph}</w:t></w:r></w:p>".encode())
+            document.write(b"</w:body></w:document>")
+    return path
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is in kilobytes on Linux, for RUSAGE_CHILDREN the largest of the children waited for.
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def upload_file(path: str, directory: str) -> str:
+    """Save the file the way the upload endpoint saves a request's file, from a spooled upload."""
+    from starlette.datastructures import UploadFile
+
+    from src.app.core.api import save_upload
+
+    file_location = os.path.join(directory, "upload", f"{os.path.basename(path)}")
+    with open(path, "rb") as f:
+        save_upload(UploadFile(file=f, filename=os.path.basename(path)), file_location)
+    return file_location
+
+
+async def ingest_in_child(path: str, stage: str) -> Dict:
+    from src.app.core.embeddings import get_embedding_model
+    from src.app.core.qdrant import create_qdrant_client
+    from src.app.scripts.chunking import get_encoding
+    from src.app.scripts.ingest import chunks_qdrant_upload, extract_chunks_from_file, extract_metadata, hash_file
+    from src.app.settings import settings
+
+    get_encoding()
+    if stage == "upload":
+        get_embedding_model()
+    # The pool and the manager of the ingest job workers.
+    context = multiprocessing.get_context("spawn")
+    executor = ProcessPoolExecutor(max_workers=settings.INGEST_PROCESS_WORKERS, mp_context=context)
+    manager = context.Manager()
+    baseline_mb = peak_rss_mb()
+    started_at = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            file_location = upload_file(path, directory)
+            chunks = (chunk for _, batch in extract_chunks_from_file(file_location, executor, manager) for chunk in batch)
+            if stage == "chunks":
+                count = sum(1 for _ in chunks)
+            else:
+                client = create_qdrant_client()
+                user_id = f"ingest-memory-{hashlib.sha256(path.encode()).hexdigest()[:8]}"
+                try:
+                    result = await chunks_qdrant_upload(
+                        client, chunks, {**extract_metadata(path), "file_hash": hash_file(file_location)}, user_id)
+                    count = result.embedded + result.reused
+                    await client.delete_collection(user_id)
+                finally:
+                    await client.close()
+        finally:
+            executor.shutdown(wait=True)
+            manager.shutdown()
+    return {
+        "chunks": count,
+        "seconds": time.perf_counter() - started_at,
+        "baseline_peak_rss_mb": baseline_mb,
+        "peak_rss_mb": peak_rss_mb(),
+        "workers_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def measure(path: str, stage: str) -> Dict:
+    output = subprocess.run(
+        [sys.executable, "-m", "src.app.scripts.benchmarks.ingest_memory", "--child", path, "--stage", stage],
+        check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def check_format(directory: str, file_format: str, sizes: List[int], stage: str, seed: int, max_growth_mb: float,
+                 max_peak_mb: Optional[float] = None) -> Tuple[List[Dict], List[str]]:
+    """Measure one format at every size, smallest first, and describe every exceeded ceiling."""
+    results = []
+    failures = []
+    for size_mb in sorted(sizes):
+        path = generate_file(directory, file_format, size_mb, seed)
+        try:
+            result = {"format": file_format, "size_mb": size_mb, "stage": stage, **measure(path, stage)}
+        finally:
+            os.remove(path)
+        results.append(result)
+        print(f"{file_format:<5} {size_mb:>5} MB  {result['chunks']:>8} chunks in {result['seconds']:.1f}s"
+              f"  peak rss {result['peak_rss_mb']:.0f} MB (baseline {result['baseline_peak_rss_mb']:.0f} MB)"
+              f"  workers {result['workers_peak_rss_mb']:.0f} MB")
+        for key in PEAK_KEYS:
+            if max_peak_mb is not None and result[key] > max_peak_mb:
+                failures.append(f"{file_format} {size_mb} MB {key} was {result[key]:.0f} MB")
+
+    for key in PEAK_KEYS:
+        growth = results[-1][key] - results[0][key]
+        print(f"{file_format:<5} {key} growth {results[0]['size_mb']} MB -> {results[-1]['size_mb']} MB: {growth:+.1f} MB")
+        if growth > max_growth_mb:
+            failures.append(f"{file_format} {key} grew by {growth:.0f} MB "
+                            f"from {results[0]['size_mb']} MB to {results[-1]['size_mb']} MB")
+    return results, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formats", default=",".join(FORMATS), help=f"Comma separated formats of: {', '.join(FORMATS)}.")
+    parser.add_argument("--sizes-mb", default="16,128", help="Comma separated sizes of the generated files.")
+    parser.add_argument("--stage", choices=STAGES, default="chunks")
+    parser.add_argument("--max-growth-mb", type=float, default=32.0,
+                        help="Allowed peak growth from the smallest to the largest file.")
+    parser.add_argument("--max-peak-mb", type=float, help="Allowed peak of the ingestion process and of its workers.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(ingest_in_child(args.child, args.stage))))
+        return
+
+    sizes = sorted(int(size) for size in args.sizes_mb.split(",") if size.strip())
+    results: List[Dict] = []
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        for file_format in [file_format.strip() for file_format in args.formats.split(",") if file_format.strip()]:
+            format_results, format_failures = check_format(
+                directory, file_format, sizes, args.stage, args.seed, args.max_growth_mb, args.max_peak_mb)
+            results.extend(format_results)
+            failures.extend(format_failures)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "failures": failures}, f, indent=2)
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK: peak memory does not grow with the file size.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Offline retrieval evaluation: recall@k, MRR and search latency of dense-only against hybrid retrieval.
+
+The corpus is ingested with the regular ingestion path into a scratch collection, by default a
+synthetic parts catalogue queried by part number. Queries are JSON lines of
+{"query": "...", "relevant": ["substring", ...]}, a chunk is relevant when it contains one of the substrings.
+
+    QDRANT_LOCATION=:memory: python -m src.app.scripts.benchmarks.retrieval
+    python -m src.app.scripts.benchmarks.retrieval --corpus docs/ --queries queries.jsonl --k 5 --output eval.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+from src.app.chat.cache import query_embedding_cache
+from src.app.chat.retrieval import search_points
+from src.app.core.qdrant import create_qdrant_client
+from src.app.scripts.ingest import chunk_id, chunks_qdrant_upload, create_page_chunks
+
+TOPICS = (
+    "hydraulic pump", "brake caliper", "air filter", "fuel injector", "timing belt", "radiator hose",
+    "alternator", "starter motor", "wheel bearing", "spark plug", "oil seal", "drive shaft",
+)
+
+
+def synthetic_catalogue(parts: int, seed: int = 0) -> Tuple[Dict[str, str], List[Dict]]:
+    rng = random.Random(seed)
+    lines = []
+    queries = []
+    for index in range(parts):
+        part_number = f"SKU-{index:05d}"
+        topic = rng.choice(TOPICS)
+        lines.append(
+            f"The {topic} with part number {part_number} is stocked in warehouse W{rng.randint(1, 9)}. "
+            f"It fits the {rng.choice(['compact', 'sedan', 'truck', 'van'])} models built after {rng.randint(1995, 2023)}. "
+            f"Replacement intervals for the {topic} depend on load and climate."
+        )
+        if index % 10 == 0:
+            queries.append({"query": f"Where is {part_number} stocked?", "relevant": [part_number]})
+    return {"catalogue.txt": " ".join(lines)}, queries
+
+
+def load_corpus(corpus_dir: str) -> Dict[str, str]:
+    return {path.name: path.read_text(encoding="utf-8") for path in sorted(Path(corpus_dir).glob("*.txt"))}
+
+
+async def ingest(client, collection: str, corpus: Dict[str, str]) -> Dict[str, str]:
+    """Ingest the corpus and return the text of every point id."""
+    texts = {}
+    for file_name, text in corpus.items():
+        file_hash = hashlib.sha256(text.encode()).hexdigest()
+        chunks = list(create_page_chunks([(None, text)]))
+        await chunks_qdrant_upload(client, chunks, {
+            "file_name": file_name,
+            "file_size": len(text.encode()),
+            "file_extension": "txt",
+            "file_type": "txt",
+            "file_hash": file_hash,
+        }, collection)
+        texts.update({chunk_id(collection, file_hash, chunk.text): chunk.text for chunk in chunks})
+    return texts
+
+
+async def evaluate(client, collection: str, queries: List[Dict], relevant_ids: List[Set[str]], k: int,
+                   hybrid: bool) -> Dict:
+    query_embedding_cache.clear()
+    latencies = []
+    recalls = []
+    reciprocal_ranks = []
+    for query, relevant in zip(queries, relevant_ids):
+        started_at = time.perf_counter()
+        points = await search_points(client, query["query"], collection, limit=k, hybrid=hybrid)
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        ranked_ids = [str(point.id) for point in points]
+        recalls.append(len(relevant.intersection(ranked_ids)) / len(relevant))
+        reciprocal_ranks.append(next((1 / rank for rank, point_id in enumerate(ranked_ids, start=1)
+                                      if point_id in relevant), 0.0))
+    latencies.sort()
+    return {
+        "mode": "hybrid" if hybrid else "dense",
+        "queries": len(queries),
+        f"recall@{k}": statistics.fmean(recalls),
+        "mrr": statistics.fmean(reciprocal_ranks),
+        "latency_ms_mean": statistics.fmean(latencies),
+        "latency_ms_p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+async def run(args) -> List[Dict]:
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [json.loads(line) for line in f if line.strip()]
+    else:
+        corpus, queries = synthetic_catalogue(args.parts)
+
+    client = create_qdrant_client()
+    try:
+        texts = await ingest(client, args.collection, corpus)
+        relevant_ids = [{point_id for point_id, text in texts.items() if any(s in text for s in query["relevant"])}
+                        for query in queries]
+        queries, relevant_ids = zip(*[(query, relevant) for query, relevant in zip(queries, relevant_ids) if relevant])
+        print(f"corpus: {len(texts)} chunks, {len(queries)} queries with relevant chunks")
+        results = [await evaluate(client, args.collection, list(queries), list(relevant_ids), args.k, hybrid)
+                   for hybrid in (False, True)]
+        for result in results:
+            print(f"{result['mode']:<7} recall@{args.k} {result[f'recall@{args.k}']:.3f}  mrr {result['mrr']:.3f}  "
+                  f"latency mean {result['latency_ms_mean']:.1f} ms  p95 {result['latency_ms_p95']:.1f} ms")
+        if not args.keep:
+            await client.delete_collection(args.collection)
+    finally:
+        await client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Directory of .txt files, requires --queries.")
+    parser.add_argument("--queries", help="JSON lines file of queries with their relevant substrings.")
+    parser.add_argument("--parts", type=int, default=2000, help="Size of the synthetic catalogue.")
+    parser.add_argument("--collection", default="retrieval-eval")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch collection.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+    if args.corpus and not args.queries:
+        parser.error("--corpus requires --queries")
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
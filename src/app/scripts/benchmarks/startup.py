@@ -0,0 +1,92 @@
+"""
+Startup time and memory of the gunicorn workers, with and without preloading the application in the master.
+
+Every mode starts gunicorn with the regular configuration, waits until every worker answered
+/healthCheck/worker and reports the time until then, the startup report of every worker and the
+memory of the master. Rss counts the pages shared copy-on-write in every process, Pss splits them
+between the processes, its total is the memory the deployment really uses.
+
+    python -m src.app.scripts.benchmarks.startup --workers 4
+    python -m src.app.scripts.benchmarks.startup --modes preload --workers 8 --output startup.json
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+from src.app.core.process import process_memory
+
+MODES = ("default", "preload")
+
+
+def run_mode(mode: str, workers: int, port: int, timeout_sec: float) -> Dict:
+    env = {**os.environ, "WORKERS": str(workers), "RELOAD": "false", "PRELOAD_APP": str(mode == "preload").lower()}
+    started_at = time.perf_counter()
+    master = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "src/app/settings/gunicorn.conf.py", "-b", f"127.0.0.1:{port}",
+         "main:app"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    reports: Dict[int, Dict] = {}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=5) as client:
+            # New connections are spread over the workers by the kernel, poll until each one answered.
+            while len(reports) < workers:
+                if time.perf_counter() - started_at > timeout_sec:
+                    raise TimeoutError(f"{len(reports)}/{workers} workers ready after {timeout_sec}s.")
+                if master.poll() is not None:
+                    raise RuntimeError(f"gunicorn exited with {master.returncode}.")
+                try:
+                    response = client.get("/healthCheck/worker", headers={"Connection": "close"})
+                    report = response.json()
+                    reports.setdefault(report["pid"], report)
+                except httpx.HTTPError:
+                    time.sleep(0.1)
+        ready_sec = time.perf_counter() - started_at
+        # Memory is read again once every worker is up, pages shared by all of them are split between all.
+        worker_memory = {pid: process_memory(pid) for pid in reports}
+        master_memory = process_memory(master.pid)
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=30)
+
+    processes: List[Dict] = [master_memory, *worker_memory.values()]
+    return {
+        "mode": mode,
+        "workers": workers,
+        "all_workers_ready_sec": ready_sec,
+        "master": master_memory,
+        "workers_startup": [{**reports[pid], **worker_memory[pid]} for pid in sorted(reports)],
+        "total_rss_mb": sum(memory.get("rss_mb", 0) for memory in processes),
+        "total_pss_mb": sum(memory.get("pss_mb", 0) for memory in processes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Comma separated modes of: {', '.join(MODES)}.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds to wait for the workers.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    results = []
+    for mode in [mode.strip() for mode in args.modes.split(",") if mode.strip()]:
+        result = run_mode(mode, args.workers, args.port, args.timeout)
+        results.append(result)
+        ready = [worker["ready_after_sec"] for worker in result["workers_startup"] if worker["ready_after_sec"]]
+        print(f"{mode:<8} {args.workers} workers ready in {result['all_workers_ready_sec']:.1f}s"
+              f" (slowest worker {max(ready, default=0):.1f}s after its start)"
+              f"  rss {result['total_rss_mb']:.0f} MB  pss {result['total_pss_mb']:.0f} MB")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
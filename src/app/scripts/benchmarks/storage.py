@@ -0,0 +1,169 @@
+"""
+Memory, search latency and recall@k of the vector storage profiles.
+
+Every profile gets a scratch collection created the way the application creates user collections,
+filled with the same synthetic clustered vectors of the embedding model's size, and queried with
+held out vectors. Recall@k compares the profile's search, rescoring included, with an exact search
+on the float32 originals of the same collection. Memory per million chunks is estimated from the
+profile: vectors and quantized vectors in RAM plus the HNSW graph links, the disk column counts the
+memory mapped originals. With --qdrant-pid the Pss growth of a local Qdrant server is measured as well.
+
+Quantization and on-disk storage need a Qdrant server, the local mode of the client ignores them.
+
+    python -m src.app.scripts.benchmarks.storage --points 200000 --queries 200 --k 10
+    python -m src.app.scripts.benchmarks.storage --profiles default,scalar --qdrant-pid $(pgrep qdrant) --output storage.json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Dict, List
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient, models
+
+from src.app.core.constants import StorageProfileEnum
+from src.app.core.embeddings import get_vector_name, get_vector_params
+from src.app.core.process import process_memory
+from src.app.core.qdrant import STORAGE_PROFILES, StorageProfile, create_qdrant_client, ensure_collection
+from src.app.settings import settings
+
+# Qdrant's default when the profile leaves m unset.
+DEFAULT_HNSW_M = 16
+
+
+def synthetic_vectors(count: int, dimensions: int, clusters: int, seed: int) -> np.ndarray:
+    """Unit vectors around random centroids, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(clusters, dimensions))
+    vectors = centroids[rng.integers(0, clusters, size=count)] + rng.normal(scale=0.6, size=(count, dimensions))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def estimate_memory(profile: StorageProfile, dimensions: int, points: int = 1_000_000) -> Dict[str, float]:
+    ram = 0 if profile.on_disk else dimensions * 4
+    if isinstance(profile.quantization, models.ScalarQuantization):
+        ram += dimensions
+    elif isinstance(profile.quantization, models.BinaryQuantization):
+        ram += -(-dimensions // 8)
+    # Level 0 of the graph holds 2 * m links of 4 bytes per point, the upper levels add little.
+    ram += 2 * (settings.QDRANT_HNSW_M or profile.m or DEFAULT_HNSW_M) * 4
+    return {
+        "ram_mb_per_million_est": ram * points / 1024 ** 2,
+        "disk_mb_per_million_est": (dimensions * 4 if profile.on_disk else 0) * points / 1024 ** 2,
+    }
+
+
+async def wait_indexed(client: AsyncQdrantClient, collection: str, timeout_sec: float) -> float:
+    started_at = time.perf_counter()
+    while time.perf_counter() - started_at < timeout_sec:
+        info = await client.get_collection(collection_name=collection)
+        if info.status == models.CollectionStatus.GREEN:
+            break
+        await asyncio.sleep(0.5)
+    return time.perf_counter() - started_at
+
+
+async def benchmark_profile(client: AsyncQdrantClient, name: StorageProfileEnum, vectors: np.ndarray,
+                            queries: np.ndarray, args) -> Dict:
+    profile = STORAGE_PROFILES[name]
+    collection = f"{args.collection}-{name}"
+    vector_name = get_vector_name()
+    await client.delete_collection(collection_name=collection)
+    memory_before = process_memory(args.qdrant_pid) if args.qdrant_pid else None
+
+    started_at = time.perf_counter()
+    await ensure_collection(client, collection, profile=profile)
+    for start in range(0, len(vectors), args.batch_size):
+        batch = vectors[start:start + args.batch_size]
+        await client.upsert(collection_name=collection, wait=True, points=[
+            models.PointStruct(id=start + index, vector={vector_name: vector.tolist()})
+            for index, vector in enumerate(batch)])
+    upload_sec = time.perf_counter() - started_at
+    index_sec = await wait_indexed(client, collection, args.index_timeout)
+
+    latencies = []
+    recalls = []
+    exact_params = models.SearchParams(exact=True, quantization=models.QuantizationSearchParams(ignore=True))
+    for query in queries:
+        query_vector = models.NamedVector(name=vector_name, vector=query.tolist())
+        started_at = time.perf_counter()
+        points = await client.search(collection_name=collection, query_vector=query_vector, limit=args.k,
+                                     search_params=profile.search_params())
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        exact = await client.search(collection_name=collection, query_vector=query_vector, limit=args.k,
+                                    search_params=exact_params)
+        recalls.append(len({point.id for point in points} & {point.id for point in exact}) / len(exact))
+
+    result = {
+        "profile": str(name),
+        "points": len(vectors),
+        "dimensions": vectors.shape[1],
+        "upload_sec": upload_sec,
+        "index_sec": index_sec,
+        f"recall@{args.k}": statistics.fmean(recalls),
+        "latency_ms_mean": statistics.fmean(latencies),
+        "latency_ms_p50": statistics.median(latencies),
+        "latency_ms_p95": sorted(latencies)[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        **estimate_memory(profile, vectors.shape[1]),
+    }
+    if memory_before is not None:
+        grown_mb = process_memory(args.qdrant_pid).get("pss_mb", 0) - memory_before.get("pss_mb", 0)
+        result["pss_mb_per_million_measured"] = grown_mb * 1_000_000 / len(vectors)
+    if not args.keep:
+        await client.delete_collection(collection_name=collection)
+    return result
+
+
+async def run(args) -> List[Dict]:
+    if settings.QDRANT_LOCATION:
+        print(f"QDRANT_LOCATION={settings.QDRANT_LOCATION}: the local mode ignores quantization and on-disk storage.")
+    dimensions = get_vector_params().size
+    vectors = synthetic_vectors(args.points + args.queries, dimensions, args.clusters, args.seed)
+    vectors, queries = vectors[:args.points], vectors[args.points:]
+
+    client = create_qdrant_client()
+    results = []
+    try:
+        for name in args.profiles:
+            result = await benchmark_profile(client, name, vectors, queries, args)
+            results.append(result)
+            measured = result.get("pss_mb_per_million_measured")
+            print(f"{name:<8} recall@{args.k} {result[f'recall@{args.k}']:.3f}"
+                  f"  latency p50 {result['latency_ms_p50']:.1f} ms  p95 {result['latency_ms_p95']:.1f} ms"
+                  f"  ram/1M {result['ram_mb_per_million_est']:.0f} MB  disk/1M {result['disk_mb_per_million_est']:.0f} MB"
+                  + (f"  measured pss/1M {measured:.0f} MB" if measured is not None else ""))
+    finally:
+        await client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", default=",".join(StorageProfileEnum),
+                        help=f"Comma separated profiles of: {', '.join(StorageProfileEnum)}.")
+    parser.add_argument("--points", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--clusters", type=int, default=256, help="Topics of the synthetic vectors.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=512, help="Points per upsert.")
+    parser.add_argument("--index-timeout", type=float, default=600.0,
+                        help="Seconds to wait for the optimizer to index a collection.")
+    parser.add_argument("--qdrant-pid", type=int, help="Pid of a local Qdrant server to measure its memory.")
+    parser.add_argument("--collection", default="storage-bench", help="Prefix of the scratch collections.")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch collections.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+    args.profiles = [StorageProfileEnum(name.strip()) for name in args.profiles.split(",") if name.strip()]
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
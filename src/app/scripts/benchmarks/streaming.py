@@ -0,0 +1,67 @@
+"""
+Streaming microbenchmark: SSE events/sec of `stream_generator` against the previous per-token path.
+
+    python -m src.app.scripts.benchmarks.streaming --tokens 100000
+    python -m src.app.scripts.benchmarks.streaming --coalesce-tokens 8
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Callable, Dict
+
+from src.app.chat.models import Chunk
+from src.app.chat.streaming import format_to_event_stream, stream_generator
+
+
+async def fake_subscription(tokens: int) -> AsyncIterator[Dict]:
+    created = int(time.time())
+    for index in range(tokens):
+        yield {"id": "chatcmpl-benchmark", "created": created, "model": "gpt-4-1106-preview",
+               "choices": [{"delta": {"content": f" token{index % 97}"}, "finish_reason": None}]}
+    yield {"id": "chatcmpl-benchmark", "created": created, "model": "gpt-4-1106-preview",
+           "choices": [{"delta": {}, "finish_reason": "stop"}]}
+
+
+async def legacy_stream_generator(subscription):
+    """The streaming path as it was before the lean encoder, without its per-token INFO logging."""
+    complete_response: str = ""
+    async for chunk in subscription:
+        complete_response = f"{complete_response}{Chunk.get_chunk_delta_content(chunk=chunk)}"
+        yield format_to_event_stream(json.dumps(Chunk.from_chunk(chunk=chunk).model_dump()))
+
+
+async def measure(name: str, make_stream: Callable[[], AsyncIterator], tokens: int, repeat: int) -> dict:
+    best = float("inf")
+    events = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        events = 0
+        async for _ in make_stream():
+            events += 1
+        best = min(best, time.perf_counter() - start)
+    result = {"name": name, "events": events, "seconds": best, "tokens_per_sec": tokens / best}
+    print(f"{name:<10} {events:>8} events  {best:8.3f}s  {result['tokens_per_sec']:>12.1f} tokens/sec")
+    return result
+
+
+async def run(args):
+    legacy = await measure("legacy", lambda: legacy_stream_generator(fake_subscription(args.tokens)),
+                           args.tokens, args.repeat)
+    lean = await measure("lean", lambda: stream_generator(
+        fake_subscription(args.tokens), coalesce_ms=args.coalesce_ms, coalesce_tokens=args.coalesce_tokens),
+        args.tokens, args.repeat)
+    print(f"speedup: {legacy['seconds'] / lean['seconds']:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=100_000, help="Deltas in the fake completion stream.")
+    parser.add_argument("--coalesce-ms", type=int, default=0)
+    parser.add_argument("--coalesce-tokens", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
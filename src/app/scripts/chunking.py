@@ -0,0 +1,252 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import tiktoken
+
+ENCODING_NAME: str = "cl100k_base"
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?]) +')
+ENCODE_BATCH_SIZE: int = 1024
+ENCODE_THREADS: int = min(8, os.cpu_count() or 1)
+# Streamed text is chunked in segments of about this many characters, cut after a sentence.
+STREAM_SEGMENT_CHARS: int = 1024 * 1024
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = ENCODING_NAME) -> tiktoken.Encoding:
+    return tiktoken.get_encoding(encoding_name)
+
+
+@lru_cache(maxsize=None)
+def _encode_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=ENCODE_THREADS, thread_name_prefix="tiktoken")
+
+
+def _encode_slice(encoding: tiktoken.Encoding, texts: Sequence[str]) -> List[List[int]]:
+    return [encoding.encode_ordinary(text) for text in texts]
+
+
+def encode_batch(encoding: tiktoken.Encoding, texts: Sequence[str]) -> List[List[int]]:
+    """
+    Tokenize many texts at once, special tokens are encoded as plain text.
+
+    `Encoding.encode_batch` builds a thread pool and a future for every text on each call,
+    which costs more than encoding a sentence. The batch is instead cut into one contiguous
+    slice per thread of a shared pool, tiktoken releases the GIL while encoding.
+    """
+    if ENCODE_THREADS == 1 or len(texts) < 2 * ENCODE_THREADS:
+        return _encode_slice(encoding, texts)
+    size = -(-len(texts) // ENCODE_THREADS)
+    slices = [texts[start:start + size] for start in range(0, len(texts), size)]
+    encoded = _encode_executor().map(_encode_slice, [encoding] * len(slices), slices)
+    return [tokens for part in encoded for tokens in part]
+
+
+@dataclass(frozen=True, slots=True)
+class TextChunk:
+    """
+    A chunk of text with its position in the source text.
+
+    `char_start`/`char_end` index the text the chunk was cut from, `token_start`/`token_end`
+    count the tokens of the encoded sentences before the chunk.
+    """
+    text: str
+    char_start: int
+    char_end: int
+    token_start: int
+    token_end: int
+    page: Optional[int] = None
+
+    @property
+    def token_count(self) -> int:
+        return self.token_end - self.token_start
+
+
+@dataclass(slots=True)
+class _Span:
+    char_start: int
+    char_end: int
+    token_start: int
+    token_end: int
+
+
+class Chunker:
+    """
+    Sentence aware token chunker.
+
+    Sentences are tokenized in batches with `encode_batch` and packed greedily into chunks of at most
+    `max_tokens` tokens, consecutive chunks share up to `overlap_tokens` tokens of whole sentences.
+    Sentences longer than `max_tokens` are hard split on token boundaries.
+    Chunk text is sliced from the source text, never rebuilt by concatenation.
+    """
+
+    def __init__(self, max_tokens: int = 500, overlap_tokens: int = 0,
+                 encoding_name: str = ENCODING_NAME, batch_size: int = ENCODE_BATCH_SIZE):
+        if max_tokens <= 0:
+            raise ValueError("max_tokens must be positive.")
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("overlap_tokens must be in [0, max_tokens).")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.batch_size = batch_size
+        self.encoding = get_encoding(encoding_name)
+
+    def chunk(self, text: str, page: Optional[int] = None) -> Iterator[TextChunk]:
+        """
+        Split the text into chunks of at most `max_tokens` tokens.
+
+        params:
+        -------
+            text: str
+                The text to be split into chunks.
+            page: int, optional
+                The page number recorded on every chunk.
+
+        yields:
+        -------
+            chunk: TextChunk
+                The chunks in text order.
+        """
+        return self._pack([text], page)
+
+    def chunk_stream(self, blocks: Iterable[str], page: Optional[int] = None,
+                     segment_chars: int = STREAM_SEGMENT_CHARS) -> Iterator[TextChunk]:
+        """
+        Chunk a text arriving in blocks of any size, such as the decoded blocks of a file.
+
+        Blocks are gathered into segments of about `segment_chars` characters cut after the last sentence
+        boundary, so chunks come out as from `chunk` on the whole text, offsets included, unless a sentence
+        is longer than a segment and is cut between words. Only the current segment and the text of the
+        current chunk are held, never the whole text.
+
+        params:
+        -------
+            blocks: Iterable[str]
+                Consecutive pieces of the text.
+            page: int, optional
+                The page number recorded on every chunk.
+            segment_chars: int
+                Characters gathered before a segment is cut.
+
+        yields:
+        -------
+            chunk: TextChunk
+                The chunks in text order.
+        """
+        return self._pack(self._segments(blocks, segment_chars), page)
+
+    def _pack(self, segments: Iterable[str], page: Optional[int]) -> Iterator[TextChunk]:
+        window: List[_Span] = []
+        window_tokens = 0
+        has_new_span = False
+        # The text from `buffer_start` on, only what the window still covers is kept between segments.
+        buffer = ""
+        buffer_start = 0
+        token_offset = 0
+
+        for segment in segments:
+            segment_start = buffer_start + len(buffer)
+            buffer += segment
+            for span in self._spans(segment, segment_start, token_offset):
+                token_offset = span.token_end
+                span_tokens = span.token_end - span.token_start
+                if window and window_tokens + span_tokens > self.max_tokens:
+                    if has_new_span:
+                        yield self._make_chunk(buffer, buffer_start, window, page)
+                    window, window_tokens = self._overlap(window, self.max_tokens - span_tokens)
+                window.append(span)
+                window_tokens += span_tokens
+                has_new_span = True
+            keep_from = window[0].char_start if window else buffer_start + len(buffer)
+            buffer = buffer[keep_from - buffer_start:]
+            buffer_start = keep_from
+
+        if has_new_span:
+            yield self._make_chunk(buffer, buffer_start, window, page)
+
+    @staticmethod
+    def _segments(blocks: Iterable[str], segment_chars: int) -> Iterator[str]:
+        pending = ""
+        for block in blocks:
+            pending += block
+            if len(pending) < segment_chars:
+                continue
+            boundary = None
+            for boundary in SENTENCE_BOUNDARY.finditer(pending):
+                pass
+            if boundary is not None:
+                cut = boundary.end()
+            else:
+                # No sentence ends here, the text is cut between words, or anywhere without whitespace.
+                cut = max(pending.rfind(" "), pending.rfind("\n")) + 1 or len(pending)
+            yield pending[:cut]
+            pending = pending[cut:]
+        if pending:
+            yield pending
+
+    def _overlap(self, window: List[_Span], room: int) -> Tuple[List[_Span], int]:
+        budget = min(self.overlap_tokens, room)
+        kept_tokens = 0
+        kept = 0
+        for span in reversed(window):
+            span_tokens = span.token_end - span.token_start
+            if kept_tokens + span_tokens > budget:
+                break
+            kept_tokens += span_tokens
+            kept += 1
+        return window[len(window) - kept:], kept_tokens
+
+    def _spans(self, text: str, char_offset: int = 0, token_offset: int = 0) -> Iterator[_Span]:
+        sentences = self._sentences(text)
+        while batch := list(islice(sentences, self.batch_size)):
+            encoded = encode_batch(self.encoding, [sentence for _, _, sentence in batch])
+            for (start, end, _), tokens in zip(batch, encoded):
+                if len(tokens) <= self.max_tokens:
+                    yield _Span(char_offset + start, char_offset + end, token_offset, token_offset + len(tokens))
+                    token_offset += len(tokens)
+                    continue
+                for piece_start, piece_end, piece_tokens in self._hard_split(text, start, end, tokens):
+                    yield _Span(char_offset + piece_start, char_offset + piece_end,
+                                token_offset, token_offset + piece_tokens)
+                    token_offset += piece_tokens
+
+    def _hard_split(self, text: str, start: int, end: int, tokens: List[int]) -> Iterator[Tuple[int, int, int]]:
+        decoded, offsets = self.encoding.decode_with_offsets(tokens)
+        if decoded != text[start:end]:
+            # Tokens do not round trip (e.g. invalid surrogates), fall back to proportional cuts.
+            offsets = [round(i * (end - start) / len(tokens)) for i in range(len(tokens))]
+        for first in range(0, len(tokens), self.max_tokens):
+            last = min(first + self.max_tokens, len(tokens))
+            piece_end = start + offsets[last] if last < len(tokens) else end
+            yield start + offsets[first], piece_end, last - first
+
+    @staticmethod
+    def _sentences(text: str) -> Iterator[Tuple[int, int, str]]:
+        start = 0
+        for boundary in SENTENCE_BOUNDARY.finditer(text):
+            yield from Chunker._trimmed(text[start:boundary.start()], start)
+            start = boundary.end()
+        yield from Chunker._trimmed(text[start:], start)
+
+    @staticmethod
+    def _trimmed(sentence: str, start: int) -> Iterator[Tuple[int, int, str]]:
+        stripped = sentence.strip()
+        if stripped:
+            start += len(sentence) - len(sentence.lstrip())
+            yield start, start + len(stripped), stripped
+
+    @staticmethod
+    def _make_chunk(text: str, text_start: int, window: List[_Span], page: Optional[int]) -> TextChunk:
+        first, last = window[0], window[-1]
+        return TextChunk(
+            text=text[first.char_start - text_start:last.char_end - text_start],
+            char_start=first.char_start,
+            char_end=last.char_end,
+            token_start=first.token_start,
+            token_end=last.token_end,
+            page=page,
+        )
@@ -1,50 +1,207 @@
+import asyncio
+import codecs
+import hashlib
+import io
+import mmap
 import os
-from typing import Dict, List
+import queue
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Executor
+from multiprocessing.managers import SyncManager
+from itertools import groupby, islice
+from operator import itemgetter
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, TypeVar
+from xml.etree import ElementTree
 from PyPDF2 import PdfReader
-from qdrant_client import QdrantClient
-from docx import Document
-import tiktoken
-import re
+from qdrant_client import AsyncQdrantClient, models
 import uuid
+from src.app.core.embeddings import EmbeddingStage, get_vector_name
+from src.app.core.qdrant import (TENANT_FIELD, TenantCollection, ensure_tenant_collection, indexes_sparse_vectors,
+                                  tenant_collection)
+from src.app.core.sparse import SPARSE_VECTOR_NAME, get_sparse_encoder
+from src.app.scripts.chunking import Chunker, TextChunk
 from src.app.settings import settings
 from src.app.core.logs import logger
+from src.app.db import files_queries
 
+HASH_BLOCK_SIZE: int = 1024 * 1024
+# Metadata of a whole file, kept once in its file record instead of in the payload of every chunk.
+FILE_RECORD_FIELDS: tuple[str, ...] = ("file_name", "file_size", "file_extension", "file_type", "file_hash")
+EXISTING_IDS_BATCH_SIZE: int = 256
+CHUNK_ID_NAMESPACE = uuid.UUID("6f0c7a52-1d1e-4b8e-9a39-2a4b8f1c3e57")
+# How often a thread blocked on a full or empty pipeline queue checks whether the pipeline stopped.
+QUEUE_POLL_SEC: float = 0.1
 
-def extract_text_from_pdf(file_path):
+DOCX_NAMESPACE: str = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+DOCX_PARAGRAPH: str = f"{DOCX_NAMESPACE}p"
+DOCX_TEXT: str = f"{DOCX_NAMESPACE}t"
+DOCX_TAB: str = f"{DOCX_NAMESPACE}tab"
+DOCX_BREAKS: tuple[str, ...] = (f"{DOCX_NAMESPACE}br", f"{DOCX_NAMESPACE}cr")
+
+T = TypeVar("T")
+
+
+class UploadResult(NamedTuple):
+    embedded: int
+    reused: int
+
+
+def _extract_pdf_page_range(file_path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    with open(file_path, 'rb') as f:
+        pdf = PdfReader(f)
+        return [(page_num + 1, pdf.pages[page_num].extract_text() or '') for page_num in range(start, stop)]
+
+
+def _chunk_pdf_page_range(file_path: str, start: int, stop: int) -> List[Tuple[int, List[TextChunk]]]:
+    chunker = Chunker(max_tokens=settings.CHUNK_MAX_TOKENS, overlap_tokens=settings.CHUNK_OVERLAP_TOKENS)
+    return [(page_no, list(chunker.chunk(text, page=page_no)))
+            for page_no, text in _extract_pdf_page_range(file_path, start, stop)]
+
+
+def _map_pdf_page_ranges(file_path: str, task: Callable[[str, int, int], List[T]], executor: Optional[Executor],
+                         pages_per_task: int) -> Iterator[T]:
+    with open(file_path, 'rb') as f:
+        num_pages = len(PdfReader(f).pages)
+
+    if executor is None:
+        for start in range(0, num_pages, pages_per_task):
+            yield from task(file_path, start, min(start + pages_per_task, num_pages))
+        return
+
+    page_ranges = iter((start, min(start + pages_per_task, num_pages))
+                       for start in range(0, num_pages, pages_per_task))
+    pending = deque(executor.submit(task, file_path, start, stop)
+                    for start, stop in islice(page_ranges, settings.PDF_MAX_IN_FLIGHT_TASKS))
+    while pending:
+        results = pending.popleft().result()
+        next_range = next(page_ranges, None)
+        if next_range is not None:
+            pending.append(executor.submit(task, file_path, *next_range))
+        yield from results
+
+
+def extract_text_from_pdf(file_path: str, executor: Optional[Executor] = None,
+                          pages_per_task: int = settings.PDF_PAGES_PER_TASK) -> Iterator[Tuple[int, str]]:
+    """
+    Lazily extract the text of a PDF one page at a time.
+
+    params:
+    -------
+        file_path: str
+            The path to the file.
+        executor: Executor, optional
+            When given, page ranges of `pages_per_task` pages are extracted in parallel on it,
+            with a bounded number of ranges in flight.
+        pages_per_task: int
+            The number of pages extracted by a single executor task.
+
+    yields:
+    -------
+        page: tuple[int, str]
+            The 1-based page number and the text of that page, in page order.
+    """
     try:
-        pdf = PdfReader(open(file_path, 'rb'))
-        text = ''
-        num_pages = len(pdf.pages)
-        for page_num in range(num_pages):
-            text += pdf.pages[page_num].extract_text()
-        return text
+        yield from _map_pdf_page_ranges(file_path, _extract_pdf_page_range, executor, pages_per_task)
     except Exception as e:
-        print(f"An error occurred while reading PDF: {e}")
-        return None
+        logger.error(f"An error occurred while reading PDF: {e}")
+        raise
+
+
+def extract_text_from_txt(file_path: str, block_size: int = settings.INGEST_READ_BLOCK_BYTES) -> Iterator[str]:
+    """
+    Lazily decode a UTF-8 text file block by block from a memory map.
+
+    The pages of every block are dropped from the memory of the process once decoded, a character
+    or a line break split between two blocks is decoded with the next one.
 
+    params:
+    -------
+        file_path: str
+            The path to the file.
+        block_size: int
+            Bytes decoded at once.
 
-def extract_text_from_txt(file_path):
+    yields:
+    -------
+        text: str
+            Consecutive pieces of the text, line breaks normalized to `\n`.
+    """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')(), translate=True)
+                for start in range(0, len(mapped), block_size):
+                    stop = min(start + block_size, len(mapped))
+                    text = decoder.decode(mapped[start:stop])
+                    page_start = start - start % mmap.PAGESIZE
+                    mapped.madvise(mmap.MADV_DONTNEED, page_start, stop - page_start)
+                    if text:
+                        yield text
+                text = decoder.decode(b'', final=True)
+                if text:
+                    yield text
     except Exception as e:
-        print(f"An error occurred while reading TXT: {e}")
-        return None
+        logger.error(f"An error occurred while reading TXT: {e}")
+        raise
+
+
+def _docx_paragraph_text(paragraph: ElementTree.Element) -> str:
+    # What python-docx returns as the text of a paragraph: its runs, with tabs and line breaks.
+    parts = []
+    for element in paragraph.iter():
+        if element.tag == DOCX_TEXT:
+            parts.append(element.text or '')
+        elif element.tag == DOCX_TAB:
+            parts.append('\t')
+        elif element.tag in DOCX_BREAKS:
+            parts.append('\n')
+    return ''.join(parts)
+
+
+def extract_text_from_docx(file_path: str) -> Iterator[str]:
+    """
+    Lazily extract the paragraphs of a DOCX file, streamed from the document part of the archive.
+
+    Paragraphs are read in document order, table cells included, and released once yielded,
+    the document is never held as a whole.
 
+    params:
+    -------
+        file_path: str
+            The path to the file.
 
-def extract_text_from_docx(file_path):
+    yields:
+    -------
+        text: str
+            The text of a paragraph followed by a line break.
+    """
     try:
-        doc = Document(file_path)
-        text = ''
-        for para in doc.paragraphs:
-            text += para.text + '\n'
-        return text
+        with zipfile.ZipFile(file_path) as archive, archive.open('word/document.xml') as document:
+            parents: List[ElementTree.Element] = []
+            for event, element in ElementTree.iterparse(document, events=('start', 'end')):
+                if event == 'start':
+                    parents.append(element)
+                    continue
+                parents.pop()
+                if element.tag == DOCX_PARAGRAPH:
+                    yield _docx_paragraph_text(element) + '\n'
+                    # Nested paragraphs, e.g. of text boxes, are emptied before their enclosing paragraph ends.
+                    element.clear()
+                if len(parents) == 2:
+                    # A finished child of the body, the parsed tree never grows past one of them.
+                    parents[-1].remove(element)
     except Exception as e:
-        print(f"An error occurred while reading DOCX: {e}")
-        return None
+        logger.error(f"An error occurred while reading DOCX: {e}")
+        raise
 
 
-def create_chunks(text: str, max_tokens: int = 500) -> list[str]:
+def create_chunks(text: str, max_tokens: int = settings.CHUNK_MAX_TOKENS,
+                  overlap_tokens: int = settings.CHUNK_OVERLAP_TOKENS) -> list[TextChunk]:
     """
         Split the text into chunks of `max_tokens` length.
 
@@ -54,34 +211,17 @@ def create_chunks(text: str, max_tokens: int = 500) -> list[str]:
             The text to be split into chunks.
         max_tokens: int
             The maximum number of tokens per chunk.
+        overlap_tokens: int
+            The maximum number of tokens shared by consecutive chunks.
     returns:
     --------
-        chunks: list[str]
-            A list of chunks of text.
+        chunks: list[TextChunk]
+            A list of chunks of text with their character and token offsets.
     """
-    encoding = tiktoken.get_encoding("cl100k_base")
-    sentences = re.split('(?<=[.!?]) +', text)
-    chunks = []
-    current_chunk = ""
-    current_count = 0
+    return list(Chunker(max_tokens=max_tokens, overlap_tokens=overlap_tokens).chunk(text))
 
-    for sentence in sentences:
-        tokens = encoding.encode(sentence)
-        token_count = len(tokens)
 
-        if current_count + token_count <= max_tokens:
-            current_chunk += " " + sentence
-            current_count += token_count
-        else:
-            chunks.append(current_chunk)
-            current_chunk = sentence
-            current_count = token_count
-
-    chunks.append(current_chunk)
-    return chunks
-
-
-def extract_text_from_file(file_path: str) -> str:
+def extract_text_from_file(file_path: str, executor: Optional[Executor] = None) -> Optional[Iterator[Tuple[Optional[int], str]]]:
     """
     Extract text from files of type PDF, TXT, and DOCX.
 
@@ -89,23 +229,137 @@ def extract_text_from_file(file_path: str) -> str:
     -------
         file_path: str
             The path to the file.
+        executor: Executor, optional
+            Executor used to extract PDF page ranges in parallel.
 
     returns:    
     --------
-        text: str
-            The extracted text.
+        pages: Iterator[tuple[int | None, str]]
+            The extracted text as `(page_no, text)` pairs, `page_no` is None
+            for formats without pages. None if the file type is not supported.
     """
 
     if file_path.endswith('.pdf'):
-        return extract_text_from_pdf(file_path)
+        return extract_text_from_pdf(file_path, executor=executor)
     elif file_path.endswith('.txt'):
-        return extract_text_from_txt(file_path)
+        return _without_pages(extract_text_from_txt(file_path))
     elif file_path.endswith('.docx'):
-        return extract_text_from_docx(file_path)
+        return _without_pages(extract_text_from_docx(file_path))
     else:
         return None
 
 
+def _without_pages(blocks: Iterable[str]) -> Iterator[Tuple[Optional[int], str]]:
+    for text in blocks:
+        yield None, text
+
+
+def create_page_chunks(pages: Iterable[Tuple[Optional[int], str]]) -> Iterator[TextChunk]:
+    """
+    Chunk every extracted page separately so that each chunk keeps its page number.
+
+    Consecutive pieces of the same page, such as the blocks of a text file, are chunked as one
+    streamed text.
+
+    params:
+    -------
+        pages: Iterable[tuple[int | None, str]]
+            The `(page_no, text)` pairs produced by `extract_text_from_file`.
+
+    yields:
+    -------
+        chunk: TextChunk
+            The chunks of every page, offsets are relative to their page.
+    """
+    chunker = Chunker(max_tokens=settings.CHUNK_MAX_TOKENS, overlap_tokens=settings.CHUNK_OVERLAP_TOKENS)
+    for page_no, pieces in groupby(pages, key=itemgetter(0)):
+        yield from chunker.chunk_stream((text for _, text in pieces), page=page_no)
+
+
+def _chunk_text_file(file_path: str, chunks, stopped, batch_size: int):
+    """
+    Process pool task: extract and chunk a text file or document, handing batches of chunks over
+    through the `chunks` queue of a multiprocessing manager. The task gives up once `stopped` is set.
+    """
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                chunks.put(item, timeout=QUEUE_POLL_SEC)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        for batch in batched(create_page_chunks(extract_text_from_file(file_path)), batch_size):
+            if not put((batch, None)):
+                return
+        put((None, None))
+    except Exception as e:
+        put((None, e))
+
+
+def _chunks_from_pool(file_path: str, executor: Executor, manager: SyncManager,
+                      batch_size: int) -> Iterator[Tuple[Optional[int], List[TextChunk]]]:
+    chunks = manager.Queue(settings.INGEST_QUEUED_BATCHES)
+    stopped = manager.Event()
+    task = executor.submit(_chunk_text_file, file_path, chunks, stopped, batch_size)
+    try:
+        while True:
+            try:
+                batch, error = chunks.get(timeout=QUEUE_POLL_SEC)
+            except queue.Empty:
+                # A finished task has queued its last batch already.
+                if task.done() and chunks.empty():
+                    task.result()
+                    raise RuntimeError(f"Chunking of {file_path} ended early.")
+                continue
+            if error is not None:
+                raise error
+            if batch is None:
+                return
+            yield None, batch
+    finally:
+        stopped.set()
+
+
+def extract_chunks_from_file(file_path: str, executor: Optional[Executor] = None, manager: Optional[SyncManager] = None,
+                             batch_size: int = settings.INGEST_UPLOAD_BATCH_SIZE
+                             ) -> Optional[Iterator[Tuple[Optional[int], List[TextChunk]]]]:
+    """
+    Lazily extract and chunk a file, off the calling process when an executor is given.
+
+    With a process pool both the extraction and the chunking of a file run in its workers, so that
+    neither competes with the event loop for the GIL: PDF page ranges are chunked in parallel tasks,
+    a text file or document is streamed by a single task through a bounded queue of `manager`.
+
+    params:
+    -------
+        file_path: str
+            The path to the file.
+        executor: Executor, optional
+            The process pool to extract and chunk on, in the calling thread by default.
+        manager: SyncManager, optional
+            Started manager whose queues carry the chunks of text files and documents out of the pool,
+            required along with `executor` for those formats.
+        batch_size: int
+            The number of chunks handed over at once for formats without pages.
+
+    returns:
+    --------
+        chunks: Iterator[tuple[int | None, list[TextChunk]]]
+            `(page_no, chunks)` pairs in file order, every PDF page comes once even without text,
+            `page_no` is None for formats without pages. None if the file type is not supported.
+    """
+    if file_path.endswith('.pdf'):
+        return _map_pdf_page_ranges(file_path, _chunk_pdf_page_range, executor, settings.PDF_PAGES_PER_TASK)
+    if not file_path.endswith(('.txt', '.docx')):
+        return None
+    if executor is not None and manager is not None:
+        return _chunks_from_pool(file_path, executor, manager, batch_size)
+    return ((None, batch) for batch in batched(create_page_chunks(extract_text_from_file(file_path)), batch_size))
+
+
 def extract_metadata(file_path: str) -> Dict[str, str]:
     """
     Extract all possible metadata from the file,
@@ -134,42 +388,143 @@ def extract_metadata(file_path: str) -> Dict[str, str]:
         return {}
 
 
-def populate_qdrant(client: QdrantClient, documents: List[str], metadata: List[Dict],  ids: List[str], userId: str):
+async def iterate_in_thread(iterable: Iterable[T], max_queued: int) -> AsyncIterator[T]:
+    """
+    Iterate a blocking iterable, such as a lazy extraction and chunking pipeline, in a thread.
+
+    Items are handed over through a queue of at most `max_queued` items, the thread waits while the
+    consumer is behind. Errors of the iterable are raised to the consumer, a consumer that stops
+    early stops the thread.
+    """
+    items: queue.Queue = queue.Queue(max_queued)
+    stopped = threading.Event()
+    end = object()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=QUEUE_POLL_SEC)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((end, None))
+        except BaseException as e:
+            put((end, e))
+
+    threading.Thread(target=produce, name="ingest-producer", daemon=True).start()
+    try:
+        while True:
+            item, error = await asyncio.to_thread(items.get)
+            if error is not None:
+                raise error
+            if item is end:
+                return
+            yield item
+    finally:
+        stopped.set()
+        try:
+            # Releases a `get` still waiting in a thread when the consumer was cancelled.
+            items.put_nowait((end, None))
+        except queue.Full:
+            pass
+
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class PointBatch(NamedTuple):
+    """Points of a batch of chunks still to be stored, vectors already known are set, the others are None."""
+    ids: List[str]
+    documents: List[str]
+    payloads: List[Dict]
+    vectors: List[Optional[List[float]]]
+
+
+async def populate_qdrant(client: AsyncQdrantClient, batches: AsyncIterator[PointBatch], userId: str,
+                          stage: Optional[EmbeddingStage] = None):
     """
-    Populate Qdrant with the provided documents and metadata.
+    Embed the documents of every batch off the event loop and upsert them with their payloads into Qdrant.
+
+    The upsert of a batch runs while the next batch is being embedded. With hybrid retrieval enabled,
+    collections with a sparse vector also get the BM25 weights of every document.
 
     params:
     -------
-        client: QdrantClient
-            The Qdrant client.
-        documents: list[str]
-            A list of documents to be indexed.
-        metadata: list[dict]
-            A list of dictionaries containing the metadata for each document.
-        ids: list[str]
-            A list of ids for each document.
+        client: AsyncQdrantClient
+            The application Qdrant client.
+        batches: AsyncIterator[PointBatch]
+            The points to store, batch by batch.
         userId: str
             The user id of the user who uploaded the file.
+        stage: EmbeddingStage, optional
+            The embedding stage, configured from the settings by default.
 
     """
+    stage = stage or EmbeddingStage()
+    embedded_count = 0
+    embedding_seconds = 0.0
+    pending_upsert: Optional[asyncio.Task] = None
     try:
-        client.add(
-            collection_name=userId,
-            documents=documents,
-            metadata=metadata,
-            ids=ids,
-
-        )
-    except Exception as e:
-        print(f"An error occurred while populating Qdrant: {e}")
-
-
-def text_chunking_and_qdrant_upload(text: str, file_metadata: Dict, userId: str):
+        tenant = tenant_collection(userId)
+        sparse_encoder = get_sparse_encoder() if indexes_sparse_vectors(await ensure_tenant_collection(client, tenant)) else None
+        async for batch in batches:
+            vectors = list(batch.vectors)
+            to_embed = [index for index, vector in enumerate(vectors) if vector is None]
+            if to_embed:
+                started_at = time.perf_counter()
+                embedded = await asyncio.to_thread(list, stage.embed([batch.documents[index] for index in to_embed]))
+                for index, vector in zip(to_embed, embedded):
+                    vectors[index] = vector
+                embedding_seconds += time.perf_counter() - started_at
+                embedded_count += len(to_embed)
+            point_vectors = [{stage.vector_name: vector} for vector in vectors]
+            if sparse_encoder is not None:
+                sparse_vectors = await asyncio.to_thread(sparse_encoder.encode_documents, batch.documents)
+                for point_vector, sparse_vector in zip(point_vectors, sparse_vectors):
+                    point_vector[SPARSE_VECTOR_NAME] = sparse_vector
+
+            if pending_upsert is not None:
+                await pending_upsert
+            pending_upsert = asyncio.create_task(client.upsert(
+                collection_name=tenant.name,
+                points=[
+                    models.PointStruct(id=point_id, vector=point_vector, payload={"document": document, **payload})
+                    for point_id, document, payload, point_vector
+                    in zip(batch.ids, batch.documents, batch.payloads, point_vectors)
+                ],
+                wait=True,
+            ))
+        if pending_upsert is not None:
+            await pending_upsert
+    except BaseException as e:
+        if pending_upsert is not None:
+            pending_upsert.cancel()
+        logger.error(f"An error occurred while populating Qdrant: {e}")
+        raise
+
+    if embedded_count:
+        logger.info(f"Embedded {embedded_count} chunks at {embedded_count / embedding_seconds:.1f} embeddings/sec "
+                    f"(model={stage.model_name}, batch_size={stage.batch_size}, parallel={stage.parallel}).")
+
+
+async def text_chunking_and_qdrant_upload(client: AsyncQdrantClient, text: str, file_metadata: Dict, userId: str) -> Optional[UploadResult]:
     """
     Chunk the text into smaller chunks and upload them to Qdrant.
 
     params: 
     -------
+        client: AsyncQdrantClient
+            The application Qdrant client.
         text: str
             The text to be chunked.
         file_metadata: dict
@@ -178,43 +533,190 @@ def text_chunking_and_qdrant_upload(text: str, file_metadata: Dict, userId: str)
             The user id of the user who uploaded the file.
 
     """
-    client = QdrantClient(host=settings.QDRANT_HOST, port=settings.QDRANT_PORT)
+    if not text:
+        logger.info("No text was provided.")
+        return None
 
-    logger.info(
-        "Started Chunking text and extracting metadata from provided content.")
+    file_metadata = {"file_hash": hashlib.sha256(text.encode()).hexdigest(), **file_metadata}
+    return await chunks_qdrant_upload(client, create_chunks(text), file_metadata, userId)
 
-    documents = []
-    metadata = []
-    ids = []
 
-    if text:
-        chunks = create_chunks(text)
+def hash_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
 
-        for chunk in chunks:
-            doc_id = str(uuid.uuid4())
-            documents.append(chunk)
-            metadata.append(
-                {
-                    "id": doc_id,
-                    "chunk": chunk,
-                    "chunk_length": len(chunk),
-                    "file_name": file_metadata["file_name"],
-                    "file_size": file_metadata["file_size"],
-                    "file_extension": file_metadata["file_extension"],
-                    "file_type": file_metadata["file_type"]
-                }
-            )
-            ids.append(doc_id)
-        logger.info(
-            "Chunking text and extracting metadata from provided content was successful."
+
+def chunk_id(userId: str, file_hash: str, chunk_text: str) -> str:
+    """Content addressed point id, the same chunk of the same file always maps to the same point."""
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{userId}:{file_hash}:{chunk_text}"))
+
+
+def file_id(userId: str, file_hash: str) -> str:
+    """Id of the file record, chunks reference it by the `file_id` payload field."""
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{userId}:{file_hash}"))
+
+
+def chunk_payload(tenant: TenantCollection, chunk: TextChunk, chunk_file_id: str) -> Dict:
+    """
+    Payload of a chunk point: its text, once, under `document`, where it sits in its file and the
+    hash its vector is reused by. The user id is only stored where the collection is shared.
+    """
+    payload = {
+        "document": chunk.text,
+        "file_id": chunk_file_id,
+        "chunk_hash": hashlib.sha256(chunk.text.encode()).hexdigest(),
+        "page": chunk.page,
+        "char_start": chunk.char_start,
+        "char_end": chunk.char_end,
+        "token_start": chunk.token_start,
+        "token_end": chunk.token_end,
+    }
+    if tenant.shared:
+        payload[TENANT_FIELD] = tenant.user_id
+    return payload
+
+
+async def save_file_record(userId: str, file_metadata: Dict, chunks: int):
+    """
+    Write the record of an ingested file. A failure is logged only, the chunks stay searchable
+    and the record is written again by the next upload of the file.
+    """
+    if not files_queries.connected:
+        logger.warning(f"No database pool, the record of {file_metadata['file_name']} is not written.")
+        return
+    try:
+        await files_queries.upsert_ingested_file(
+            id=file_id(userId, file_metadata["file_hash"]),
+            user_id=userId,
+            chunks=chunks,
+            **{field: file_metadata[field] for field in FILE_RECORD_FIELDS},
+        )
+    except Exception as e:
+        logger.error(f"The record of {file_metadata['file_name']} could not be written: {e}")
+
+
+async def existing_point_ids(client: AsyncQdrantClient, userId: str, ids: List[str]) -> Set[str]:
+    # Point ids are derived from the user id, no other user's point can match in a shared collection.
+    existing = set()
+    for start in range(0, len(ids), EXISTING_IDS_BATCH_SIZE):
+        records = await client.retrieve(
+            collection_name=tenant_collection(userId).name,
+            ids=ids[start:start + EXISTING_IDS_BATCH_SIZE],
+            with_payload=False,
+            with_vectors=False,
         )
+        existing.update(str(record.id) for record in records)
+    return existing
+
+
+async def reusable_vectors(client: AsyncQdrantClient, userId: str, chunk_hashes: List[str]) -> Dict[str, List[float]]:
+    """Vectors of points that already hold the same chunk text, e.g. from a previous version of the file."""
+    vector_name = get_vector_name()
+    tenant = tenant_collection(userId)
+    vectors = {}
+    unique_hashes = list(dict.fromkeys(chunk_hashes))
+    for start in range(0, len(unique_hashes), EXISTING_IDS_BATCH_SIZE):
+        batch = unique_hashes[start:start + EXISTING_IDS_BATCH_SIZE]
+        offset = None
+        while True:
+            records, offset = await client.scroll(
+                collection_name=tenant.name,
+                scroll_filter=tenant.filter(models.FieldCondition(key="chunk_hash", match=models.MatchAny(any=batch))),
+                limit=EXISTING_IDS_BATCH_SIZE,
+                offset=offset,
+                with_payload=["chunk_hash"],
+                with_vectors=[vector_name],
+            )
+            for record in records:
+                vectors.setdefault(record.payload["chunk_hash"], record.vector[vector_name])
+            if offset is None:
+                break
+    return vectors
 
-    else:
-        logger.info("No text was provided.")
 
-    if documents and metadata and ids:
-        logger.info("Started populating Qdrant..")
-        populate_qdrant(client, documents, metadata, ids, userId)
-        logger.info("Qdrant was populated.")
-    else:
-        logger.info("No documents, metadata, or ids were provided.")
+async def chunks_qdrant_upload(client: AsyncQdrantClient, chunks: Iterable[TextChunk], file_metadata: Dict, userId: str,
+                               batch_size: int = settings.INGEST_UPLOAD_BATCH_SIZE,
+                               on_batch: Optional[Callable[[UploadResult], None]] = None) -> UploadResult:
+    """
+    Attach the file metadata to the chunks and upload the ones not stored yet to Qdrant, batch by batch.
+
+    The chunks are drawn in a thread, a lazy extraction and chunking pipeline keeps producing them
+    while earlier batches are embedded and upserted, with at most `INGEST_QUEUED_BATCHES` batches in
+    between. Memory use depends on the batch size, not on the size of the file.
+
+    params:
+    -------
+        client: AsyncQdrantClient
+            The application Qdrant client.
+        chunks: Iterable[TextChunk]
+            The chunks produced by `create_page_chunks`, lazily or as a list.
+        file_metadata: dict
+            A dictionary containing the metadata of the file, including its `file_hash`.
+        userId: str
+            The user id of the user who uploaded the file.
+        batch_size: int
+            Chunks embedded and upserted at once.
+        on_batch: Callable[[UploadResult], None], optional
+            Called with the counts so far once a batch is deduplicated.
+
+    returns:
+    --------
+        result: UploadResult
+            How many chunks were newly embedded and how many were already stored
+            or reused the vector of an identical chunk.
+    """
+    tenant = tenant_collection(userId)
+    chunk_file_id = file_id(userId, file_metadata["file_hash"])
+    embedded = 0
+    reused = 0
+
+    async def point_batches() -> AsyncIterator[PointBatch]:
+        nonlocal embedded, reused
+        async for batch in iterate_in_thread(batched(chunks, batch_size), settings.INGEST_QUEUED_BATCHES):
+            if not embedded + reused:
+                # The record is written first, no stored chunk references a missing record.
+                await save_file_record(userId, file_metadata, 0)
+            ids = []
+            documents = []
+            payloads = []
+            seen_ids = set()
+            for chunk in batch:
+                doc_id = chunk_id(userId, file_metadata["file_hash"], chunk.text)
+                if doc_id in seen_ids:
+                    continue
+                seen_ids.add(doc_id)
+                payload = chunk_payload(tenant, chunk, chunk_file_id)
+                documents.append(payload.pop("document"))
+                payloads.append(payload)
+                ids.append(doc_id)
+
+            # Repeated chunks of earlier batches are found stored, unless their upsert is still running,
+            # they are then embedded again and upserted to the same point.
+            existing = await existing_point_ids(client, userId, ids)
+            new = [index for index, doc_id in enumerate(ids) if doc_id not in existing]
+            known_vectors = await reusable_vectors(client, userId, [payloads[index]["chunk_hash"] for index in new])
+            vectors = [known_vectors.get(payloads[index]["chunk_hash"]) for index in new]
+            batch_embedded = sum(vector is None for vector in vectors)
+            embedded += batch_embedded
+            reused += len(ids) - batch_embedded
+            if on_batch is not None:
+                on_batch(UploadResult(embedded=embedded, reused=reused))
+            if new:
+                yield PointBatch(
+                    ids=[ids[index] for index in new],
+                    documents=[documents[index] for index in new],
+                    payloads=[payloads[index] for index in new],
+                    vectors=vectors,
+                )
+
+    logger.info("Started populating Qdrant..")
+    await populate_qdrant(client, point_batches(), userId)
+    if not embedded + reused:
+        logger.info("No chunks were provided.")
+        return UploadResult(embedded=0, reused=0)
+    await save_file_record(userId, file_metadata, embedded + reused)
+    logger.info(f"Qdrant was populated, {embedded} chunks embedded, {reused} chunks reused.")
+    return UploadResult(embedded=embedded, reused=reused)
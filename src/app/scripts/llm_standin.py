@@ -0,0 +1,114 @@
+"""
+Local stand-in for an OpenAI compatible chat completions backend, for offline load tests.
+
+Answers are made of filler tokens. Every completion waits for a time to first token and then produces
+tokens at a fixed rate, with a relative jitter on both, so latencies look like a real backend's
+without any model or network.
+
+    python -m src.app.scripts.llm_standin --port 8001 --ttft-ms 400 --tokens-per-sec 40
+    LLAMA2_API_BASE=http://localhost:8001/v1 OPENAI_API_BASE=http://localhost:8001/v1 gunicorn ... main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List
+
+import uvicorn
+from fastapi import FastAPI
+from pydantic import BaseModel
+from starlette.responses import StreamingResponse
+
+FILLER = ("The", " answer", " is", " based", " on", " the", " retrieved", " context", ",", " see", " the", " cited",
+          " documents", " for", " details", ".")
+
+
+@dataclass(frozen=True)
+class StandinProfile:
+    ttft_ms: float
+    tokens_per_sec: float
+    answer_tokens: int
+    jitter: float
+
+
+class ChatCompletionRequest(BaseModel):
+    model: str
+    messages: List[Dict[str, str]]
+    stream: bool = False
+    max_tokens: int | None = None
+
+
+def create_app(profile: StandinProfile) -> FastAPI:
+    app = FastAPI(title="LLM stand-in")
+
+    def jittered(value: float) -> float:
+        return max(0.0, value * random.uniform(1 - profile.jitter, 1 + profile.jitter))
+
+    def completion_tokens(request: ChatCompletionRequest) -> int:
+        return min(request.max_tokens or profile.answer_tokens, profile.answer_tokens)
+
+    def chunk(completion_id: str, created: int, model: str, delta: Dict, finish_reason=None) -> str:
+        return "data: " + json.dumps({
+            "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }) + "\n\n"
+
+    async def events(request: ChatCompletionRequest) -> AsyncIterator[str]:
+        completion_id, created = f"chatcmpl-{uuid.uuid4().hex}", int(time.time())
+        token_interval = 1 / jittered(profile.tokens_per_sec)
+        await asyncio.sleep(jittered(profile.ttft_ms) / 1000)
+        yield chunk(completion_id, created, request.model, {"role": "assistant", "content": ""})
+        # Tokens are paced against a schedule, not by sleeping a fixed interval, so timer overhead does not add up.
+        started_at = time.perf_counter()
+        for index in range(completion_tokens(request)):
+            delay = started_at + index * token_interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield chunk(completion_id, created, request.model, {"content": FILLER[index % len(FILLER)]})
+        yield chunk(completion_id, created, request.model, {}, "stop")
+        yield "data: [DONE]\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: ChatCompletionRequest):
+        if request.stream:
+            return StreamingResponse(events(request), media_type="text/event-stream")
+        tokens = completion_tokens(request)
+        await asyncio.sleep(jittered(profile.ttft_ms) / 1000 + tokens / jittered(profile.tokens_per_sec))
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                "role": "assistant", "content": "".join(FILLER[index % len(FILLER)] for index in range(tokens))}}],
+            "usage": {"prompt_tokens": sum(len(message.get("content", "").split()) for message in request.messages),
+                      "completion_tokens": tokens},
+        }
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": []}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ttft-ms", type=float, default=400.0, help="Time to first token.")
+    parser.add_argument("--tokens-per-sec", type=float, default=40.0)
+    parser.add_argument("--answer-tokens", type=int, default=200, help="Tokens of an answer, capped by max_tokens.")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Relative jitter of the TTFT and token rate.")
+    args = parser.parse_args()
+
+    profile = StandinProfile(ttft_ms=args.ttft_ms, tokens_per_sec=args.tokens_per_sec,
+                             answer_tokens=args.answer_tokens, jitter=args.jitter)
+    uvicorn.run(create_app(profile), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Move per-user collections into the shared multitenant collection.
+
+Every point is copied with its vectors and payload, tagged with the user id of its collection, in
+batches that are upserted while the next batch is read. Point ids are kept, a migration can be
+interrupted and run again. With hybrid retrieval enabled, points of collections created without it
+get their BM25 sparse vector on the way, without it sparse vectors are left out of the shared collection. A user is only reported migrated once the shared collection holds as many
+of its points as its own collection, which is then deleted with --delete-source.
+
+Run it before switching QDRANT_LAYOUT to "shared", and again afterwards to move the uploads that
+arrived in between.
+
+    python -m src.app.scripts.migrate_collections --dry-run
+    python -m src.app.scripts.migrate_collections --users alice,bob --batch-size 512
+    python -m src.app.scripts.migrate_collections --delete-source --output migration.json
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional
+
+from qdrant_client import AsyncQdrantClient, models
+
+from src.app.core.constants import QdrantLayoutEnum
+from src.app.core.embeddings import get_vector_name
+from src.app.core.logs import logger
+from src.app.core.qdrant import (TENANT_FIELD, create_qdrant_client, ensure_collection, has_sparse_vectors,
+                                  tenant_collection)
+from src.app.core.sparse import SPARSE_VECTOR_NAME, get_sparse_encoder
+from src.app.settings import settings
+
+
+async def user_collections(client: AsyncQdrantClient, users: Optional[List[str]]) -> List[str]:
+    names = [collection.name for collection in (await client.get_collections()).collections]
+    names = [name for name in names if name != settings.QDRANT_COLLECTION_NAME]
+    return [name for name in names if name in users] if users else names
+
+
+async def migrate_user(client: AsyncQdrantClient, user_id: str, batch_size: int, dry_run: bool) -> Dict:
+    shared = tenant_collection(user_id, layout=QdrantLayoutEnum.SHARED)
+    source = await client.get_collection(collection_name=user_id)
+    source_vectors = source.config.params.vectors
+    if not isinstance(source_vectors, dict) or get_vector_name() not in source_vectors:
+        return {"user_id": user_id, "status": "skipped",
+                "error": f"no {get_vector_name()} vector, the collection was not created by this application"}
+    source_points = (await client.count(collection_name=user_id, exact=True)).count
+    if dry_run:
+        return {"user_id": user_id, "status": "dry_run", "points": source_points}
+
+    started_at = time.perf_counter()
+    target_sparse = has_sparse_vectors(await client.get_collection(collection_name=shared.name))
+    sparse_encoder = get_sparse_encoder() if target_sparse and settings.RETRIEVAL_HYBRID_ENABLED else None
+    copied = 0
+    offset = None
+    pending_upsert: Optional[asyncio.Task] = None
+    try:
+        while True:
+            records, offset = await client.scroll(
+                collection_name=user_id, limit=batch_size, offset=offset, with_payload=True, with_vectors=True)
+            if not records:
+                break
+            if not target_sparse:
+                for record in records:
+                    record.vector.pop(SPARSE_VECTOR_NAME, None)
+            missing_sparse = [record for record in records if SPARSE_VECTOR_NAME not in record.vector]
+            if sparse_encoder is not None and missing_sparse:
+                sparse_vectors = await asyncio.to_thread(
+                    sparse_encoder.encode_documents, [record.payload.get("document", "") for record in missing_sparse])
+                for record, sparse_vector in zip(missing_sparse, sparse_vectors):
+                    record.vector[SPARSE_VECTOR_NAME] = sparse_vector
+
+            if pending_upsert is not None:
+                await pending_upsert
+            pending_upsert = asyncio.create_task(client.upsert(
+                collection_name=shared.name,
+                points=[models.PointStruct(id=record.id, vector=record.vector,
+                                           payload={**record.payload, TENANT_FIELD: user_id})
+                        for record in records],
+                wait=True,
+            ))
+            copied += len(records)
+            if offset is None:
+                break
+        if pending_upsert is not None:
+            await pending_upsert
+    except BaseException:
+        if pending_upsert is not None:
+            pending_upsert.cancel()
+        raise
+
+    migrated_points = (await client.count(
+        collection_name=shared.name, count_filter=shared.filter(), exact=True)).count
+    return {
+        "user_id": user_id,
+        "status": "migrated" if migrated_points >= source_points else "incomplete",
+        "points": source_points,
+        "copied": copied,
+        "points_in_shared": migrated_points,
+        "seconds": time.perf_counter() - started_at,
+    }
+
+
+async def run(args) -> List[Dict]:
+    client = create_qdrant_client()
+    results = []
+    try:
+        if not args.dry_run:
+            await ensure_collection(client, settings.QDRANT_COLLECTION_NAME, multitenant=True)
+        for user_id in await user_collections(client, args.users):
+            try:
+                result = await migrate_user(client, user_id, args.batch_size, args.dry_run)
+            except Exception as e:
+                logger.error(f"Migration of {user_id} failed: {e}")
+                result = {"user_id": user_id, "status": "failed", "error": str(e)}
+            if args.delete_source and result["status"] == "migrated":
+                await client.delete_collection(collection_name=user_id)
+                result["source_deleted"] = True
+            results.append(result)
+            print(json.dumps(result))
+    finally:
+        await client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", help="Comma separated users to migrate, every per-user collection by default.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Points read and upserted per request.")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the collections and their point counts.")
+    parser.add_argument("--delete-source", action="store_true",
+                        help="Delete a user's collection once all of its points are in the shared collection.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+    args.users = [user.strip() for user in args.users.split(",") if user.strip()] if args.users else None
+
+    results = asyncio.run(run(args))
+    counts: Dict[str, int] = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    print(f"{len(results)} collections: {', '.join(f'{count} {status}' for status, count in sorted(counts.items()))}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Rewrite the payloads of points stored before the compact chunk payload.
+
+Older points carry their text twice, under `document` and `chunk`, next to their point id and a copy
+of the metadata of their file. Every such point is rewritten to the payload `chunk_payload` builds:
+the text once and a `file_id` referencing the record of its file, which is written to the database
+before the first point referencing it is rewritten. Points already in the compact form are left
+alone, an interrupted rewrite can be run again. Vectors and point ids are not touched.
+
+    python -m src.app.scripts.slim_payloads --dry-run
+    python -m src.app.scripts.slim_payloads --collections alice,bob --batch-size 512 --output slim.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+from qdrant_client import AsyncQdrantClient, models
+
+from src.app.core.logs import logger
+from src.app.core.qdrant import TENANT_FIELD, create_qdrant_client
+from src.app.db import files_queries
+from src.app.scripts.ingest import FILE_RECORD_FIELDS, file_id
+from src.app.settings import settings
+
+# Where a chunk sits in its file, kept as is.
+POSITION_FIELDS: Tuple[str, ...] = ("page", "char_start", "char_end", "token_start", "token_end")
+# Only stored by the old payload.
+LEGACY_FIELDS: Tuple[str, ...] = ("id", "chunk", "chunk_length", *FILE_RECORD_FIELDS)
+
+
+def payload_size(payload: Dict) -> int:
+    return len(json.dumps(payload, ensure_ascii=False).encode())
+
+
+def slim_payload(payload: Dict, user_id: str, shared: bool) -> Tuple[Dict, Optional[Dict]]:
+    """The compact payload of a legacy point, and the record of its file if the point knows its file hash."""
+    document = payload.get("document") or payload.get("chunk") or ""
+    slim = {
+        "document": document,
+        "chunk_hash": payload.get("chunk_hash") or hashlib.sha256(document.encode()).hexdigest(),
+        **{field: payload[field] for field in POSITION_FIELDS if field in payload},
+    }
+    if shared:
+        slim[TENANT_FIELD] = user_id
+    if not payload.get("file_hash"):
+        # Points stored before files were hashed keep their file metadata, there is no id to reference a record by.
+        slim.update({field: payload[field] for field in FILE_RECORD_FIELDS if field in payload})
+        return slim, None
+    slim["file_id"] = file_id(user_id, payload["file_hash"])
+    record = {"id": slim["file_id"], "user_id": user_id,
+              **{field: payload.get(field) or "" for field in FILE_RECORD_FIELDS},
+              "file_size": int(payload.get("file_size") or 0)}
+    return slim, record
+
+
+async def rewrite_collection(client: AsyncQdrantClient, collection: str, batch_size: int, dry_run: bool) -> Dict:
+    shared = collection == settings.QDRANT_COLLECTION_NAME
+    started_at = time.perf_counter()
+    points = rewritten = bytes_before = bytes_after = 0
+    records: Dict[str, Dict] = {}
+    offset = None
+    while True:
+        batch, offset = await client.scroll(
+            collection_name=collection, limit=batch_size, offset=offset, with_payload=True, with_vectors=False)
+        operations = []
+        touched: Dict[str, Dict] = {}
+        for point in batch:
+            points += 1
+            payload = point.payload or {}
+            size = payload_size(payload)
+            bytes_before += size
+            user_id = payload.get(TENANT_FIELD, "") if shared else collection
+            if not any(field in payload for field in LEGACY_FIELDS) or not user_id:
+                bytes_after += size
+                continue
+            slim, record = slim_payload(payload, user_id, shared)
+            bytes_after += payload_size(slim)
+            rewritten += 1
+            if record is not None:
+                record = records.setdefault(record["id"], {**record, "chunks": 0})
+                record["chunks"] += 1
+                touched[record["id"]] = record
+            operations.append(models.OverwritePayloadOperation(
+                overwrite_payload=models.SetPayload(payload=slim, points=[point.id])))
+
+        if operations and not dry_run:
+            # Running chunk counts, the last batch of a file leaves its total.
+            if touched:
+                await files_queries.upsert_ingested_file.executemany(touched.values())
+            await client.batch_update_points(collection_name=collection, update_operations=operations, wait=True)
+        if offset is None:
+            break
+
+    return {
+        "collection": collection,
+        "status": "dry_run" if dry_run else "rewritten",
+        "points": points,
+        "rewritten": rewritten,
+        "file_records": len(records),
+        "payload_mb_before": bytes_before / 1024 ** 2,
+        "payload_mb_after": bytes_after / 1024 ** 2,
+        "seconds": time.perf_counter() - started_at,
+    }
+
+
+async def run(args) -> List[Dict]:
+    client = create_qdrant_client()
+    results = []
+    try:
+        if not args.dry_run:
+            # Without the database the file metadata of the points would be lost, nothing is rewritten then.
+            await files_queries.connect(min_size=1, max_size=settings.DATABASE_FILES_POOL_MAX_SIZE)
+        collections = [collection.name for collection in (await client.get_collections()).collections]
+        for collection in [name for name in collections if name in args.collections] if args.collections else collections:
+            try:
+                result = await rewrite_collection(client, collection, args.batch_size, args.dry_run)
+            except Exception as e:
+                logger.error(f"Rewrite of {collection} failed: {e}")
+                result = {"collection": collection, "status": "failed", "error": str(e)}
+            results.append(result)
+            print(json.dumps(result))
+    finally:
+        await files_queries.close()
+        await client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collections", help="Comma separated collections to rewrite, every collection by default.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Points read and rewritten per request.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the payload sizes before and after.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+    args.collections = [name.strip() for name in args.collections.split(",") if name.strip()] if args.collections else None
+
+    results = asyncio.run(run(args))
+    before = sum(result.get("payload_mb_before", 0) for result in results)
+    after = sum(result.get("payload_mb_after", 0) for result in results)
+    print(f"{len(results)} collections, payloads {before:.1f} MB -> {after:.1f} MB")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
+from typing import Optional
+
 from pydantic import Field
 from pydantic_settings import BaseSettings
-from src.app.core.constants import Environments
+from src.app.core.constants import Environments, QdrantLayoutEnum, StorageProfileEnum
 
 
 class Settings(BaseSettings):
@@ -9,14 +11,159 @@ class Settings(BaseSettings):
         env="ENVIRONMENT", default=Environments.LOCAL.value)
 
     DATABASE_URL: str = Field(env="DATABASE_URL")
+    DATABASE_POOL_MIN_SIZE: int = Field(env="DATABASE_POOL_MIN_SIZE", default=2)
+    DATABASE_POOL_MAX_SIZE: int = Field(env="DATABASE_POOL_MAX_SIZE", default=10)
+    DATABASE_FILES_POOL_MAX_SIZE: int = Field(
+        env="DATABASE_FILES_POOL_MAX_SIZE", default=4)
+    DATABASE_JOBS_POOL_MAX_SIZE: int = Field(
+        env="DATABASE_JOBS_POOL_MAX_SIZE", default=2)
+    DATABASE_COMMAND_TIMEOUT_SEC: float = Field(
+        env="DATABASE_COMMAND_TIMEOUT_SEC", default=30.0)
+    DATABASE_STATEMENT_CACHE_SIZE: int = Field(
+        env="DATABASE_STATEMENT_CACHE_SIZE", default=100)
+    DATABASE_MAX_INACTIVE_CONNECTION_LIFETIME_SEC: float = Field(
+        env="DATABASE_MAX_INACTIVE_CONNECTION_LIFETIME_SEC", default=300.0)
+    DATABASE_HEALTH_TIMEOUT_SEC: float = Field(
+        env="DATABASE_HEALTH_TIMEOUT_SEC", default=2.0)
     OPENAI_API_KEY: str = Field(env="OPENAI_API_KEY", default="None")
+    OPENAI_API_BASE: str = Field(
+        env="OPENAI_API_BASE", default="https://api.openai.com/v1")
+    LLAMA2_API_BASE: str = Field(
+        env="LLAMA2_API_BASE", default="http://localhost:8001/v1")
+    LLAMA2_API_KEY: Optional[str] = Field(env="LLAMA2_API_KEY", default=None)
+    LLM_HTTP2: bool = Field(env="LLM_HTTP2", default=True)
+    LLM_MAX_CONNECTIONS: int = Field(env="LLM_MAX_CONNECTIONS", default=100)
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = Field(
+        env="LLM_MAX_KEEPALIVE_CONNECTIONS", default=20)
+    LLM_KEEPALIVE_EXPIRY_SEC: float = Field(
+        env="LLM_KEEPALIVE_EXPIRY_SEC", default=60.0)
+    LLM_CONNECT_TIMEOUT_SEC: float = Field(
+        env="LLM_CONNECT_TIMEOUT_SEC", default=5.0)
     GENERATION_TIMEOUT_SEC: int = Field(
         env="GENERATION_TIMEOUT_SEC", default=120)
+    STAGE_TIMING_WINDOW: int = Field(env="STAGE_TIMING_WINDOW", default=2048)
+    LLM_MAX_CONCURRENCY: int = Field(env="LLM_MAX_CONCURRENCY", default=32)
+    LLM_MAX_CONCURRENCY_PER_USER: int = Field(
+        env="LLM_MAX_CONCURRENCY_PER_USER", default=4)
+    LLM_MAX_QUEUED: int = Field(env="LLM_MAX_QUEUED", default=64)
+    LLM_QUEUE_TIMEOUT_SEC: float = Field(
+        env="LLM_QUEUE_TIMEOUT_SEC", default=10.0)
+    STREAM_COALESCE_MS: int = Field(env="STREAM_COALESCE_MS", default=0)
+    STREAM_COALESCE_TOKENS: int = Field(
+        env="STREAM_COALESCE_TOKENS", default=0)
+
+    MESSAGE_WRITE_BATCH_SIZE: int = Field(
+        env="MESSAGE_WRITE_BATCH_SIZE", default=100)
+    MESSAGE_WRITE_FLUSH_INTERVAL_SEC: float = Field(
+        env="MESSAGE_WRITE_FLUSH_INTERVAL_SEC", default=1.0)
+    MESSAGE_WRITE_MAX_BUFFERED: int = Field(
+        env="MESSAGE_WRITE_MAX_BUFFERED", default=10000)
+    MEMORY_ENABLED: bool = Field(env="MEMORY_ENABLED", default=False)
+    MEMORY_TOKEN_BUDGET: int = Field(env="MEMORY_TOKEN_BUDGET", default=2000)
+    MEMORY_MAX_RECENT_TURNS: int = Field(
+        env="MEMORY_MAX_RECENT_TURNS", default=20)
+    MEMORY_FOLD_BATCH_SIZE: int = Field(env="MEMORY_FOLD_BATCH_SIZE", default=50)
+    MEMORY_SUMMARY_MAX_TOKENS: int = Field(
+        env="MEMORY_SUMMARY_MAX_TOKENS", default=400)
+    PAGINATION_DEFAULT_LIMIT: int = Field(
+        env="PAGINATION_DEFAULT_LIMIT", default=50)
+    PAGINATION_MAX_LIMIT: int = Field(env="PAGINATION_MAX_LIMIT", default=200)
 
     QDRANT_HOST: str = Field(env="QDRANT_HOST", default="localhost")
     QDRANT_PORT: int = Field(env="QDRANT_PORT", default=9999)
     QDRANT_COLLECTION_NAME: str = Field(
         env="QDRANT_COLLECTION_NAME", default="demo")
+    QDRANT_LAYOUT: QdrantLayoutEnum = Field(
+        env="QDRANT_LAYOUT", default=QdrantLayoutEnum.PER_USER)
+    QDRANT_TENANT_PAYLOAD_M: int = Field(
+        env="QDRANT_TENANT_PAYLOAD_M", default=16)
+    QDRANT_STORAGE_PROFILE: StorageProfileEnum = Field(
+        env="QDRANT_STORAGE_PROFILE", default=StorageProfileEnum.DEFAULT)
+    QDRANT_HNSW_M: Optional[int] = Field(env="QDRANT_HNSW_M", default=None)
+    QDRANT_HNSW_EF_CONSTRUCT: Optional[int] = Field(
+        env="QDRANT_HNSW_EF_CONSTRUCT", default=None)
+    QDRANT_HNSW_EF: Optional[int] = Field(env="QDRANT_HNSW_EF", default=None)
+    QDRANT_LOCATION: Optional[str] = Field(env="QDRANT_LOCATION", default=None)
+    QDRANT_GRPC_PORT: int = Field(env="QDRANT_GRPC_PORT", default=6334)
+    QDRANT_PREFER_GRPC: bool = Field(env="QDRANT_PREFER_GRPC", default=False)
+    QDRANT_TIMEOUT_SEC: int = Field(env="QDRANT_TIMEOUT_SEC", default=30)
+    QDRANT_MAX_CONNECTIONS: int = Field(
+        env="QDRANT_MAX_CONNECTIONS", default=100)
+    QDRANT_MAX_KEEPALIVE_CONNECTIONS: int = Field(
+        env="QDRANT_MAX_KEEPALIVE_CONNECTIONS", default=20)
+    QDRANT_KEEPALIVE_EXPIRY_SEC: float = Field(
+        env="QDRANT_KEEPALIVE_EXPIRY_SEC", default=30.0)
+
+    EMBEDDING_MODEL: str = Field(
+        env="EMBEDDING_MODEL", default="BAAI/bge-small-en")
+    EMBEDDING_BATCH_SIZE: int = Field(env="EMBEDDING_BATCH_SIZE", default=64)
+    EMBEDDING_PARALLEL: Optional[int] = Field(
+        env="EMBEDDING_PARALLEL", default=None)
+    EMBEDDING_THREADS: Optional[int] = Field(
+        env="EMBEDDING_THREADS", default=None)
+    EMBEDDING_LOAD_ON_STARTUP: bool = Field(
+        env="EMBEDDING_LOAD_ON_STARTUP", default=True)
+    EMBEDDING_CACHE_MAX_BYTES: int = Field(
+        env="EMBEDDING_CACHE_MAX_BYTES", default=32 * 1024 * 1024)
+    EMBEDDING_CACHE_TTL_SEC: int = Field(
+        env="EMBEDDING_CACHE_TTL_SEC", default=3600)
+
+    RETRIEVAL_LIMIT: int = Field(env="RETRIEVAL_LIMIT", default=10)
+    RETRIEVAL_HYBRID_ENABLED: bool = Field(
+        env="RETRIEVAL_HYBRID_ENABLED", default=False)
+    RETRIEVAL_HYBRID_CANDIDATES: int = Field(
+        env="RETRIEVAL_HYBRID_CANDIDATES", default=30)
+    RETRIEVAL_RRF_K: int = Field(env="RETRIEVAL_RRF_K", default=60)
+    RETRIEVAL_DENSE_WEIGHT: float = Field(
+        env="RETRIEVAL_DENSE_WEIGHT", default=1.0)
+    RETRIEVAL_SPARSE_WEIGHT: float = Field(
+        env="RETRIEVAL_SPARSE_WEIGHT", default=1.0)
+    CONTEXT_TOKEN_BUDGET: int = Field(env="CONTEXT_TOKEN_BUDGET", default=3000)
+    CONTEXT_MAX_CHUNKS: int = Field(env="CONTEXT_MAX_CHUNKS", default=8)
+    CONTEXT_MMR_LAMBDA: float = Field(env="CONTEXT_MMR_LAMBDA", default=0.7)
+    CONTEXT_DUPLICATE_THRESHOLD: float = Field(
+        env="CONTEXT_DUPLICATE_THRESHOLD", default=0.9)
+    SPARSE_BM25_K1: float = Field(env="SPARSE_BM25_K1", default=1.2)
+    SPARSE_BM25_B: float = Field(env="SPARSE_BM25_B", default=0.75)
+    SPARSE_AVG_DOC_LENGTH: float = Field(
+        env="SPARSE_AVG_DOC_LENGTH", default=250.0)
+
+    QA_SINGLEFLIGHT_ENABLED: bool = Field(
+        env="QA_SINGLEFLIGHT_ENABLED", default=True)
+
+    ANSWER_CACHE_ENABLED: bool = Field(
+        env="ANSWER_CACHE_ENABLED", default=False)
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = Field(
+        env="ANSWER_CACHE_SIMILARITY_THRESHOLD", default=0.95)
+    ANSWER_CACHE_MAX_ENTRIES_PER_USER: int = Field(
+        env="ANSWER_CACHE_MAX_ENTRIES_PER_USER", default=256)
+    ANSWER_CACHE_MAX_USERS: int = Field(
+        env="ANSWER_CACHE_MAX_USERS", default=10000)
+    ANSWER_CACHE_TTL_SEC: int = Field(
+        env="ANSWER_CACHE_TTL_SEC", default=3600)
+
+    INGEST_MAX_CONCURRENT_FILES: int = Field(
+        env="INGEST_MAX_CONCURRENT_FILES", default=2)
+    INGEST_PROCESS_WORKERS: int = Field(
+        env="INGEST_PROCESS_WORKERS", default=2)
+    INGEST_MAX_RETAINED_JOBS: int = Field(
+        env="INGEST_MAX_RETAINED_JOBS", default=1000)
+    INGEST_JOB_SAVE_INTERVAL_SEC: float = Field(
+        env="INGEST_JOB_SAVE_INTERVAL_SEC", default=1.0)
+    INGEST_JOB_HEARTBEAT_SEC: float = Field(
+        env="INGEST_JOB_HEARTBEAT_SEC", default=10.0)
+    INGEST_JOB_STALE_SEC: float = Field(
+        env="INGEST_JOB_STALE_SEC", default=60.0)
+    INGEST_READ_BLOCK_BYTES: int = Field(
+        env="INGEST_READ_BLOCK_BYTES", default=1024 * 1024)
+    INGEST_UPLOAD_BATCH_SIZE: int = Field(
+        env="INGEST_UPLOAD_BATCH_SIZE", default=256)
+    INGEST_QUEUED_BATCHES: int = Field(env="INGEST_QUEUED_BATCHES", default=4)
+    CHUNK_MAX_TOKENS: int = Field(env="CHUNK_MAX_TOKENS", default=500)
+    CHUNK_OVERLAP_TOKENS: int = Field(env="CHUNK_OVERLAP_TOKENS", default=0)
+    PDF_PAGES_PER_TASK: int = Field(env="PDF_PAGES_PER_TASK", default=8)
+    PDF_MAX_IN_FLIGHT_TASKS: int = Field(
+        env="PDF_MAX_IN_FLIGHT_TASKS", default=4)
 
     @property
     def is_local(self):
@@ -1,3 +1,6 @@
+import os
+import shutil
+
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
@@ -22,6 +25,9 @@ class GunicornSettings(BaseSettings):
     WORKERS: int = Field(env="NUMBER_OF_WORKER_LOCALS",
                          default_factory=calculate_workers)
     RELOAD: bool = Field(env="RELOAD", default=settings.is_local)
+    PRELOAD_APP: bool = Field(env="PRELOAD_APP", default=False)
+    PROMETHEUS_MULTIPROC_DIR: str = Field(
+        env="PROMETHEUS_MULTIPROC_DIR", default="/tmp/brag-prometheus")
 
     class Config:
         env_file = ".env.gunicorn"
@@ -33,3 +39,38 @@ workers = gunicorn_settings.WORKERS
 worker_class = "uvicorn.workers.UvicornWorker"
 timeout = gunicorn_settings.TIMEOUT
 reload = gunicorn_settings.RELOAD
+# The application and the embedding model are loaded once in the master and shared copy-on-write by the workers.
+preload_app = gunicorn_settings.PRELOAD_APP
+
+# Workers write their metrics to files in this directory, /metrics aggregates them. It has to be set before
+# prometheus_client is imported, by the master when it preloads the application, and emptied on start so that
+# metrics of a previous run are not reported.
+os.environ["PROMETHEUS_MULTIPROC_DIR"] = gunicorn_settings.PROMETHEUS_MULTIPROC_DIR
+shutil.rmtree(gunicorn_settings.PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+os.makedirs(gunicorn_settings.PROMETHEUS_MULTIPROC_DIR)
+
+
+def on_starting(server):
+    if not server.cfg.preload_app:
+        return
+    import time
+
+    from src.app.core.embeddings import preload_embedding_model
+    from src.app.core.process import process_memory
+    from src.app.scripts.chunking import get_encoding
+
+    started_at = time.perf_counter()
+    try:
+        preload_embedding_model()
+        get_encoding()
+    except Exception as e:
+        server.log.error(f"Embedding model could not be preloaded, the workers load their own: {e}")
+        return
+    server.log.info(f"Embedding model preloaded in {time.perf_counter() - started_at:.1f}s, "
+                    f"master memory: {process_memory()}")
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,4 @@
+import os
+
+# The settings require a database url when the application modules are imported, the tests never connect to it.
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unused")
@@ -0,0 +1,31 @@
+"""
+Peak memory of ingestion must not grow with the size of the ingested file.
+
+Every file is ingested in a fresh process through the production path, saved to disk by the upload
+endpoint's `save_upload`, extracted and chunked on a spawn process pool and manager queue, see
+`src.app.scripts.benchmarks.ingest_memory`. The tiktoken encoding must be available to that process.
+"""
+import os
+
+import pytest
+
+from src.app.scripts.benchmarks.ingest_memory import FORMATS, check_format
+
+# PDF extraction is far slower per megabyte than the other formats, its files are kept smaller.
+SIZES_MB = {
+    "txt": os.environ.get("INGEST_MEMORY_TEST_SIZES_MB", "2,16"),
+    "docx": os.environ.get("INGEST_MEMORY_TEST_SIZES_MB", "2,16"),
+    "pdf": os.environ.get("INGEST_MEMORY_TEST_PDF_SIZES_MB", "1,4"),
+}
+MAX_GROWTH_MB = float(os.environ.get("INGEST_MEMORY_TEST_MAX_GROWTH_MB", "32"))
+
+
+@pytest.mark.parametrize("file_format", FORMATS)
+def test_peak_memory_does_not_grow_with_the_file(file_format, tmp_path):
+    sizes = [int(size) for size in SIZES_MB[file_format].split(",")]
+    results, failures = check_format(str(tmp_path), file_format, sizes, "chunks", seed=0,
+                                     max_growth_mb=MAX_GROWTH_MB)
+
+    assert all(result["chunks"] for result in results)
+    assert results[-1]["chunks"] > results[0]["chunks"]
+    assert not failures, "; ".join(failures)